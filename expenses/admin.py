@@ -1,14 +1,38 @@
 from django.contrib import admin
-from .models import Expense, Category
+from .models import Expense, Category, ExchangeRate, ExpenseSummary
 # Register your models here.
 
 
 class ExpenseAdmin(admin.ModelAdmin):
-    list_display = ('amount', 'description', 'owner', 'category', 'date',)
-    search_fields = ('description', 'category', 'date',)
+    list_display = ('amount', 'currency', 'description', 'owner', 'category', 'date',)
+    search_fields = ('description', 'category__name', 'date',)
+    list_select_related = ('category',)
 
     list_per_page = 5
 
 
 admin.site.register(Expense, ExpenseAdmin)
-admin.site.register(Category)
\ No newline at end of file
+admin.site.register(Category)
+
+class ExpenseSummaryAdmin(admin.ModelAdmin):
+    list_display = ('owner', 'month', 'category', 'total', 'count',)
+    list_filter = ('month',)
+    list_select_related = ('owner', 'category')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+admin.site.register(ExpenseSummary, ExpenseSummaryAdmin)
+
+
+class ExchangeRateAdmin(admin.ModelAdmin):
+    list_display = ('currency', 'date', 'rate',)
+    list_filter = ('currency',)
+    date_hierarchy = 'date'
+
+
+admin.site.register(ExchangeRate, ExchangeRateAdmin)
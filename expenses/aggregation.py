@@ -0,0 +1,354 @@
+import datetime
+from decimal import Decimal
+
+from django.db import connections
+from django.db.models import (
+    Case, CharField, Count, DateField, F, IntegerField, Sum, Value, When,
+)
+from django.db.models.functions import (
+    TruncDay, TruncMonth, TruncQuarter, TruncWeek, TruncYear,
+)
+
+from .lookups import table
+from .money import as_number, from_units, quantize
+from .rates import convert_many
+
+
+def rate_date(date_field, currency_field, convert_to):
+    """The row's date when its currency needs converting, else NULL.
+
+    Grouping on this keeps rows already in ``convert_to`` in one group and
+    splits the others by day, so each group converts at a single rate.
+    """
+    return Case(
+        When(**{currency_field + '__in': [convert_to, ''], 'then': Value(None)}),
+        default=F(date_field), output_field=DateField(),
+    )
+
+
+def converted_rows(queryset, fields, date_field, currency_field, convert_to, **aggregates):
+    """Run the grouped query and return ``(rows, amounts)``.
+
+    ``rows`` are the ``values_list`` tuples of ``fields`` plus the
+    aggregates; ``amounts`` holds the first aggregate of each row, converted
+    into ``convert_to`` when that is given.
+    """
+    fields = list(fields)
+    if convert_to:
+        queryset = queryset.annotate(rate_date=rate_date(date_field, currency_field, convert_to))
+        fields += [currency_field, 'rate_date']
+    rows = list(queryset.order_by().values_list(*fields).annotate(**aggregates).order_by(*fields))
+    amount = len(fields)
+    amounts = [row[amount] or 0 for row in rows]
+    if convert_to:
+        amounts = convert_many(amounts, [row[amount - 2] for row in rows],
+                               [row[amount - 1] for row in rows], convert_to)
+    return rows, amounts
+
+
+def label_names(labels, keys):
+    """Map the primary keys in ``keys`` to the names of ``labels`` rows.
+
+    Names come from the cached lookup table; only rows it has not seen yet
+    (added in a transaction that is still open) are read from the database.
+    """
+    names = table(labels).names()
+    missing = [key for key in keys if key is not None and key not in names]
+    if missing:
+        names.update(labels.objects.filter(pk__in=missing).values_list('pk', 'name'))
+    return names
+
+
+def label_keys(values, names):
+    """Re-key ``values`` (a dict of primary key to list or number) by name.
+
+    Keys without a name (NULL) become ``''`` and rows sharing a name are
+    added together, so callers see the same keys as before grouping moved
+    to foreign keys.
+    """
+    result = {}
+    for key, value in values.items():
+        name = names.get(key, '')
+        if name not in result:
+            result[name] = value
+        elif isinstance(value, list):
+            result[name] = [a + b for a, b in zip(result[name], value)]
+        else:
+            result[name] += value
+    return dict(sorted(result.items()))
+
+
+def converted_total(queryset, convert_to, date_field='date', amount_field='amount',
+                    currency_field='currency'):
+    """Sum of ``amount_field`` over ``queryset`` converted into ``convert_to``."""
+    _, amounts = converted_rows(queryset, [], date_field, currency_field, convert_to,
+                                total=Sum(amount_field))
+    return quantize(sum(amounts, Decimal(0)), convert_to)
+
+
+def grouped_totals(queryset, group_by, start=None, end=None, date_field='date',
+                   amount_field='amount', count_field=None, labels=None, convert_to=None,
+                   currency_field='currency'):
+    """Sum ``amount_field`` per ``group_by`` value in a single query.
+
+    Works on any queryset with an amount and a date column, e.g. expenses,
+    income or the expense rollup table. ``start``/``end`` bound ``date_field``
+    inclusively. When the rows are themselves pre-aggregated, ``count_field``
+    names the column holding the per-row count so ``count`` stays exact.
+    When ``group_by`` is a foreign key, ``labels`` names its model and the
+    groups are keyed by name (see :func:`label_keys`). With ``convert_to``
+    every amount is converted from its row's currency at the rate of its
+    ``date_field`` (see :mod:`expenses.rates`).
+
+    Returns ``{'groups': {key: total}, 'counts': {key: count},
+    'total': ..., 'count': ...}`` with groups ordered by key. Sums are exact;
+    they are turned into plain numbers only at the end, for JSON.
+    """
+    if start is not None:
+        queryset = queryset.filter(**{date_field + '__gte': start})
+    if end is not None:
+        queryset = queryset.filter(**{date_field + '__lte': end})
+
+    count = Sum(count_field) if count_field else Count('pk')
+    rows, amounts = converted_rows(
+        queryset, [group_by], date_field, currency_field, convert_to,
+        group_total=Sum(amount_field), group_count=count,
+    )
+
+    groups = {}
+    counts = {}
+    for row, total in zip(rows, amounts):
+        key = row[0]
+        groups[key] = groups.get(key, 0) + total
+        counts[key] = counts.get(key, 0) + row[-1]
+    if convert_to:
+        groups = {key: quantize(total, convert_to) for key, total in groups.items()}
+    if labels is not None:
+        names = label_names(labels, groups)
+        groups = label_keys(groups, names)
+        counts = label_keys(counts, names)
+    return {
+        'groups': {key: as_number(total) for key, total in groups.items()},
+        'counts': counts,
+        'total': as_number(sum(groups.values())),
+        'count': sum(counts.values()),
+    }
+
+
+TRUNCATORS = {
+    'day': TruncDay,
+    'week': TruncWeek,
+    'month': TruncMonth,
+    'quarter': TruncQuarter,
+    'year': TruncYear,
+}
+
+MAX_BUCKETS = 1000
+
+
+def bucket_start(value, granularity):
+    """Truncate a date the same way the database does for ``granularity``."""
+    if granularity == 'week':
+        return value - datetime.timedelta(days=value.weekday())
+    if granularity == 'month':
+        return value.replace(day=1)
+    if granularity == 'quarter':
+        return value.replace(month=(value.month - 1) // 3 * 3 + 1, day=1)
+    if granularity == 'year':
+        return value.replace(month=1, day=1)
+    return value
+
+
+def next_bucket(value, granularity):
+    if granularity == 'day':
+        return value + datetime.timedelta(days=1)
+    if granularity == 'week':
+        return value + datetime.timedelta(weeks=1)
+    months = {'month': 1, 'quarter': 3, 'year': 12}[granularity]
+    month = value.month - 1 + months
+    return value.replace(year=value.year + month // 12, month=month % 12 + 1)
+
+
+def bucket_range(start, end, granularity):
+    """Every bucket start between ``start`` and ``end``, inclusive."""
+    buckets = []
+    current = bucket_start(start, granularity)
+    while current <= end:
+        buckets.append(current)
+        current = next_bucket(current, granularity)
+    return buckets
+
+
+def bucketed_totals(queryset, granularity, start, end, breakdown=None,
+                    date_field='date', amount_field='amount', labels=None, convert_to=None,
+                    currency_field='currency'):
+    """Sum ``amount_field`` per time bucket (and optionally per ``breakdown``).
+
+    Truncation and summing happen in one database query; buckets with no
+    rows are filled with zeros in Python. Returns ``{'periods': [...],
+    'totals': [...], 'series': {key: [...]}}`` with ``series`` only present
+    when a breakdown column is given; ``labels`` and ``convert_to`` work as
+    in :func:`grouped_totals`.
+    """
+    if granularity not in TRUNCATORS:
+        raise ValueError('Unknown granularity: %s' % granularity)
+    periods = bucket_range(start, end, granularity)
+    if len(periods) > MAX_BUCKETS:
+        raise ValueError('Too many %s buckets between %s and %s' % (granularity, start, end))
+
+    group_by = ['period'] + ([breakdown] if breakdown else [])
+    queryset = queryset.filter(**{
+        date_field + '__gte': start,
+        date_field + '__lte': end,
+    }).annotate(period=TRUNCATORS[granularity](date_field))
+    rows, amounts = converted_rows(queryset, group_by, date_field, currency_field, convert_to,
+                                   bucket_total=Sum(amount_field))
+
+    index = {period: i for i, period in enumerate(periods)}
+    totals = [0] * len(periods)
+    series = {}
+    for row, amount in zip(rows, amounts):
+        position = index[row[0]]
+        totals[position] += amount
+        if breakdown:
+            series.setdefault(row[1], [0] * len(periods))[position] += amount
+    if convert_to:
+        totals = [quantize(total, convert_to) for total in totals]
+        series = {key: [quantize(total, convert_to) for total in values]
+                  for key, values in series.items()}
+
+    result = {
+        'periods': [period.isoformat() for period in periods],
+        'totals': [as_number(total) for total in totals],
+    }
+    if breakdown:
+        if labels is not None:
+            series = label_keys(series, label_names(labels, series))
+        result['series'] = {key: [as_number(total) for total in values]
+                            for key, values in series.items()}
+    return result
+
+
+def as_date(value):
+    """A ``date`` from a raw SQL result, which may be a string or a datetime."""
+    if value is None or type(value) is datetime.date:
+        return value
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    return datetime.date.fromisoformat(str(value)[:10])
+
+
+def flow_rows(queryset, granularity, start, end, inflow, convert_to, date_field='date',
+              amount_field='amount', currency_field='currency'):
+    """One side of :func:`cash_flow`: rows of period, currency, rate date and amounts."""
+    if convert_to:
+        currency = F(currency_field)
+        when = rate_date(date_field, currency_field, convert_to)
+    else:
+        currency = Value('', output_field=CharField())
+        when = Value(None, output_field=DateField())
+    zero = Value(0, output_field=IntegerField())
+    return queryset.filter(**{
+        date_field + '__gte': start,
+        date_field + '__lte': end,
+    }).order_by().annotate(
+        period=TRUNCATORS[granularity](date_field),
+        flow_currency=currency,
+        rate_date=when,
+        inflow=F(amount_field) if inflow else zero,
+        outflow=zero if inflow else F(amount_field),
+    ).values_list('period', 'flow_currency', 'rate_date', 'inflow', 'outflow')
+
+
+def cash_flow(income, expenses, granularity, start, end, convert_to=None):
+    """Income, expenses, net and running balance per time bucket.
+
+    Both querysets are read in one statement: their rows are combined with
+    UNION ALL, summed per bucket and the running balance is taken with a
+    window function, so neither table is scanned twice. Rows are also
+    grouped by currency and, when they need converting, by day (see
+    :func:`rate_date`), which keeps one exchange rate per group: the
+    window's balance of each group converts exactly and the groups are
+    added up per bucket here. The balance starts at zero on ``start``.
+
+    Returns ``{'periods', 'income', 'expenses', 'net', 'balance'}`` lists.
+    """
+    if granularity not in TRUNCATORS:
+        raise ValueError('Unknown granularity: %s' % granularity)
+    periods = bucket_range(start, end, granularity)
+    if len(periods) > MAX_BUCKETS:
+        raise ValueError('Too many %s buckets between %s and %s' % (granularity, start, end))
+
+    income_sql, income_params = flow_rows(
+        income, granularity, start, end, True, convert_to).query.sql_with_params()
+    expense_sql, expense_params = flow_rows(
+        expenses, granularity, start, end, False, convert_to).query.sql_with_params()
+    sql = (
+        'SELECT period, flow_currency, rate_date, SUM(inflow), SUM(outflow), '
+        'SUM(SUM(inflow) - SUM(outflow)) OVER ('
+        'PARTITION BY flow_currency, rate_date ORDER BY period ROWS UNBOUNDED PRECEDING) '
+        'FROM (%s UNION ALL %s) flows '
+        'GROUP BY period, flow_currency, rate_date '
+        'ORDER BY period, flow_currency, rate_date' % (income_sql, expense_sql)
+    )
+    with connections[income.db].cursor() as cursor:
+        cursor.execute(sql, income_params + expense_params)
+        rows = cursor.fetchall()
+
+    # Integer units straight from SQL; one conversion pass over all three columns.
+    columns = [from_units(row[column] or 0) for column in (3, 4, 5) for row in rows]
+    if convert_to:
+        currencies = [row[1] for row in rows] * 3
+        dates = [as_date(row[2]) for row in rows] * 3
+        columns = convert_many(columns, currencies, dates, convert_to)
+    count = len(rows)
+    inflows, outflows, balances = columns[:count], columns[count:2 * count], columns[2 * count:]
+
+    index = {period: i for i, period in enumerate(periods)}
+    totals_in = [Decimal(0)] * len(periods)
+    totals_out = [Decimal(0)] * len(periods)
+    closing = [None] * len(periods)
+    group_balances = {}
+    balance = Decimal(0)
+    for row, inflow, outflow, group_balance in zip(rows, inflows, outflows, balances):
+        position = index[as_date(row[0])]
+        totals_in[position] += inflow
+        totals_out[position] += outflow
+        # A group's running balance replaces its previous one in the total.
+        group = (row[1], row[2])
+        balance += group_balance - group_balances.get(group, 0)
+        group_balances[group] = group_balance
+        closing[position] = balance
+
+    result = {'periods': [period.isoformat() for period in periods],
+              'income': [], 'expenses': [], 'net': [], 'balance': []}
+    balance = Decimal(0)
+    for position in range(len(periods)):
+        if closing[position] is not None:
+            balance = closing[position]
+        values = (totals_in[position], totals_out[position],
+                  totals_in[position] - totals_out[position], balance)
+        if convert_to:
+            values = [quantize(value, convert_to) for value in values]
+        for key, value in zip(('income', 'expenses', 'net', 'balance'), values):
+            result[key].append(as_number(value))
+    return result
+
+
+def timeseries_params(params, default_days=180):
+    """Read ``start``, ``end`` and ``granularity`` from a query dict.
+
+    Defaults to the last ``default_days`` days by month. Raises
+    ``ValueError`` for malformed dates or an unknown granularity.
+    """
+    end = params.get('end')
+    end = datetime.date.fromisoformat(end) if end else datetime.date.today()
+    start = params.get('start')
+    start = datetime.date.fromisoformat(start) if start else end - datetime.timedelta(days=default_days)
+    if start > end:
+        raise ValueError('start must not be after end')
+
+    granularity = params.get('granularity', 'month')
+    if granularity not in TRUNCATORS:
+        raise ValueError('granularity must be one of: %s' % ', '.join(TRUNCATORS))
+    return start, end, granularity
@@ -0,0 +1,100 @@
+"""Per-user cache of computed analytics responses.
+
+A response is stored in the ``analytics`` cache (see ``CACHES``) under a
+key built from the user, the endpoint, the query parameters, the user's
+data version, the lookup table and exchange-rate versions, the display
+currency and today's date. A write moves the data version, so stale
+entries are simply never asked for again: nothing scans or deletes keys,
+they age out through ``ANALYTICS_CACHE_TTL`` or the backend's own
+eviction. A repeated chart render costs one cache read.
+
+Each process counts hits and misses per endpoint; :func:`stats` reports
+them and responses carry an ``X-Analytics-Cache`` header.
+"""
+import datetime
+import functools
+import hashlib
+import json
+import threading
+from collections import Counter
+
+from django.core.cache import caches
+from django.http import HttpResponse
+
+from . import rates
+from .conditional import request_version
+from .lookups import lookup_versions
+
+CACHE_ALIAS = 'analytics'
+
+_lock = threading.Lock()
+_hits = Counter()
+_misses = Counter()
+
+
+def analytics_cache():
+    return caches[CACHE_ALIAS]
+
+
+def payload_key(request, endpoint):
+    raw = json.dumps([
+        request.user.pk, endpoint, sorted(request.GET.lists()), request_version(request)[0],
+        lookup_versions(), rates.version(), request.preferences.currency,
+        datetime.date.today().isoformat(),
+    ])
+    return '%s:%s' % (endpoint, hashlib.sha256(raw.encode()).hexdigest())
+
+
+def record(endpoint, hit):
+    with _lock:
+        (_hits if hit else _misses)[endpoint] += 1
+
+
+def stats():
+    """Hit and miss counts of this process, per endpoint and in total."""
+    with _lock:
+        endpoints = sorted(set(_hits) | set(_misses))
+        return {
+            'hits': sum(_hits.values()),
+            'misses': sum(_misses.values()),
+            'endpoints': {endpoint: {'hits': _hits[endpoint], 'misses': _misses[endpoint]}
+                          for endpoint in endpoints},
+        }
+
+
+def reset_stats():
+    with _lock:
+        _hits.clear()
+        _misses.clear()
+
+
+def cached_analytics(view):
+    """Serve a JSON view's successful GET responses from the analytics cache.
+
+    Goes inside ``login_required``. The response body is stored as is, so
+    a hit neither runs the view nor re-encodes the payload.
+    """
+    endpoint = view.__module__.split('.')[0] + '.' + view.__name__
+
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method != 'GET':
+            return view(request, *args, **kwargs)
+        cache = analytics_cache()
+        # Read the versions before the data so a concurrent write can only
+        # make the stored payload newer than its key, never older.
+        key = payload_key(request, endpoint)
+        content = cache.get(key)
+        if content is not None:
+            record(endpoint, True)
+            response = HttpResponse(content, content_type='application/json')
+            response['X-Analytics-Cache'] = 'hit'
+            return response
+
+        record(endpoint, False)
+        response = view(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, response.content)
+        response['X-Analytics-Cache'] = 'miss'
+        return response
+    return wrapper
@@ -0,0 +1,112 @@
+"""Disk cache of finished export files.
+
+An artifact is keyed on the user, the export kind and format, the filters,
+the user's data version, the category/source table versions (exports
+show their names), the user's display currency and the exchange-rate
+version (exports add a converted amount column). Any write bumps a version, so a key never
+needs invalidating: once the data changes the old files are simply not
+asked for again and age out. The directory is kept under
+``EXPORT_CACHE_MAX_BYTES`` by deleting the least recently used files.
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.http import FileResponse
+
+from . import rates
+from .lookups import lookup_versions
+from .money import user_currency
+from .versions import current_version
+
+
+def artifact_key(owner_id, kind, format, filters):
+    """Return the cache key for an export of ``filters`` at the current data version."""
+    raw = json.dumps([
+        owner_id, kind, format, sorted((key, str(value)) for key, value in filters.items()),
+        current_version(owner_id), lookup_versions(), user_currency(owner_id), rates.version(),
+    ])
+    return '%s.%s' % (hashlib.sha256(raw.encode()).hexdigest(), format)
+
+
+def artifact_path(key):
+    return os.path.join(settings.EXPORT_CACHE_ROOT, key)
+
+
+def cached_response(key, filename, content_type):
+    """Serve a cached artifact, or return ``None`` on a miss."""
+    path = artifact_path(key)
+    try:
+        artifact = open(path, 'rb')
+    except FileNotFoundError:
+        return None
+    # The modification time doubles as the last-used time for eviction.
+    os.utime(path)
+    return FileResponse(artifact, as_attachment=True, filename=filename,
+                        content_type=content_type)
+
+
+def _partial_file():
+    os.makedirs(settings.EXPORT_CACHE_ROOT, exist_ok=True)
+    fd, partial = tempfile.mkstemp(dir=settings.EXPORT_CACHE_ROOT, suffix='.part')
+    return os.fdopen(fd, 'wb'), partial
+
+
+def store_stream(key, chunks):
+    """Pass ``chunks`` through while saving them as the artifact for ``key``.
+
+    The file only becomes visible once the stream has been consumed to the
+    end; an interrupted download leaves nothing behind.
+    """
+    output, partial = _partial_file()
+    try:
+        with output:
+            for chunk in chunks:
+                output.write(chunk.encode() if isinstance(chunk, str) else chunk)
+                yield chunk
+        os.replace(partial, artifact_path(key))
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
+    evict()
+
+
+def store_file(key, source):
+    """Copy a finished export file into the cache."""
+    output, partial = _partial_file()
+    try:
+        with output, open(source, 'rb') as data:
+            shutil.copyfileobj(data, output)
+        os.replace(partial, artifact_path(key))
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
+    evict()
+
+
+def evict(max_bytes=None):
+    """Delete least recently used artifacts until the cache fits ``max_bytes``."""
+    if max_bytes is None:
+        max_bytes = settings.EXPORT_CACHE_MAX_BYTES
+    files = []
+    try:
+        for entry in os.scandir(settings.EXPORT_CACHE_ROOT):
+            if entry.is_file() and not entry.name.endswith('.part'):
+                stat = entry.stat()
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+    except FileNotFoundError:
+        return 0
+    files.sort(reverse=True)
+    used = removed = 0
+    for _, size, path in files:
+        used += size
+        if used > max_bytes:
+            try:
+                os.remove(path)
+                removed += 1
+            except FileNotFoundError:
+                pass
+    return removed
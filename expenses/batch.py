@@ -0,0 +1,240 @@
+"""Apply many expense/income creates, updates and deletes in one call.
+
+A batch is validated as a whole first; if any operation is invalid nothing
+is written. Otherwise each model gets at most one SELECT of its category
+or source table, one SELECT for the rows being updated or deleted, one
+``bulk_create``, one ``bulk_update`` and one DELETE, all inside a single
+transaction, so the query count does not grow with the size of the batch.
+The per-row signals are bypassed, so the monthly rollups, the data version
+and the change log are brought up to date here.
+"""
+import datetime
+from collections import defaultdict
+
+from django.db import connections, router, transaction
+from django.db.models import Q
+
+from userincome.models import UserIncome
+from userpreferences.currencies import catalog
+from .changes import record_changes
+from .imports import fingerprint
+from .models import Expense
+from .money import currency_code, parse_amount, user_currency
+from .summaries import apply_expense, month_start
+
+MAX_BATCH_OPERATIONS = 1000
+
+MODELS = {
+    'expense': (Expense, 'category'),
+    'income': (UserIncome, 'source'),
+}
+OPERATIONS = ('create', 'update', 'delete')
+
+
+class BatchError(ValueError):
+    """Raised with the list of per-operation errors when a batch is invalid."""
+
+    def __init__(self, errors):
+        super().__init__('Invalid batch')
+        self.errors = errors
+
+
+def clean_values(data, group_field, partial, currency=None):
+    """Validate the writable fields of one operation and return them typed."""
+    if not isinstance(data, dict):
+        raise ValueError('data must be an object')
+    unknown = set(data) - {'amount', 'currency', 'date', 'description', group_field}
+    if unknown:
+        raise ValueError('Unknown fields: %s' % ', '.join(sorted(unknown)))
+
+    values = {}
+    if 'currency' in data:
+        values['currency'] = str(data['currency'] or '').strip().upper()
+        if values['currency'] not in catalog().codes:
+            raise ValueError('Unknown currency: %s' % data['currency'])
+    elif not partial:
+        # bulk_create skips the signal that fills this in.
+        values['currency'] = currency_code(currency)
+    if 'amount' in data:
+        values['amount'] = parse_amount(data['amount'], values.get('currency') or currency)
+    if 'date' in data:
+        try:
+            values['date'] = datetime.date.fromisoformat(str(data['date']))
+        except ValueError:
+            raise ValueError('Date must be YYYY-MM-DD')
+    if 'description' in data:
+        values['description'] = str(data['description'] or '').strip()
+    if group_field in data:
+        # A category/source id, or its name as older clients send.
+        group = data[group_field]
+        if not (isinstance(group, int) and not isinstance(group, bool)):
+            group = str(group or '').strip()
+        values[group_field] = group
+
+    if not partial:
+        for field in ('amount', 'date', 'description', group_field):
+            if values.get(field) in (None, ''):
+                raise ValueError('%s is required' % field.capitalize())
+    elif not values:
+        raise ValueError('Nothing to update')
+    return values
+
+
+def parse_operations(operations, currency=None):
+    """Validate raw operations; raises :class:`BatchError` listing every problem."""
+    if not isinstance(operations, list) or not operations:
+        raise BatchError([{'index': None, 'error': 'operations must be a non-empty list'}])
+    if len(operations) > MAX_BATCH_OPERATIONS:
+        raise BatchError([{'index': None, 'error': 'At most %d operations per batch'
+                           % MAX_BATCH_OPERATIONS}])
+
+    parsed, errors, targets = [], [], set()
+    for index, operation in enumerate(operations):
+        try:
+            if not isinstance(operation, dict):
+                raise ValueError('Operation must be an object')
+            op, kind = operation.get('op'), operation.get('type')
+            if op not in OPERATIONS:
+                raise ValueError('op must be one of %s' % ', '.join(OPERATIONS))
+            if not isinstance(kind, str) or kind not in MODELS:
+                raise ValueError('type must be one of %s' % ', '.join(MODELS))
+            pk = None
+            if op != 'create':
+                pk = operation.get('id')
+                if not isinstance(pk, int) or isinstance(pk, bool):
+                    raise ValueError('id must be an integer')
+                if (kind, pk) in targets:
+                    raise ValueError('%s %d appears twice in the batch' % (kind, pk))
+                targets.add((kind, pk))
+            values = None
+            if op != 'delete':
+                values = clean_values(operation.get('data'), MODELS[kind][1], op == 'update',
+                                      currency)
+            parsed.append((index, op, kind, pk, values))
+        except ValueError as e:
+            errors.append({'index': index, 'error': str(e)})
+    if errors:
+        raise BatchError(errors)
+    return parsed
+
+
+def resolve_groups(parsed):
+    """Turn the category/source ids or names in ``parsed`` into ``*_id`` values.
+
+    Reads each lookup table once; raises :class:`BatchError` for unknown ones.
+    """
+    errors = []
+    for kind, (model, group_field) in MODELS.items():
+        related = model._meta.get_field(group_field).related_model
+        items = [item for item in parsed
+                 if item[2] == kind and item[4] and group_field in item[4]]
+        if not items:
+            continue
+        wanted = [item[4][group_field] for item in items]
+        rows = related.objects.filter(
+            Q(pk__in=[value for value in wanted if isinstance(value, int)])
+            | Q(name__in=[value for value in wanted if isinstance(value, str)])
+        ).order_by('-pk').values_list('pk', 'name')
+        found = {}
+        for pk, name in rows:
+            # Descending so the oldest row wins a shared name.
+            found[pk] = found[name] = pk
+        for index, _, _, _, values in items:
+            value = values.pop(group_field)
+            if value not in found:
+                errors.append({'index': index, 'error': 'Unknown %s: %s' % (group_field, value)})
+            else:
+                values[group_field + '_id'] = found[value]
+    if errors:
+        raise BatchError(errors)
+
+
+def delete_rows(model, pks):
+    """Delete ``model`` rows by primary key with one plain DELETE.
+
+    ``QuerySet.delete()`` would fetch the rows again and send a signal per row.
+    """
+    connection = connections[router.db_for_write(model)]
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute('DELETE FROM %s WHERE %s IN (%s)' % (
+            quote(model._meta.db_table), quote(model._meta.pk.column),
+            ', '.join(['%s'] * len(pks))), pks)
+
+
+def apply_batch(owner, operations):
+    """Validate and apply ``operations`` for ``owner``; return per-item results.
+
+    Raises :class:`BatchError` without writing anything if an operation is
+    invalid or names a row the owner does not have.
+    """
+    parsed = parse_operations(operations, user_currency(owner.pk))
+    resolve_groups(parsed)
+    results = [None] * len(parsed)
+    changes = []
+    buckets = defaultdict(lambda: [0, 0])
+
+    def track(expense, sign):
+        bucket = buckets[month_start(expense.date), expense.category_id, expense.currency]
+        bucket[0] += sign * expense.amount
+        bucket[1] += sign
+
+    with transaction.atomic():
+        for kind, (model, group_field) in MODELS.items():
+            items = [item for item in parsed if item[2] == kind]
+            ids = [pk for _, op, _, pk, _ in items if op != 'create']
+            rows = model.objects.filter(owner=owner).select_for_update().in_bulk(ids) if ids else {}
+            missing = [{'index': index, 'error': '%s %d does not exist' % (kind, pk)}
+                       for index, op, _, pk, _ in items if op != 'create' and pk not in rows]
+            if missing:
+                raise BatchError(missing)
+
+            created, updated, deleted = [], [], []
+            for index, op, _, pk, values in items:
+                if op == 'create':
+                    obj = model(owner=owner, **values)
+                    created.append((index, obj))
+                elif op == 'update':
+                    obj = rows[pk]
+                    if model is Expense:
+                        track(obj, -1)
+                    for field, value in values.items():
+                        setattr(obj, field, value)
+                    updated.append((index, obj))
+                else:
+                    obj = rows[pk]
+                    deleted.append((index, obj))
+                    results[index] = {'index': index, 'status': 'deleted', 'id': pk}
+
+            for _, obj in created + updated:
+                obj.fingerprint = fingerprint(obj.date, obj.amount, obj.currency, obj.description)
+                if model is Expense:
+                    track(obj, 1)
+            for _, obj in deleted:
+                if model is Expense:
+                    track(obj, -1)
+
+            if created:
+                model.objects.bulk_create([obj for _, obj in created])
+            if updated:
+                model.objects.bulk_update(
+                    [obj for _, obj in updated],
+                    ['amount', 'currency', 'date', 'description', group_field, 'fingerprint'],
+                )
+            if deleted:
+                delete_rows(model, [obj.pk for _, obj in deleted])
+
+            for index, obj in created:
+                results[index] = {'index': index, 'status': 'created', 'id': obj.pk}
+            for index, obj in updated:
+                results[index] = {'index': index, 'status': 'updated', 'id': obj.pk}
+            changes += [(kind, obj.pk, 'create') for _, obj in created]
+            changes += [(kind, obj.pk, 'update') for _, obj in updated]
+            changes += [(kind, obj.pk, 'delete') for _, obj in deleted]
+
+        for (month, category_id, currency), (total, count) in buckets.items():
+            if count or total:
+                apply_expense(owner.pk, month, category_id, currency, total, count)
+        record_changes(owner.pk, changes)
+
+    return results
@@ -0,0 +1,135 @@
+"""Per-user change log behind the delta sync API.
+
+Every expense or income write goes through :func:`record_changes`, which
+bumps the user's data version and logs one :class:`~expenses.models.ChangeLog`
+entry per row at that version. A client keeps the highest ``seq`` it has
+seen as its token and asks for :func:`changes_since` it.
+
+:func:`compact` keeps the log small without breaking tokens: an entry
+superseded by a later one for the same row is dropped (the client gets
+the later one anyway), and delete entries older than the retention period
+are dropped after raising the user's ``compacted_seq``. Only a client
+whose token is below that must resync; a fresh replica (token 0) never
+needs deletes.
+"""
+import datetime
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, Max, OuterRef
+from django.utils import timezone
+
+from userincome.models import UserIncome
+from .lookups import table
+from .models import ChangeLog, DataVersion, Expense
+from .versions import bump_version
+
+MAX_PAGE_SIZE = 1000
+
+KINDS = {
+    'expense': (Expense, 'category'),
+    'income': (UserIncome, 'source'),
+}
+
+
+class ExpiredToken(ValueError):
+    """The token predates compacted deletes; the client must resync."""
+
+
+def kind_of(model):
+    return 'expense' if model is Expense else 'income'
+
+
+def record_changes(owner_id, changes):
+    """Bump the user's version and log ``(kind, object_id, action)`` at it.
+
+    Returns the new sequence number.
+    """
+    with transaction.atomic():
+        seq = bump_version(owner_id)
+        ChangeLog.objects.bulk_create([
+            ChangeLog(owner_id=owner_id, seq=seq, kind=kind, object_id=object_id, action=action)
+            for kind, object_id, action in changes
+        ])
+    return seq
+
+
+def serialize(kind, row):
+    model, group_field = KINDS[kind]
+    group_id = row.pop(group_field + '_id')
+    group = table(model._meta.get_field(group_field).related_model).get(group_id)
+    row[group_field] = {'id': group_id, 'name': group.name} if group else None
+    return row
+
+
+def changes_since(owner_id, since, limit=500):
+    """The user's changes after sequence ``since``, oldest first.
+
+    Returns ``{'changes': [...], 'token': ..., 'has_more': ...}``. Each
+    change carries the row's current data, so creates and updates are both
+    upserts for the client; a row deleted since its entry was logged comes
+    back as a delete. Entries sharing a ``seq`` are never split across
+    pages. Raises :class:`ExpiredToken` when ``since`` is too old.
+    """
+    floor = DataVersion.objects.filter(owner_id=owner_id).values_list(
+        'compacted_seq', flat=True).first() or 0
+    if 0 < since < floor:
+        raise ExpiredToken('Token %d has expired; sync from 0' % since)
+
+    entries = ChangeLog.objects.filter(owner_id=owner_id, seq__gt=since).order_by('seq', 'id')
+    page = list(entries.values_list('seq', 'kind', 'object_id', 'action')[:limit + 1])
+    has_more = len(page) > limit
+    if has_more:
+        cut = page[limit][0]
+        page = [entry for entry in page if entry[0] != cut]
+        if not page:
+            # One write logged more rows than a page holds; send all of it.
+            page = list(entries.filter(seq=cut).values_list('seq', 'kind', 'object_id', 'action'))
+            has_more = entries.filter(seq__gt=cut).exists()
+
+    latest = {}
+    for entry in page:
+        latest[entry[1], entry[2]] = entry
+
+    rows = {}
+    for kind, (model, group_field) in KINDS.items():
+        ids = [object_id for (entry_kind, object_id), entry in latest.items()
+               if entry_kind == kind and entry[3] != ChangeLog.DELETE]
+        if ids:
+            found = model.objects.filter(owner_id=owner_id, pk__in=ids).values(
+                'id', 'amount', 'currency', 'date', 'description', group_field + '_id')
+            rows.update(((kind, row['id']), serialize(kind, row)) for row in found)
+
+    changes = []
+    for key, (seq, kind, object_id, action) in sorted(latest.items(), key=lambda item: item[1]):
+        data = rows.get(key)
+        if data is None:
+            action = ChangeLog.DELETE
+        changes.append({'seq': seq, 'type': kind, 'id': object_id, 'action': action, 'data': data})
+    return {
+        'changes': changes,
+        'token': page[-1][0] if page else since,
+        'has_more': has_more,
+    }
+
+
+def compact(retention_days=None, now=None):
+    """Drop superseded entries and expired deletes; returns how many went."""
+    if retention_days is None:
+        retention_days = settings.CHANGELOG_RETENTION_DAYS
+    cutoff = (now or timezone.now()) - datetime.timedelta(days=retention_days)
+    with transaction.atomic():
+        superseded = ChangeLog.objects.filter(Exists(ChangeLog.objects.filter(
+            owner_id=OuterRef('owner_id'), kind=OuterRef('kind'),
+            object_id=OuterRef('object_id'), seq__gt=OuterRef('seq'),
+        )))
+        removed = superseded.delete()[0]
+
+        expired = ChangeLog.objects.filter(action=ChangeLog.DELETE, created_at__lt=cutoff)
+        floors = expired.order_by().values('owner_id').annotate(seq=Max('seq'))
+        for floor in floors:
+            DataVersion.objects.filter(
+                owner_id=floor['owner_id'], compacted_seq__lt=floor['seq'],
+            ).update(compacted_seq=floor['seq'])
+        removed += expired.delete()[0]
+    return removed
@@ -0,0 +1,22 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+# Backends whose entries only the current process can see.
+PROCESS_LOCAL_CACHES = {
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+}
+
+
+@register(Tags.caches)
+def check_shared_cache(app_configs=None, **kwargs):
+    """The lookup and exchange-rate tables are only refreshed through the default cache."""
+    if settings.DEBUG or settings.CACHES['default']['BACKEND'] not in PROCESS_LOCAL_CACHES:
+        return []
+    return [Warning(
+        'The default cache is not shared between processes, so category, source and '
+        'exchange-rate changes made in one worker never reach the others.',
+        hint='Set CACHE_BACKEND and CACHE_LOCATION to a shared backend (memcached, Redis, '
+             'the database or a file cache) when running more than one worker process.',
+        id='expenses.W001',
+    )]
@@ -0,0 +1,85 @@
+"""Conditional GET for pages and summaries built only from the user's data.
+
+The ETag combines everything such a response is derived from: the user's
+data version (bumped by every expense or income write), the category and
+source table versions, the display currency, the exchange-rate version
+and today's date (summaries cover a window ending today). A request whose
+``If-None-Match`` matches gets a 304 after a single read of the version
+row, before the view runs any aggregation.
+
+``Last-Modified`` is the time of the user's last write. It does not move
+when a preference or lookup name changes, so the ETag is the validator to
+rely on; browsers send both and Django then checks only the ETag.
+
+HTML pages (:func:`conditional_page`) also depend on the session: their
+forms carry the CSRF token, which login rotates, and they show flash
+messages. Their ETag adds the CSRF secret, they send no Last-Modified, and
+a request with messages waiting always gets the full page.
+"""
+import datetime
+import functools
+import hashlib
+import json
+
+from django.contrib import messages
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+
+from . import rates
+from .lookups import lookup_versions
+from .models import DataVersion
+
+
+def request_version(request):
+    """The signed-in user's ``(version, updated_at)``, read once per request."""
+    if not hasattr(request, '_data_version'):
+        request._data_version = DataVersion.objects.filter(owner_id=request.user.pk).values_list(
+            'version', 'updated_at').first() or (0, None)
+    return request._data_version
+
+
+def data_etag(request, *args, **kwargs):
+    raw = json.dumps([
+        request.user.pk, request_version(request)[0], lookup_versions(),
+        request.preferences.currency, rates.version(), datetime.date.today().isoformat(),
+    ])
+    return hashlib.sha256(raw.encode()).hexdigest()[:32]
+
+
+def page_etag(request, *args, **kwargs):
+    raw = data_etag(request) + (request.META.get('CSRF_COOKIE') or '')
+    return hashlib.sha256(raw.encode()).hexdigest()[:32]
+
+
+def data_last_modified(request, *args, **kwargs):
+    return request_version(request)[1]
+
+
+def revalidated(view, conditional_view, bypass=None):
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if bypass and bypass(request):
+            response = view(request, *args, **kwargs)
+        else:
+            response = conditional_view(request, *args, **kwargs)
+        if request.method in ('GET', 'HEAD'):
+            patch_cache_control(response, private=True, no_cache=True)
+        return response
+    return wrapper
+
+
+def conditional_on_data(view):
+    """Answer GET/HEAD with a 304 when the user's data has not changed.
+
+    Goes inside ``login_required``. Responses are marked private and must
+    be revalidated, so browsers ask every time but rarely download again.
+    """
+    return revalidated(view, condition(
+        etag_func=data_etag, last_modified_func=data_last_modified)(view))
+
+
+def conditional_page(view):
+    """:func:`conditional_on_data` for HTML pages rendered with the session."""
+    # len() does not mark the messages as read.
+    return revalidated(view, condition(etag_func=page_etag)(view),
+                       bypass=lambda request: len(messages.get_messages(request)) > 0)
@@ -0,0 +1,95 @@
+"""The financial analysis dashboard payload.
+
+Everything the page shows (expenses per category and per month, the top
+categories and the income totals) comes from one UNION ALL query over the
+expense rollups and the income rows, grouped by month and category or
+source. The view caches the finished payload (see :mod:`expenses.analytics`).
+"""
+import datetime
+from decimal import Decimal
+
+from django.db.models import CharField, DateField, F, Sum, Value
+from django.db.models.functions import TruncMonth
+
+from userincome.models import Source, UserIncome
+from . import rates
+from .aggregation import as_date, bucket_range, label_keys, label_names, rate_date
+from .models import Category, ExpenseSummary
+from .money import as_number, quantize
+from .summaries import month_start
+
+TOP_CATEGORIES = 5
+
+
+def flows(queryset, kind, month, group_field, date_field, amount_field, convert_to):
+    """Per month/group/currency totals of one side of the dashboard query."""
+    if convert_to:
+        currency = F('currency')
+        when = rate_date(date_field, 'currency', convert_to)
+    else:
+        currency = Value('', output_field=CharField())
+        when = Value(None, output_field=DateField())
+    return queryset.order_by().annotate(
+        kind=Value(kind, output_field=CharField()),
+        period=month,
+        group_id=F(group_field),
+        flow_currency=currency,
+        rate_date=when,
+    ).values_list('kind', 'period', 'group_id', 'flow_currency', 'rate_date').annotate(
+        flow_total=Sum(amount_field))
+
+
+def dashboard_data(owner_id, convert_to=None, today=None):
+    """Build the dashboard payload for the six months up to ``today``."""
+    today = today or datetime.date.today()
+    start = month_start(today - datetime.timedelta(days=180))
+    months = bucket_range(start, today, 'month')
+
+    expenses = flows(
+        ExpenseSummary.objects.filter(owner_id=owner_id, month__gte=start, month__lte=today),
+        'expense', F('month'), 'category', 'month', 'total', convert_to)
+    income = flows(
+        UserIncome.objects.filter(owner_id=owner_id, date__gte=start, date__lte=today),
+        'income', TruncMonth('date'), 'source', 'date', 'amount', convert_to)
+    rows = list(expenses.union(income, all=True))
+
+    amounts = [row[5] or 0 for row in rows]
+    if convert_to:
+        amounts = rates.convert_many(amounts, [row[3] for row in rows],
+                                     [as_date(row[4]) for row in rows], convert_to)
+
+    index = {month: i for i, month in enumerate(months)}
+    monthly = {'expense': [Decimal(0)] * len(months), 'income': [Decimal(0)] * len(months)}
+    groups = {'expense': {}, 'income': {}}
+    for (kind, period, group_id, _, _, _), amount in zip(rows, amounts):
+        monthly[kind][index[month_start(period)]] += amount
+        groups[kind][group_id] = groups[kind].get(group_id, 0) + amount
+
+    def finish(value):
+        return as_number(quantize(value, convert_to) if convert_to else value)
+
+    def by_name(totals, labels):
+        named = label_keys(totals, label_names(labels, totals))
+        return {name: finish(total) for name, total in named.items()}
+
+    categories = by_name(groups['expense'], Category)
+    expense_total = sum(groups['expense'].values(), Decimal(0))
+    income_total = sum(groups['income'].values(), Decimal(0))
+    top = sorted(categories.items(), key=lambda item: (-item[1], item[0]))[:TOP_CATEGORIES]
+    return {
+        'currency': convert_to,
+        'months': [month.strftime('%Y-%m') for month in months],
+        'expenses': {
+            'total': finish(expense_total),
+            'monthly': [finish(total) for total in monthly['expense']],
+            'categories': categories,
+            'top_categories': [{'name': name, 'total': total} for name, total in top],
+        },
+        'income': {
+            'total': finish(income_total),
+            'monthly': [finish(total) for total in monthly['income']],
+            'sources': by_name(groups['income'], Source),
+        },
+        'net': finish(income_total - expense_total),
+    }
+
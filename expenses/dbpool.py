@@ -0,0 +1,48 @@
+"""Statistics of the database connection pool (see ``DB_POOL``).
+
+The pool lives in each server process, so the numbers describe the worker
+that answers. Counters accumulate from the pool's start; times are in
+milliseconds.
+"""
+from django.db import connections
+
+
+def pool_of(alias='default'):
+    """The psycopg pool behind ``alias``, or ``None`` when it is not pooled."""
+    return getattr(connections[alias], 'pool', None)
+
+
+def pool_stats(alias='default'):
+    """Size, usage and wait statistics of the pool, or ``None`` without one."""
+    pool = pool_of(alias)
+    if pool is None:
+        return None
+    stats = pool.get_stats()
+    if pool.closed:
+        # Not opened by a request yet; the size counter starts at min_size.
+        stats['pool_size'] = stats['pool_available'] = 0
+    return summarize(stats)
+
+
+def summarize(stats):
+    """Name the counters of ``ConnectionPool.get_stats()`` and add the average wait."""
+    requests = stats.get('requests_num', 0)
+    wait_ms = stats.get('requests_wait_ms', 0)
+    return {
+        'min_size': stats.get('pool_min', 0),
+        'max_size': stats.get('pool_max', 0),
+        'size': stats.get('pool_size', 0),
+        'in_use': stats.get('pool_size', 0) - stats.get('pool_available', 0),
+        'available': stats.get('pool_available', 0),
+        'waiting': stats.get('requests_waiting', 0),
+        'requests': requests,
+        'queued': stats.get('requests_queued', 0),
+        'wait_ms': wait_ms,
+        'avg_wait_ms': round(wait_ms / requests, 3) if requests else 0,
+        'request_errors': stats.get('requests_errors', 0),
+        'connections': stats.get('connections_num', 0),
+        'connect_ms': stats.get('connections_ms', 0),
+        'connection_errors': stats.get('connections_errors', 0),
+        'connections_lost': stats.get('connections_lost', 0),
+        'returns_bad': stats.get('returns_bad', 0),
+    }
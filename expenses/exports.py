@@ -0,0 +1,98 @@
+import csv
+import datetime
+
+from django.http import StreamingHttpResponse
+
+from . import artifacts, xlsx
+from .rates import check_currencies, with_converted
+
+EXPORT_CHUNK_SIZE = 2000
+
+
+class Echo:
+    """File-like object whose ``write`` just returns the value, for csv.writer."""
+
+    def write(self, value):
+        return value
+
+
+def export_filters(params, group_field):
+    """Build queryset filters from ``start``, ``end`` and ``group_field`` params.
+
+    ``group_field`` is a foreign key; its param holds the category or
+    source name. Raises ``ValueError`` for malformed dates and for values
+    that are not strings (a JSON request can send any type).
+    """
+    for key in ('start', 'end', group_field):
+        if params.get(key) and not isinstance(params[key], str):
+            raise ValueError('%s must be a string' % key)
+    filters = {}
+    if params.get('start'):
+        filters['date__gte'] = datetime.date.fromisoformat(params['start'])
+    if params.get('end'):
+        filters['date__lte'] = datetime.date.fromisoformat(params['end'])
+    if params.get(group_field):
+        filters[group_field + '__name'] = params[group_field]
+    return filters
+
+
+def check_convertible(queryset, convert_to):
+    """Raise ``MissingRate`` if some row of ``queryset`` cannot be converted."""
+    check_currencies(queryset.order_by().values_list('currency', flat=True).distinct(),
+                     convert_to)
+
+
+def export_rows(queryset, fields, header, chunk_size, convert_to):
+    """Return the header and a chunked iterator of row tuples.
+
+    With ``convert_to`` (which needs ``amount``, ``currency`` and ``date``
+    among ``fields``) each row gains the amount in that currency, converted
+    a chunk at a time.
+    """
+    rows = queryset.values_list(*fields).iterator(chunk_size=chunk_size)
+    if convert_to:
+        header = list(header) + ['Amount (%s)' % convert_to]
+        rows = with_converted(rows, fields.index('amount'), fields.index('currency'),
+                              fields.index('date'), convert_to, chunk_size)
+    return header, rows
+
+
+def csv_rows(queryset, fields, header, chunk_size=EXPORT_CHUNK_SIZE, convert_to=None):
+    """Yield CSV lines for ``queryset`` followed by a row count line.
+
+    Rows are read as tuples through a chunked iterator, so memory use
+    stays flat however many rows are exported.
+    """
+    header, rows = export_rows(queryset, fields, header, chunk_size, convert_to)
+    writer = csv.writer(Echo())
+    yield writer.writerow(header)
+    count = 0
+    for row in rows:
+        count += 1
+        yield writer.writerow(row)
+    yield writer.writerow(['Rows exported', count])
+
+
+def streaming_csv_response(queryset, fields, header, filename, cache_key=None, convert_to=None):
+    """Stream a CSV download, saving it as the artifact ``cache_key`` if given."""
+    content = csv_rows(queryset, fields, header, convert_to=convert_to)
+    if cache_key:
+        content = artifacts.store_stream(cache_key, content)
+    response = StreamingHttpResponse(content, content_type='text/csv')
+    response['Content-Disposition'] = 'attachment; filename=' + filename
+    return response
+
+
+def xlsx_sheet(title, queryset, fields, header, chunk_size=EXPORT_CHUNK_SIZE, convert_to=None):
+    """Describe one worksheet for :func:`streaming_xlsx_response`."""
+    header, rows = export_rows(queryset, fields, header, chunk_size, convert_to)
+    return title, header, rows
+
+
+def streaming_xlsx_response(sheets, filename, cache_key=None):
+    content = xlsx.stream_workbook(sheets)
+    if cache_key:
+        content = artifacts.store_stream(cache_key, content)
+    response = StreamingHttpResponse(content, content_type=xlsx.CONTENT_TYPE)
+    response['Content-Disposition'] = 'attachment; filename=' + filename
+    return response
@@ -0,0 +1,320 @@
+"""Bank statement import.
+
+Statements are parsed as a stream of ``(line, date, amount, description)``
+rows: debits become expenses and credits income. Rows are inserted with
+``bulk_create`` in fixed-size batches inside one transaction, and a row is
+skipped when the user already has it, judged by a hash of its date, amount,
+currency and description. A statement that repeats a transaction (two identical
+coffees on one day) keeps both as long as the database has fewer copies
+than the file, so importing the same file twice adds nothing.
+"""
+import csv
+import datetime
+import hashlib
+import io
+import os
+import re
+import unicodedata
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count
+
+from userincome.models import Source, UserIncome
+from .changes import record_changes
+from .models import Category, Expense
+from .money import MAX_AMOUNT, MONEY_DECIMAL_PLACES, currency_code, quantize, user_currency
+from .summaries import apply_expense, month_start
+
+IMPORT_BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 50
+FORMATS = ('csv', 'ofx', 'qif')
+
+DATE_FORMATS = ('%Y-%m-%d', '%d/%m/%Y', '%m/%d/%Y', '%d.%m.%Y', '%Y%m%d', '%d-%m-%Y')
+DATE_COLUMNS = ('date', 'transaction date', 'posted date', 'posting date', 'value date')
+AMOUNT_COLUMNS = ('amount', 'value', 'transaction amount')
+DEBIT_COLUMNS = ('debit', 'withdrawal', 'paid out', 'money out')
+CREDIT_COLUMNS = ('credit', 'deposit', 'paid in', 'money in')
+DESCRIPTION_COLUMNS = ('description', 'payee', 'name', 'memo', 'narrative', 'details', 'reference')
+
+OFX_TAG_RE = re.compile(r'<(/?)(\w+)>([^<]*)')
+AMOUNT_RE = re.compile(r'^[+-]?(?:\d+(?:\.\d*)?|\.\d+)$')
+QIF_DATE_RE = re.compile(r"^(\d{1,2})/\s*(\d{1,2})(?:/|')\s*(\d{2,4})$")
+
+
+class StatementError(ValueError):
+    """A statement row that cannot be read."""
+
+
+def fingerprint(date, amount, currency, description):
+    """Hash identifying a transaction by its date, amount, currency and description."""
+    if isinstance(date, datetime.datetime):
+        date = date.date()
+    date = str(date)[:10]
+    # At the storage scale, so amounts finer than cents stay distinct.
+    amount = Decimal(str(amount)).quantize(Decimal(1).scaleb(-MONEY_DECIMAL_PLACES))
+    description = ' '.join(str(description or '').lower().split())
+    return hashlib.sha256(
+        ('%s|%s|%s|%s' % (date, amount, currency_code(currency), description)).encode()
+    ).hexdigest()
+
+
+def parse_amount(value):
+    """A statement amount like ``-1,234.50``, ``(12.00)`` or ``$5``.
+
+    Currency symbols are dropped; any other stray character, a letter or an
+    exponent makes the amount invalid rather than being stripped out.
+    """
+    text = str(value).strip().replace(',', '').replace(' ', '')
+    negative = text.startswith('(') and text.endswith(')')
+    if negative:
+        text = text[1:-1]
+    text = ''.join(char for char in text if unicodedata.category(char) != 'Sc')
+    if not AMOUNT_RE.match(text):
+        raise StatementError('Invalid amount: %r' % value)
+    amount = Decimal(text)
+    if abs(amount) > MAX_AMOUNT:
+        raise StatementError('Amount is too large: %r' % value)
+    return -amount if negative else amount
+
+
+def parse_date(value, formats=DATE_FORMATS):
+    value = value.strip()
+    for format in formats:
+        try:
+            return datetime.datetime.strptime(value, format).date()
+        except ValueError:
+            continue
+    raise StatementError('Invalid date: %r' % value)
+
+
+def _column(fieldnames, candidates):
+    lowered = {name.strip().lower(): name for name in fieldnames if name}
+    for candidate in candidates:
+        if candidate in lowered:
+            return lowered[candidate]
+    return None
+
+
+def parse_csv(lines):
+    """Rows of a CSV export with a header naming date, amount and description."""
+    reader = csv.DictReader(lines)
+    fieldnames = reader.fieldnames or []
+    date_column = _column(fieldnames, DATE_COLUMNS)
+    amount_column = _column(fieldnames, AMOUNT_COLUMNS)
+    debit_column = _column(fieldnames, DEBIT_COLUMNS)
+    credit_column = _column(fieldnames, CREDIT_COLUMNS)
+    description_column = _column(fieldnames, DESCRIPTION_COLUMNS)
+    if not date_column or not (amount_column or debit_column or credit_column):
+        raise StatementError('CSV header must name a date and an amount column')
+
+    for row in reader:
+        line = reader.line_num
+        try:
+            if amount_column:
+                amount = parse_amount(row[amount_column])
+            else:
+                debit = (row.get(debit_column) or '').strip() if debit_column else ''
+                credit = (row.get(credit_column) or '').strip() if credit_column else ''
+                amount = parse_amount(credit) if credit else -abs(parse_amount(debit or '0'))
+            date = parse_date(row[date_column] or '')
+        except StatementError as e:
+            yield line, e, None, None
+            continue
+        description = (row.get(description_column) or '') if description_column else ''
+        yield line, date, amount, description.strip()
+
+
+def parse_ofx(lines):
+    """Rows of the ``<STMTTRN>`` blocks in an OFX/QFX file (SGML or XML)."""
+    record = None
+    for line_number, text in enumerate(lines, 1):
+        for closing, tag, value in OFX_TAG_RE.findall(text):
+            tag = tag.upper()
+            value = value.strip()
+            if tag == 'STMTTRN':
+                if closing and record is not None:
+                    yield _ofx_row(record)
+                    record = None
+                elif not closing:
+                    record = {'line': line_number}
+            elif record is not None and not closing and value:
+                record[tag] = value
+
+
+def _ofx_row(record):
+    line = record['line']
+    try:
+        # DTPOSTED is YYYYMMDD optionally followed by a time and zone.
+        date = parse_date(record.get('DTPOSTED', '')[:8], ('%Y%m%d',))
+        amount = parse_amount(record.get('TRNAMT', ''))
+    except StatementError as e:
+        return line, e, None, None
+    description = record.get('NAME') or record.get('PAYEE') or ''
+    memo = record.get('MEMO')
+    if memo and memo != description:
+        description = ('%s %s' % (description, memo)).strip()
+    return line, date, amount, description
+
+
+def _qif_date(value):
+    match = QIF_DATE_RE.match(value.strip())
+    if not match:
+        return parse_date(value)
+    month, day, year = (int(part) for part in match.groups())
+    if year < 100:
+        year += 2000 if "'" in value or year < 70 else 1900
+    try:
+        return datetime.date(year, month, day)
+    except ValueError:
+        raise StatementError('Invalid date: %r' % value)
+
+
+def parse_qif(lines):
+    """Rows of a QIF file: ``D`` date, ``T``/``U`` amount, ``P`` payee, ``M`` memo."""
+    record, start = {}, None
+    for line_number, text in enumerate(lines, 1):
+        text = text.rstrip('\r\n')
+        if not text or text.startswith('!'):
+            continue
+        if text.startswith('^'):
+            if record:
+                try:
+                    date = _qif_date(record.get('D', ''))
+                    amount = parse_amount(record.get('T') or record.get('U', ''))
+                except StatementError as e:
+                    yield start, e, None, None
+                else:
+                    description = record.get('P', '')
+                    if record.get('M') and record.get('M') != description:
+                        description = ('%s %s' % (description, record['M'])).strip()
+                    yield start, date, amount, description
+            record, start = {}, None
+            continue
+        if start is None:
+            start = line_number
+        record.setdefault(text[0], text[1:].strip())
+
+
+PARSERS = {'csv': parse_csv, 'ofx': parse_ofx, 'qif': parse_qif}
+
+
+def detect_format(filename):
+    extension = os.path.splitext(filename or '')[1].lower().lstrip('.')
+    if extension == 'qfx':
+        return 'ofx'
+    return extension if extension in FORMATS else None
+
+
+def text_lines(binary):
+    """Decode an uploaded or opened binary file lazily, line by line."""
+    return io.TextIOWrapper(binary, encoding='utf-8-sig', errors='replace', newline='')
+
+
+def named(model, name):
+    """The oldest ``model`` row called ``name``, created if there is none."""
+    return model.objects.filter(name=name).order_by('pk').first() or model.objects.create(name=name)
+
+
+class _Batch:
+    """Rows of one model waiting for a deduplicated ``bulk_create``."""
+
+    def __init__(self, model, owner_id):
+        self.model = model
+        self.owner_id = owner_id
+        self.rows = []
+        self.seen = defaultdict(int)
+        self.existing = {}
+
+    def flush(self):
+        if not self.rows:
+            return []
+        unknown = {obj.fingerprint for obj in self.rows} - self.existing.keys()
+        counts = self.model.objects.filter(
+            owner_id=self.owner_id, fingerprint__in=unknown
+        ).values_list('fingerprint').annotate(n=Count('id')).order_by()
+        self.existing.update(dict.fromkeys(unknown, 0))
+        self.existing.update(counts)
+
+        new = []
+        for obj in self.rows:
+            self.seen[obj.fingerprint] += 1
+            if self.seen[obj.fingerprint] > self.existing[obj.fingerprint]:
+                new.append(obj)
+        self.model.objects.bulk_create(new)
+        self.rows = []
+        return new
+
+
+def import_statement(owner, lines, format, category='Imported', source='Imported',
+                     batch_size=IMPORT_BATCH_SIZE):
+    """Import a statement for ``owner`` and return a report dict.
+
+    ``lines`` is any iterable of text lines (see :func:`text_lines`).
+    Everything is written in one transaction; rows that cannot be parsed
+    are reported and skipped.
+    """
+    if format not in PARSERS:
+        raise StatementError('Unsupported statement format: %s' % format)
+
+    report = {'format': format, 'rows': 0, 'expenses': 0, 'income': 0,
+              'duplicates': 0, 'errors': [], 'error_count': 0}
+    expenses = _Batch(Expense, owner.pk)
+    income = _Batch(UserIncome, owner.pk)
+    buckets = defaultdict(lambda: [0, 0])
+    changes = []
+    currency = user_currency(owner.pk)
+    # Looked up on first use so an import without income adds no source.
+    groups = {}
+
+    def flush(batch):
+        created = batch.flush()
+        changes.extend(('expense' if batch is expenses else 'income', obj.pk, 'create')
+                       for obj in created)
+        if batch is expenses:
+            report['expenses'] += len(created)
+            for expense in created:
+                bucket = buckets[month_start(expense.date), expense.category_id, expense.currency]
+                bucket[0] += expense.amount
+                bucket[1] += 1
+        else:
+            report['income'] += len(created)
+
+    with transaction.atomic():
+        for line, date, amount, description in PARSERS[format](lines):
+            if isinstance(date, StatementError):
+                report['error_count'] += 1
+                if len(report['errors']) < MAX_REPORTED_ERRORS:
+                    report['errors'].append({'line': line, 'error': str(date)})
+                continue
+            amount = quantize(amount, currency)
+            if amount == 0:
+                continue
+            report['rows'] += 1
+            values = {'owner_id': owner.pk, 'date': date, 'amount': abs(amount),
+                      'currency': currency, 'description': description,
+                      'fingerprint': fingerprint(date, abs(amount), currency, description)}
+            if amount < 0:
+                if Category not in groups:
+                    groups[Category] = named(Category, category).pk
+                expenses.rows.append(Expense(category_id=groups[Category], **values))
+                batch = expenses
+            else:
+                if Source not in groups:
+                    groups[Source] = named(Source, source).pk
+                income.rows.append(UserIncome(source_id=groups[Source], **values))
+                batch = income
+            if len(batch.rows) >= batch_size:
+                flush(batch)
+        flush(expenses)
+        flush(income)
+
+        # bulk_create skips the signals that keep these up to date.
+        for (month, category_id, bucket_currency), (total, count) in buckets.items():
+            apply_expense(owner.pk, month, category_id, bucket_currency, total, count)
+        if changes:
+            record_changes(owner.pk, changes)
+
+    report['duplicates'] = report['rows'] - report['expenses'] - report['income']
+    return report
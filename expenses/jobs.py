@@ -0,0 +1,182 @@
+import datetime
+import logging
+import os
+
+from django.conf import settings
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from userincome.models import UserIncome
+from userpreferences.preferences import preferences_for
+from . import xlsx
+from .aggregation import converted_total
+from .artifacts import artifact_key, store_file
+from .exports import csv_rows, export_filters, xlsx_sheet
+from .models import Expense, ExportJob
+from .money import currency_code
+
+logger = logging.getLogger(__name__)
+
+EXPORTS = {
+    'expenses': {
+        'model': Expense,
+        'title': 'Expenses',
+        'group_field': 'category',
+        'fields': ('amount', 'currency', 'description', 'category__name', 'date'),
+        'header': ['Amount', 'Currency', 'Description', 'Category', 'Date'],
+        'template': 'expenses/pdf-output.html',
+        'context_name': 'expenses',
+    },
+    'income': {
+        'model': UserIncome,
+        'title': 'Income',
+        'group_field': 'source',
+        'fields': ('amount', 'currency', 'description', 'source__name', 'date'),
+        'header': ['Amount', 'Currency', 'Description', 'Source', 'Date'],
+        'template': 'income/pdf-output.html',
+        'context_name': 'income',
+    },
+}
+
+CONTENT_TYPES = {
+    'pdf': 'application/pdf',
+    'csv': 'text/csv',
+    'xlsx': xlsx.CONTENT_TYPE,
+}
+
+
+def export_queryset(job):
+    spec = EXPORTS[job.kind]
+    filters = export_filters(job.params, spec['group_field'])
+    return spec['model'].objects.filter(owner_id=job.owner_id, **filters).select_related(
+        spec['group_field'])
+
+
+def submit_export(owner, kind, format, params):
+    """Queue an export; ``params`` holds the start/end/category filters."""
+    spec = EXPORTS[kind]
+    # Validate now so a bad date fails the request, not the job.
+    export_filters(params, spec['group_field'])
+    keep = ('start', 'end', spec['group_field'])
+    return ExportJob.objects.create(
+        owner=owner, kind=kind, format=format,
+        params={key: params[key] for key in keep if params.get(key)},
+    )
+
+
+def download_name(job):
+    return '%s%s.%s' % (EXPORTS[job.kind]['title'], job.created_at.strftime('%Y-%m-%d %H%M%S'), job.format)
+
+
+def write_pdf(job, queryset, path):
+    # WeasyPrint pulls in native libraries, so only the worker imports it.
+    from weasyprint import HTML
+
+    spec = EXPORTS[job.kind]
+    currency = preferences_for(job.owner_id).currency
+    html_string = render_to_string(spec['template'], {
+        spec['context_name']: queryset,
+        'total': converted_total(queryset, currency_code(currency)),
+        'currency': currency,
+        'currency_code': currency_code(currency),
+    })
+    HTML(string=html_string).write_pdf(target=path)
+
+
+def write_export(job, path):
+    spec = EXPORTS[job.kind]
+    queryset = export_queryset(job)
+    currency = currency_code(preferences_for(job.owner_id).currency)
+    if job.format == 'pdf':
+        write_pdf(job, queryset, path)
+    elif job.format == 'csv':
+        with open(path, 'w', newline='', encoding='utf-8') as output:
+            for line in csv_rows(queryset, spec['fields'], spec['header'],
+                                 convert_to=currency):
+                output.write(line)
+    elif job.format == 'xlsx':
+        with open(path, 'wb') as output:
+            sheet = xlsx_sheet(spec['title'], queryset, spec['fields'], spec['header'],
+                               convert_to=currency)
+            for chunk in xlsx.stream_workbook([sheet]):
+                output.write(chunk)
+    else:
+        raise ValueError('Unknown export format: %s' % job.format)
+
+
+def claim_next_job():
+    """Atomically move the oldest queued job to running and return it.
+
+    The conditional UPDATE makes this safe with several workers on any
+    database: only one of them sees its update affect a row.
+    """
+    while True:
+        job = ExportJob.objects.filter(status=ExportJob.QUEUED).order_by('created_at').first()
+        if job is None:
+            return None
+        claimed = ExportJob.objects.filter(pk=job.pk, status=ExportJob.QUEUED).update(
+            status=ExportJob.RUNNING, started_at=timezone.now()
+        )
+        if claimed:
+            job.status = ExportJob.RUNNING
+            return job
+
+
+def job_path(job_id, format):
+    return os.path.join(settings.EXPORT_ROOT, '%d.%s' % (job_id, format))
+
+
+def fail_stale_jobs(timeout=None):
+    """Fail running jobs started more than ``timeout`` seconds ago.
+
+    Their worker died mid-export; failing them (rather than queueing them
+    again) keeps an export that kills its worker from doing so forever.
+    """
+    if timeout is None:
+        timeout = settings.EXPORT_JOB_TIMEOUT
+    cutoff = timezone.now() - datetime.timedelta(seconds=timeout)
+    stale = ExportJob.objects.filter(status=ExportJob.RUNNING, started_at__lt=cutoff)
+    for job_id, format in stale.values_list('pk', 'format'):
+        partial = job_path(job_id, format) + '.part'
+        if os.path.exists(partial):
+            os.remove(partial)
+    return stale.update(status=ExportJob.FAILED, error='The export did not finish in time',
+                        finished_at=timezone.now())
+
+
+def run_job(job):
+    os.makedirs(settings.EXPORT_ROOT, exist_ok=True)
+    path = job_path(job.pk, job.format)
+    partial = path + '.part'
+    try:
+        # Read the version before the data so a concurrent write can only
+        # make the cached copy newer than its key, never older.
+        key = artifact_key(job.owner_id, job.kind, job.format,
+                           export_filters(job.params, EXPORTS[job.kind]['group_field']))
+        write_export(job, partial)
+        os.replace(partial, path)
+        store_file(key, path)
+    except Exception as e:
+        logger.exception('Export job %s failed', job.pk)
+        if os.path.exists(partial):
+            os.remove(partial)
+        job.status = ExportJob.FAILED
+        job.error = str(e)
+    else:
+        job.status = ExportJob.DONE
+        job.file_path = path
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'file_path', 'error', 'finished_at'])
+    return job
+
+
+def purge_jobs(max_age=datetime.timedelta(days=7)):
+    """Delete finished jobs older than ``max_age`` along with their files."""
+    old = ExportJob.objects.filter(
+        status__in=[ExportJob.DONE, ExportJob.FAILED],
+        finished_at__lt=timezone.now() - max_age,
+    )
+    for path in old.exclude(file_path='').values_list('file_path', flat=True):
+        if os.path.exists(path):
+            os.remove(path)
+    return old.delete()[0]
@@ -0,0 +1,97 @@
+"""Process-wide cache of the small Category and Source lookup tables.
+
+Each worker keeps the rows in memory and re-reads them only when the
+table's version key in Django's cache changes. Saving or deleting a row
+writes a new version once the transaction commits, so with a shared cache
+backend (``CACHES``) every worker picks up the change on its next lookup.
+Bulk ``update()``/``delete()`` calls skip the signals and must call
+:func:`invalidate` themselves.
+"""
+import threading
+import uuid
+
+from django.core.cache import cache
+from django.db import transaction
+
+VERSION_KEY = 'lookups:%s:version'
+
+
+class LookupTable:
+    """All rows of ``model``, ordered by name, reloaded when the version moves."""
+
+    def __init__(self, model):
+        self.model = model
+        self.key = VERSION_KEY % model._meta.label_lower
+        self._state = None
+        self._lock = threading.Lock()
+
+    def version(self):
+        version = cache.get(self.key)
+        if version is None:
+            # Never leave the key unset, or a process that cached the rows
+            # before an eviction would miss the next change.
+            cache.add(self.key, uuid.uuid4().hex, timeout=None)
+            version = cache.get(self.key)
+        return version
+
+    def _rows(self):
+        version = self.version()
+        state = self._state
+        if state is None or state[0] != version:
+            with self._lock:
+                state = self._state
+                if state is None or state[0] != version:
+                    # Read after the version, so a concurrent change can only
+                    # make the rows newer than the version they are stored at.
+                    rows = tuple(self.model.objects.order_by('name', 'pk'))
+                    state = (version, rows, {row.pk: row for row in rows})
+                    self._state = state
+        return state
+
+    def all(self):
+        return self._rows()[1]
+
+    def get(self, pk):
+        """The row with primary key ``pk`` (an int or digit string), or ``None``."""
+        try:
+            pk = int(pk)
+        except (TypeError, ValueError):
+            return None
+        return self._rows()[2].get(pk)
+
+    def names(self):
+        return {pk: row.name for pk, row in self._rows()[2].items()}
+
+    def invalidate(self):
+        cache.set(self.key, uuid.uuid4().hex, timeout=None)
+        self._state = None
+
+
+_tables = {}
+
+
+def table(model):
+    if model not in _tables:
+        _tables[model] = LookupTable(model)
+    return _tables[model]
+
+
+def categories():
+    from .models import Category
+    return table(Category).all()
+
+
+def sources():
+    from userincome.models import Source
+    return table(Source).all()
+
+
+def lookup_versions():
+    from .models import Category
+    from userincome.models import Source
+    return [table(Category).version(), table(Source).version()]
+
+
+def invalidate(model):
+    """Drop every worker's copy of ``model`` once the current transaction commits."""
+    transaction.on_commit(table(model).invalidate)
@@ -0,0 +1,97 @@
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from expenses.dbpool import summarize
+
+
+def measure(request, count, concurrency):
+    """Run ``request`` ``count`` times on ``concurrency`` threads; return timings."""
+    def timed(_):
+        start = time.perf_counter()
+        request()
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        latencies = sorted(executor.map(timed, range(count)))
+    elapsed = time.perf_counter() - start
+    return {
+        'elapsed': elapsed,
+        'per_second': count / elapsed,
+        'mean_ms': statistics.mean(latencies) * 1000,
+        'p50_ms': latencies[len(latencies) // 2] * 1000,
+        'p95_ms': latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000,
+    }
+
+
+class Command(BaseCommand):
+    help = 'Compare connecting on every request with a connection pool on the configured PostgreSQL database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500,
+                            help='Simulated requests per mode')
+        parser.add_argument('--concurrency', type=int, default=8,
+                            help='Requests in flight at once, like gunicorn threads')
+        parser.add_argument('--query', default='SELECT 1',
+                            help='SQL each simulated request runs')
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        if connection.vendor != 'postgresql':
+            raise CommandError('The benchmark needs a PostgreSQL database')
+        try:
+            import psycopg
+            from psycopg_pool import ConnectionPool
+        except ImportError:
+            raise CommandError('The benchmark needs psycopg 3 with psycopg_pool')
+        if options['requests'] < 1 or options['concurrency'] < 1:
+            raise CommandError('--requests and --concurrency must be positive')
+
+        params = connection.get_connection_params()
+        params['autocommit'] = True
+        query = options['query']
+        # The configured pool if there is one, else one thread per connection.
+        pool_options = connection.settings_dict['OPTIONS'].get('pool')
+        if not isinstance(pool_options, dict):
+            pool_options = {'min_size': options['concurrency'], 'max_size': options['concurrency']}
+        check = ConnectionPool.check_connection if connection.settings_dict['CONN_HEALTH_CHECKS'] else None
+
+        def connect_per_request():
+            with psycopg.connect(**params) as conn:
+                conn.execute(query).fetchall()
+
+        pool = ConnectionPool(kwargs=params, open=False, check=check, **pool_options)
+
+        def pooled():
+            with pool.connection() as conn:
+                conn.execute(query).fetchall()
+
+        try:
+            results = [('per-request connect', measure(connect_per_request, options['requests'],
+                                                       options['concurrency']))]
+            pool.open(wait=True)
+            results.append(('pooled', measure(pooled, options['requests'], options['concurrency'])))
+            stats = summarize(pool.get_stats())
+        except psycopg.Error as e:
+            raise CommandError(str(e))
+        finally:
+            pool.close()
+
+        self.stdout.write('%d requests, %d at a time, running %r' % (
+            options['requests'], options['concurrency'], query))
+        self.stdout.write('%-20s %10s %10s %10s %10s' % ('mode', 'req/s', 'mean ms', 'p50 ms', 'p95 ms'))
+        for mode, timing in results:
+            self.stdout.write('%-20s %10.1f %10.2f %10.2f %10.2f' % (
+                mode, timing['per_second'], timing['mean_ms'], timing['p50_ms'], timing['p95_ms']))
+        self.stdout.write('pool: %d-%d connections, %d opened, %d checkouts, %d queued, '
+                          'avg wait %.3f ms, %d lost' % (
+                              stats['min_size'], stats['max_size'], stats['connections'],
+                              stats['requests'], stats['queued'], stats['avg_wait_ms'],
+                              stats['connections_lost']))
+        speedup = results[1][1]['per_second'] / results[0][1]['per_second']
+        self.stdout.write(self.style.SUCCESS('Pooled mode served %.1fx the requests per second' % speedup))
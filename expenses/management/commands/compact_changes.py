@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from expenses.changes import compact
+
+
+class Command(BaseCommand):
+    help = 'Drop superseded sync change log entries and deletes past the retention period'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.CHANGELOG_RETENTION_DAYS,
+                            help='Keep delete entries this many days')
+
+    def handle(self, *args, **options):
+        removed = compact(options['days'])
+        self.stdout.write(self.style.SUCCESS('Removed %d change log entries' % removed))
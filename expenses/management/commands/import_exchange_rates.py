@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from expenses.rates import import_rates, parse_rates
+
+
+class Command(BaseCommand):
+    help = 'Load exchange rates from a CSV (date,currency,rate) or JSON ({date: {code: rate}}) file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=('csv', 'json'),
+                            help='File format; guessed from the content by default')
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['path'], encoding='utf-8') as rate_file:
+                entries = parse_rates(rate_file.read(), options['format'])
+                count = import_rates(entries, batch_size=options['batch_size'])
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(
+            'Imported %d rates against %s' % (count, settings.EXCHANGE_RATE_BASE)
+        ))
@@ -0,0 +1,45 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from expenses.imports import (
+    FORMATS, IMPORT_BATCH_SIZE, StatementError, detect_format, import_statement, text_lines,
+)
+
+
+class Command(BaseCommand):
+    help = 'Import a CSV, OFX or QIF bank statement as expenses and income'
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=FORMATS,
+                            help='Statement format; guessed from the extension by default')
+        parser.add_argument('--category', default='Imported', help='Category for debits')
+        parser.add_argument('--source', default='Imported', help='Income source for credits')
+        parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            owner = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError('User "%s" does not exist' % options['username'])
+
+        format = options['format'] or detect_format(options['path'])
+        if not format:
+            raise CommandError('Cannot tell the statement format; pass --format')
+
+        try:
+            with open(options['path'], 'rb') as statement:
+                report = import_statement(
+                    owner, text_lines(statement), format, category=options['category'],
+                    source=options['source'], batch_size=options['batch_size'],
+                )
+        except (OSError, StatementError) as e:
+            raise CommandError(str(e))
+
+        for error in report['errors']:
+            self.stderr.write('Line %(line)s: %(error)s' % error)
+        self.stdout.write(self.style.SUCCESS(
+            'Read %(rows)d rows: %(expenses)d expenses and %(income)d income added, '
+            '%(duplicates)d duplicates skipped, %(error_count)d errors' % report
+        ))
@@ -0,0 +1,22 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from expenses.summaries import rebuild_expense_summaries
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the monthly expense rollup table from raw expenses'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Only rebuild rollups for this username')
+
+    def handle(self, *args, **options):
+        owner = None
+        if options['user']:
+            try:
+                owner = User.objects.get(username=options['user'])
+            except User.DoesNotExist:
+                raise CommandError('User "%s" does not exist' % options['user'])
+
+        buckets = rebuild_expense_summaries(owner)
+        self.stdout.write(self.style.SUCCESS('Rebuilt %d expense summary rows' % buckets))
@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from expenses.jobs import claim_next_job, fail_stale_jobs, purge_jobs, run_job
+
+
+class Command(BaseCommand):
+    help = 'Render queued PDF/CSV/Excel export jobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help='Process the queue until empty, then exit')
+        parser.add_argument('--sleep', type=float, default=2.0,
+                            help='Seconds to wait when the queue is empty')
+
+    def handle(self, *args, **options):
+        purge_jobs()
+        fail_stale_jobs()
+        while True:
+            job = claim_next_job()
+            if job is None:
+                fail_stale_jobs()
+                if options['once']:
+                    return
+                time.sleep(options['sleep'])
+                continue
+
+            job = run_job(job)
+            self.stdout.write('Export job %d: %s' % (job.pk, job.status))
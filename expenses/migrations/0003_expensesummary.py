@@ -0,0 +1,80 @@
+# Generated by Django 5.1.6 on 2026-10-18 17:01
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncMonth
+
+
+def build_summaries(apps, schema_editor):
+    Expense = apps.get_model("expenses", "Expense")
+    ExpenseSummary = apps.get_model("expenses", "ExpenseSummary")
+
+    buckets = {}
+    rows = (
+        Expense.objects.order_by()
+        .annotate(month=TruncMonth("date"))
+        .values("owner_id", "month", "category")
+        .annotate(amount=Sum("amount"), entries=Count("id"))
+    )
+    for row in rows:
+        key = (row["owner_id"], row["month"], row["category"] or "")
+        total, count = buckets.get(key, (0, 0))
+        buckets[key] = (total + row["amount"], count + row["entries"])
+
+    ExpenseSummary.objects.bulk_create(
+        [
+            ExpenseSummary(
+                owner_id=owner_id, month=month, category=category, total=total, count=count
+            )
+            for (owner_id, month, category), (total, count) in buckets.items()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("expenses", "0002_alter_category_options_alter_expense_options_and_more"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ExpenseSummary",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("month", models.DateField()),
+                ("category", models.CharField(blank=True, default="", max_length=266)),
+                ("total", models.FloatField(default=0)),
+                ("count", models.IntegerField(default=0)),
+                (
+                    "owner",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["month"],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("owner", "month", "category"),
+                        name="unique_expense_summary_bucket",
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(build_summaries, migrations.RunPython.noop),
+    ]
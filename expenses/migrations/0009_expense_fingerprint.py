@@ -0,0 +1,105 @@
+# Generated by Django 5.1.6 on 2026-10-18 17:16
+
+import datetime
+import hashlib
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import migrations, models
+
+TEXT_FIELDS = ["description", "category"]
+
+
+# Frozen copies of expenses.imports.fingerprint and of the SQLite part of
+# expenses.search.install_fulltext as they were when this migration was written.
+def fingerprint(date, amount, description):
+    if isinstance(date, datetime.datetime):
+        date = date.date()
+    date = str(date)[:10]
+    amount = Decimal(str(amount)).quantize(Decimal("0.01"))
+    description = " ".join(str(description or "").lower().split())
+    return hashlib.sha256(
+        ("%s|%s|%s" % (date, amount, description)).encode()
+    ).hexdigest()
+
+
+def install_sqlite_fulltext(schema_editor, table, fields):
+    fts = table + "_fts"
+    columns = ", ".join(fields)
+    delete_old = "INSERT INTO %s(%s, rowid, %s) VALUES ('delete', old.id, %s);" % (
+        fts,
+        fts,
+        columns,
+        ", ".join("old.%s" % field for field in fields),
+    )
+    insert_new = "INSERT INTO %s(rowid, %s) VALUES (new.id, %s);" % (
+        fts,
+        columns,
+        ", ".join("new.%s" % field for field in fields),
+    )
+    try:
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS %s USING fts5(%s, content='%s', "
+            "content_rowid='id')" % (fts, columns, table)
+        )
+    except Exception:
+        # SQLite built without FTS5; search falls back to icontains.
+        return
+    for suffix in ("ai", "ad", "au"):
+        schema_editor.execute("DROP TRIGGER IF EXISTS %s_%s" % (fts, suffix))
+    schema_editor.execute(
+        "CREATE TRIGGER %s_ai AFTER INSERT ON %s BEGIN %s END" % (fts, table, insert_new)
+    )
+    schema_editor.execute(
+        "CREATE TRIGGER %s_ad AFTER DELETE ON %s BEGIN %s END" % (fts, table, delete_old)
+    )
+    schema_editor.execute(
+        "CREATE TRIGGER %s_au AFTER UPDATE ON %s BEGIN %s %s END"
+        % (fts, table, delete_old, insert_new)
+    )
+    schema_editor.execute("INSERT INTO %s(%s) VALUES ('rebuild')" % (fts, fts))
+
+
+def backfill_fingerprints(apps, schema_editor):
+    Expense = apps.get_model("expenses", "Expense")
+    batch = []
+    for row in Expense.objects.only("date", "amount", "description").iterator(
+        chunk_size=2000
+    ):
+        row.fingerprint = fingerprint(row.date, row.amount, row.description)
+        batch.append(row)
+        if len(batch) == 2000:
+            Expense.objects.bulk_update(batch, ["fingerprint"])
+            batch = []
+    Expense.objects.bulk_update(batch, ["fingerprint"])
+
+
+def reinstall_fulltext(apps, schema_editor):
+    # SQLite rebuilds the table to add the column, dropping the FTS triggers;
+    # PostgreSQL keeps its indexes.
+    if schema_editor.connection.vendor == "sqlite":
+        install_sqlite_fulltext(schema_editor, "expenses_expense", TEXT_FIELDS)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("expenses", "0008_dataversion"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="expense",
+            name="fingerprint",
+            field=models.CharField(blank=True, default="", max_length=64),
+        ),
+        migrations.AddIndex(
+            model_name="expense",
+            index=models.Index(
+                fields=["owner", "fingerprint"], name="expense_owner_fprint_idx"
+            ),
+        ),
+        migrations.RunPython(backfill_fingerprints, migrations.RunPython.noop),
+        migrations.RunPython(reinstall_fulltext, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,179 @@
+# Generated by Django 5.1.6 on 2026-10-18 17:40
+
+from decimal import ROUND_HALF_EVEN, Decimal
+
+from django.db import migrations
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncMonth
+
+import expenses.money
+
+TEXT_FIELDS = ["description", "category"]
+
+
+# Frozen copy of the rounding in expenses.money and of the conversion this
+# migration used, as they were when it was written.
+MONEY_DECIMAL_PLACES = 4
+CURRENCY_EXPONENTS = {
+    "BIF": 0, "CLP": 0, "DJF": 0, "GNF": 0, "ISK": 0, "JPY": 0, "KMF": 0,
+    "KRW": 0, "PYG": 0, "RWF": 0, "UGX": 0, "VND": 0, "VUV": 0, "XAF": 0,
+    "XOF": 0, "XPF": 0,
+    "BHD": 3, "IQD": 3, "JOD": 3, "KWD": 3, "LYD": 3, "OMR": 3, "TND": 3,
+    "CLF": 4, "BTC": 4, "XAG": 4, "XAU": 4, "XDR": 4, "XPD": 4, "XPT": 4,
+}
+
+
+def to_decimal(value):
+    # repr() is the shortest string that round-trips, so 0.1 stays 0.1.
+    return Decimal(repr(value) if isinstance(value, float) else str(value).strip())
+
+
+def to_units(value, currency):
+    """``value`` rounded to ``currency``, as integer ten-thousandths."""
+    code = (currency or "").split(" - ")[0].strip().upper()
+    exponent = min(CURRENCY_EXPONENTS.get(code, 2), MONEY_DECIMAL_PLACES)
+    amount = to_decimal(value).quantize(
+        Decimal(1).scaleb(-exponent), rounding=ROUND_HALF_EVEN
+    )
+    return int(amount.scaleb(MONEY_DECIMAL_PLACES).to_integral_value(ROUND_HALF_EVEN))
+
+
+def convert_float_amounts(model, field, currencies, reverse=False, batch_size=2000):
+    """Rewrite a float ``field`` of ``model`` as money units, or back.
+
+    Each value is rounded to the currency of its owner (``currencies`` maps
+    owner id to preference) and written back as a whole number of units so
+    the column can then be altered to a MoneyField.
+    """
+    batch = []
+    for row in model.objects.only("owner_id", field).iterator(chunk_size=batch_size):
+        value = getattr(row, field)
+        if reverse:
+            value = float(to_decimal(value).scaleb(-MONEY_DECIMAL_PLACES))
+        else:
+            value = float(to_units(value, currencies.get(row.owner_id)))
+        setattr(row, field, value)
+        batch.append(row)
+        if len(batch) == batch_size:
+            model.objects.bulk_update(batch, [field])
+            batch = []
+    model.objects.bulk_update(batch, [field])
+
+
+# Frozen copy of the SQLite part of expenses.search.install_fulltext as it
+# was when this migration was written.
+def install_sqlite_fulltext(schema_editor, table, fields):
+    fts = table + "_fts"
+    columns = ", ".join(fields)
+    delete_old = "INSERT INTO %s(%s, rowid, %s) VALUES ('delete', old.id, %s);" % (
+        fts,
+        fts,
+        columns,
+        ", ".join("old.%s" % field for field in fields),
+    )
+    insert_new = "INSERT INTO %s(rowid, %s) VALUES (new.id, %s);" % (
+        fts,
+        columns,
+        ", ".join("new.%s" % field for field in fields),
+    )
+    try:
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS %s USING fts5(%s, content='%s', "
+            "content_rowid='id')" % (fts, columns, table)
+        )
+    except Exception:
+        # SQLite built without FTS5; search falls back to icontains.
+        return
+    for suffix in ("ai", "ad", "au"):
+        schema_editor.execute("DROP TRIGGER IF EXISTS %s_%s" % (fts, suffix))
+    schema_editor.execute(
+        "CREATE TRIGGER %s_ai AFTER INSERT ON %s BEGIN %s END" % (fts, table, insert_new)
+    )
+    schema_editor.execute(
+        "CREATE TRIGGER %s_ad AFTER DELETE ON %s BEGIN %s END" % (fts, table, delete_old)
+    )
+    schema_editor.execute(
+        "CREATE TRIGGER %s_au AFTER UPDATE ON %s BEGIN %s %s END"
+        % (fts, table, delete_old, insert_new)
+    )
+    schema_editor.execute("INSERT INTO %s(%s) VALUES ('rebuild')" % (fts, fts))
+
+
+def owner_currencies(apps):
+    UserPreferences = apps.get_model("userpreferences", "UserPreferences")
+    return dict(UserPreferences.objects.values_list("user_id", "currency"))
+
+
+def amounts_to_units(apps, schema_editor):
+    Expense = apps.get_model("expenses", "Expense")
+    ExpenseSummary = apps.get_model("expenses", "ExpenseSummary")
+    convert_float_amounts(Expense, "amount", owner_currencies(apps))
+    # Rebuilt from the converted expenses below.
+    ExpenseSummary.objects.update(total=0)
+
+
+def units_to_amounts(apps, schema_editor):
+    Expense = apps.get_model("expenses", "Expense")
+    ExpenseSummary = apps.get_model("expenses", "ExpenseSummary")
+    convert_float_amounts(Expense, "amount", {}, reverse=True)
+    convert_float_amounts(ExpenseSummary, "total", {}, reverse=True)
+
+
+def rebuild_summaries(apps, schema_editor):
+    Expense = apps.get_model("expenses", "Expense")
+    ExpenseSummary = apps.get_model("expenses", "ExpenseSummary")
+    rows = (
+        Expense.objects.order_by()
+        .annotate(month=TruncMonth("date"))
+        .values("owner_id", "month", "category")
+        .annotate(amount=Sum("amount"), entries=Count("id"))
+    )
+    buckets = {}
+    for row in rows:
+        key = (row["owner_id"], row["month"], row["category"] or "")
+        total, count = buckets.get(key, (0, 0))
+        buckets[key] = (total + row["amount"], count + row["entries"])
+    ExpenseSummary.objects.all().delete()
+    ExpenseSummary.objects.bulk_create(
+        [
+            ExpenseSummary(
+                owner_id=owner_id,
+                month=month,
+                category=category,
+                total=total,
+                count=count,
+            )
+            for (owner_id, month, category), (total, count) in buckets.items()
+        ],
+        batch_size=1000,
+    )
+
+
+def reinstall_fulltext(apps, schema_editor):
+    # SQLite rebuilds the table to change the column type, dropping the triggers.
+    if schema_editor.connection.vendor == "sqlite":
+        install_sqlite_fulltext(schema_editor, "expenses_expense", TEXT_FIELDS)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("expenses", "0009_expense_fingerprint"),
+        ("userpreferences", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.RunPython(amounts_to_units, units_to_amounts),
+        migrations.AlterField(
+            model_name="expense",
+            name="amount",
+            field=expenses.money.MoneyField(),
+        ),
+        migrations.AlterField(
+            model_name="expensesummary",
+            name="total",
+            field=expenses.money.MoneyField(default=0),
+        ),
+        migrations.RunPython(rebuild_summaries, migrations.RunPython.noop),
+        migrations.RunPython(reinstall_fulltext, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,248 @@
+# Generated by Django 5.1.6 on 2026-10-18 18:05
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import TruncMonth
+
+OLD_TEXT_FIELDS = ["description", "category"]
+TEXT_FIELDS = ["description"]
+
+
+# Frozen copies of expenses.search.install_fulltext and uninstall_fulltext
+# as they were when this migration was written.
+def install_fulltext(schema_editor, table, fields):
+    connection = schema_editor.connection
+    if connection.vendor == "postgresql":
+        document = " || ' ' || ".join("coalesce(%s, '')" % field for field in fields)
+        schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        schema_editor.execute(
+            "CREATE INDEX IF NOT EXISTS %s_search_idx ON %s "
+            "USING gin (to_tsvector('simple', %s))" % (table, table, document)
+        )
+        for field in fields:
+            schema_editor.execute(
+                "CREATE INDEX IF NOT EXISTS %s_%s_trgm_idx ON %s "
+                "USING gin (%s gin_trgm_ops)" % (table, field, table, field)
+            )
+    elif connection.vendor == "sqlite":
+        install_sqlite_fulltext(schema_editor, table, fields)
+
+
+def uninstall_fulltext(schema_editor, table, fields):
+    connection = schema_editor.connection
+    if connection.vendor == "postgresql":
+        schema_editor.execute("DROP INDEX IF EXISTS %s_search_idx" % table)
+        for field in fields:
+            schema_editor.execute("DROP INDEX IF EXISTS %s_%s_trgm_idx" % (table, field))
+    elif connection.vendor == "sqlite":
+        fts = table + "_fts"
+        for suffix in ("ai", "ad", "au"):
+            schema_editor.execute("DROP TRIGGER IF EXISTS %s_%s" % (fts, suffix))
+        schema_editor.execute("DROP TABLE IF EXISTS %s" % fts)
+
+
+def install_sqlite_fulltext(schema_editor, table, fields):
+    fts = table + "_fts"
+    columns = ", ".join(fields)
+    delete_old = "INSERT INTO %s(%s, rowid, %s) VALUES ('delete', old.id, %s);" % (
+        fts,
+        fts,
+        columns,
+        ", ".join("old.%s" % field for field in fields),
+    )
+    insert_new = "INSERT INTO %s(rowid, %s) VALUES (new.id, %s);" % (
+        fts,
+        columns,
+        ", ".join("new.%s" % field for field in fields),
+    )
+    try:
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS %s USING fts5(%s, content='%s', "
+            "content_rowid='id')" % (fts, columns, table)
+        )
+    except Exception:
+        # SQLite built without FTS5; search falls back to icontains.
+        return
+    for suffix in ("ai", "ad", "au"):
+        schema_editor.execute("DROP TRIGGER IF EXISTS %s_%s" % (fts, suffix))
+    schema_editor.execute(
+        "CREATE TRIGGER %s_ai AFTER INSERT ON %s BEGIN %s END" % (fts, table, insert_new)
+    )
+    schema_editor.execute(
+        "CREATE TRIGGER %s_ad AFTER DELETE ON %s BEGIN %s END" % (fts, table, delete_old)
+    )
+    schema_editor.execute(
+        "CREATE TRIGGER %s_au AFTER UPDATE ON %s BEGIN %s %s END"
+        % (fts, table, delete_old, insert_new)
+    )
+    schema_editor.execute("INSERT INTO %s(%s) VALUES ('rebuild')" % (fts, fts))
+
+
+def drop_old_fulltext(apps, schema_editor):
+    uninstall_fulltext(schema_editor, "expenses_expense", OLD_TEXT_FIELDS)
+
+
+def restore_old_fulltext(apps, schema_editor):
+    install_fulltext(schema_editor, "expenses_expense", OLD_TEXT_FIELDS)
+
+
+def install_new_fulltext(apps, schema_editor):
+    install_fulltext(schema_editor, "expenses_expense", TEXT_FIELDS)
+
+
+def drop_new_fulltext(apps, schema_editor):
+    uninstall_fulltext(schema_editor, "expenses_expense", TEXT_FIELDS)
+
+
+def names_to_categories(apps, schema_editor):
+    Expense = apps.get_model("expenses", "Expense")
+    Category = apps.get_model("expenses", "Category")
+    names = set(
+        Expense.objects.exclude(category__isnull=True)
+        .exclude(category="")
+        .values_list("category", flat=True)
+        .distinct()
+    )
+    known = set(Category.objects.values_list("name", flat=True))
+    Category.objects.bulk_create(
+        [Category(name=name) for name in sorted(names - known)]
+    )
+    # Duplicate names resolve to the oldest category.
+    Expense.objects.update(
+        category_ref=Subquery(
+            Category.objects.filter(name=OuterRef("category"))
+            .order_by("pk")
+            .values("pk")[:1]
+        )
+    )
+
+
+def categories_to_names(apps, schema_editor):
+    Expense = apps.get_model("expenses", "Expense")
+    Category = apps.get_model("expenses", "Category")
+    Expense.objects.update(
+        category=Subquery(
+            Category.objects.filter(pk=OuterRef("category_ref")).values("name")[:1]
+        )
+    )
+
+
+def clear_summaries(apps, schema_editor):
+    apps.get_model("expenses", "ExpenseSummary").objects.all().delete()
+
+
+def rebuild_summaries(apps, schema_editor):
+    Expense = apps.get_model("expenses", "Expense")
+    ExpenseSummary = apps.get_model("expenses", "ExpenseSummary")
+    # Runs with both category columns as foreign keys, or (reversing) both
+    # as names.
+    field = ExpenseSummary._meta.get_field("category")
+    rows = (
+        Expense.objects.order_by()
+        .annotate(month=TruncMonth("date"))
+        .values("owner_id", "month", "category")
+        .annotate(amount=Sum("amount"), entries=Count("id"))
+    )
+    buckets = {}
+    for row in rows:
+        category = row["category"]
+        if not field.is_relation:
+            category = category or ""
+        key = (row["owner_id"], row["month"], category)
+        total, count = buckets.get(key, (0, 0))
+        buckets[key] = (total + row["amount"], count + row["entries"])
+    ExpenseSummary.objects.all().delete()
+    ExpenseSummary.objects.bulk_create(
+        [
+            ExpenseSummary(
+                owner_id=owner_id,
+                month=month,
+                total=total,
+                count=count,
+                **{field.attname: category},
+            )
+            for (owner_id, month, category), (total, count) in buckets.items()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("expenses", "0010_money_amounts"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_old_fulltext, restore_old_fulltext),
+        migrations.RunPython(clear_summaries, rebuild_summaries),
+        migrations.RemoveConstraint(
+            model_name="expensesummary",
+            name="unique_expense_summary_bucket",
+        ),
+        migrations.RemoveField(
+            model_name="expensesummary",
+            name="category",
+        ),
+        migrations.AddField(
+            model_name="expensesummary",
+            name="category",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                to="expenses.category",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="expensesummary",
+            constraint=models.UniqueConstraint(
+                fields=("owner", "month", "category"),
+                name="unique_expense_summary_bucket",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="expensesummary",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("category__isnull", True)),
+                fields=("owner", "month"),
+                name="unique_expense_summary_uncategorized",
+            ),
+        ),
+        migrations.AddField(
+            model_name="expense",
+            name="category_ref",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.PROTECT,
+                to="expenses.category",
+            ),
+        ),
+        migrations.RunPython(names_to_categories, categories_to_names),
+        migrations.RemoveIndex(
+            model_name="expense",
+            name="expense_owner_cat_date_idx",
+        ),
+        migrations.RemoveField(
+            model_name="expense",
+            name="category",
+        ),
+        migrations.RenameField(
+            model_name="expense",
+            old_name="category_ref",
+            new_name="category",
+        ),
+        migrations.AddIndex(
+            model_name="expense",
+            index=models.Index(
+                fields=["owner", "category", "date"],
+                name="expense_owner_cat_date_idx",
+            ),
+        ),
+        migrations.RunPython(rebuild_summaries, clear_summaries),
+        migrations.RunPython(install_new_fulltext, drop_new_fulltext),
+    ]
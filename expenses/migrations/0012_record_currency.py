@@ -0,0 +1,191 @@
+# Generated by Django 5.1.6 on 2026-10-18 17:36
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncMonth
+
+TEXT_FIELDS = ["description"]
+
+
+# Frozen copy of expenses.money.currency_code as it was when this migration
+# was written.
+DEFAULT_CURRENCY = "USD"
+
+
+def currency_code(value):
+    code = (value or "").split(" - ")[0].strip().upper()
+    return code or DEFAULT_CURRENCY
+
+
+# Frozen copy of the SQLite part of expenses.search.install_fulltext as it
+# was when this migration was written.
+def install_sqlite_fulltext(schema_editor, table, fields):
+    fts = table + "_fts"
+    columns = ", ".join(fields)
+    delete_old = "INSERT INTO %s(%s, rowid, %s) VALUES ('delete', old.id, %s);" % (
+        fts,
+        fts,
+        columns,
+        ", ".join("old.%s" % field for field in fields),
+    )
+    insert_new = "INSERT INTO %s(rowid, %s) VALUES (new.id, %s);" % (
+        fts,
+        columns,
+        ", ".join("new.%s" % field for field in fields),
+    )
+    try:
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS %s USING fts5(%s, content='%s', "
+            "content_rowid='id')" % (fts, columns, table)
+        )
+    except Exception:
+        # SQLite built without FTS5; search falls back to icontains.
+        return
+    for suffix in ("ai", "ad", "au"):
+        schema_editor.execute("DROP TRIGGER IF EXISTS %s_%s" % (fts, suffix))
+    schema_editor.execute(
+        "CREATE TRIGGER %s_ai AFTER INSERT ON %s BEGIN %s END" % (fts, table, insert_new)
+    )
+    schema_editor.execute(
+        "CREATE TRIGGER %s_ad AFTER DELETE ON %s BEGIN %s END" % (fts, table, delete_old)
+    )
+    schema_editor.execute(
+        "CREATE TRIGGER %s_au AFTER UPDATE ON %s BEGIN %s %s END"
+        % (fts, table, delete_old, insert_new)
+    )
+    schema_editor.execute("INSERT INTO %s(%s) VALUES ('rebuild')" % (fts, fts))
+
+
+def fill_currencies(apps, model):
+    """Give every row its owner's preferred currency, one UPDATE per currency."""
+    UserPreferences = apps.get_model("userpreferences", "UserPreferences")
+    owners = {}
+    for user_id, currency in UserPreferences.objects.values_list("user_id", "currency"):
+        owners.setdefault(currency_code(currency), []).append(user_id)
+    for code, user_ids in owners.items():
+        for start in range(0, len(user_ids), 500):
+            model.objects.filter(
+                owner_id__in=user_ids[start : start + 500], currency=""
+            ).update(currency=code)
+    model.objects.filter(currency="").update(currency=DEFAULT_CURRENCY)
+
+
+def fill_expense_currencies(apps, schema_editor):
+    fill_currencies(apps, apps.get_model("expenses", "Expense"))
+
+
+def rebuild_summaries(apps, schema_editor):
+    Expense = apps.get_model("expenses", "Expense")
+    ExpenseSummary = apps.get_model("expenses", "ExpenseSummary")
+    fields = ["owner_id", "month", "category_id"]
+    if any(field.name == "currency" for field in ExpenseSummary._meta.fields):
+        fields.append("currency")
+    rows = (
+        Expense.objects.order_by()
+        .annotate(month=TruncMonth("date"))
+        .values(*fields)
+        .annotate(amount=Sum("amount"), entries=Count("id"))
+    )
+    buckets = {}
+    for row in rows:
+        key = tuple(row[field] for field in fields)
+        total, count = buckets.get(key, (0, 0))
+        buckets[key] = (total + row["amount"], count + row["entries"])
+    ExpenseSummary.objects.all().delete()
+    ExpenseSummary.objects.bulk_create(
+        [
+            ExpenseSummary(total=total, count=count, **dict(zip(fields, key)))
+            for key, (total, count) in buckets.items()
+        ],
+        batch_size=1000,
+    )
+
+
+def clear_summaries(apps, schema_editor):
+    apps.get_model("expenses", "ExpenseSummary").objects.all().delete()
+
+
+def reinstall_fulltext(apps, schema_editor):
+    # SQLite rebuilds the table to add the column, dropping the triggers.
+    if schema_editor.connection.vendor == "sqlite":
+        install_sqlite_fulltext(schema_editor, "expenses_expense", TEXT_FIELDS)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("expenses", "0011_category_foreign_keys"),
+        ("userpreferences", "0001_initial"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        # Reversed last: the old rollups and triggers come back after the
+        # columns are gone.
+        migrations.RunPython(migrations.RunPython.noop, reinstall_fulltext),
+        migrations.RunPython(migrations.RunPython.noop, rebuild_summaries),
+        migrations.RunPython(clear_summaries, migrations.RunPython.noop),
+        migrations.CreateModel(
+            name="ExchangeRate",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date", models.DateField()),
+                ("currency", models.CharField(max_length=3)),
+                ("rate", models.DecimalField(decimal_places=10, max_digits=24)),
+            ],
+            options={
+                "ordering": ["currency", "date"],
+            },
+        ),
+        migrations.RemoveConstraint(
+            model_name="expensesummary",
+            name="unique_expense_summary_bucket",
+        ),
+        migrations.RemoveConstraint(
+            model_name="expensesummary",
+            name="unique_expense_summary_uncategorized",
+        ),
+        migrations.AddField(
+            model_name="expense",
+            name="currency",
+            field=models.CharField(blank=True, default="", max_length=3),
+        ),
+        migrations.AddField(
+            model_name="expensesummary",
+            name="currency",
+            field=models.CharField(blank=True, default="", max_length=3),
+        ),
+        migrations.AddConstraint(
+            model_name="expensesummary",
+            constraint=models.UniqueConstraint(
+                fields=("owner", "month", "category", "currency"),
+                name="unique_expense_summary_bucket",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="expensesummary",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("category__isnull", True)),
+                fields=("owner", "month", "currency"),
+                name="unique_expense_summary_uncategorized",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="exchangerate",
+            constraint=models.UniqueConstraint(
+                fields=("currency", "date"), name="unique_exchange_rate"
+            ),
+        ),
+        migrations.RunPython(fill_expense_currencies, migrations.RunPython.noop),
+        migrations.RunPython(rebuild_summaries, clear_summaries),
+        migrations.RunPython(reinstall_fulltext, migrations.RunPython.noop),
+    ]
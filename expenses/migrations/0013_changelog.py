@@ -0,0 +1,124 @@
+# Generated by Django 5.1.6 on 2026-10-18 17:54
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def log_existing_rows(apps, schema_editor):
+    """Log a create for every existing row so a first sync sees all of them."""
+    ChangeLog = apps.get_model("expenses", "ChangeLog")
+    DataVersion = apps.get_model("expenses", "DataVersion")
+    sources = [
+        ("expense", apps.get_model("expenses", "Expense")),
+        ("income", apps.get_model("userincome", "UserIncome")),
+    ]
+    owners = set()
+    for _, model in sources:
+        owners.update(model.objects.values_list("owner_id", flat=True).distinct())
+    versions = dict(DataVersion.objects.values_list("owner_id", "version"))
+    now = timezone.now()
+    DataVersion.objects.bulk_create(
+        [
+            DataVersion(owner_id=owner_id, version=1, updated_at=now)
+            for owner_id in owners
+            if owner_id not in versions
+        ]
+    )
+    DataVersion.objects.filter(owner_id__in=owners, version=0).update(version=1)
+    versions = dict(DataVersion.objects.values_list("owner_id", "version"))
+
+    for kind, model in sources:
+        rows = model.objects.order_by("pk").values_list("owner_id", "pk")
+        batch = []
+        for owner_id, pk in rows.iterator(chunk_size=2000):
+            batch.append(
+                ChangeLog(
+                    owner_id=owner_id,
+                    seq=versions[owner_id],
+                    kind=kind,
+                    object_id=pk,
+                    action="create",
+                )
+            )
+            if len(batch) >= 1000:
+                ChangeLog.objects.bulk_create(batch)
+                batch = []
+        ChangeLog.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("expenses", "0012_record_currency"),
+        ("userincome", "0008_userincome_currency"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="dataversion",
+            name="compacted_seq",
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name="ChangeLog",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("seq", models.BigIntegerField()),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[("expense", "Expense"), ("income", "Income")],
+                        max_length=10,
+                    ),
+                ),
+                ("object_id", models.BigIntegerField()),
+                (
+                    "action",
+                    models.CharField(
+                        choices=[
+                            ("create", "Create"),
+                            ("update", "Update"),
+                            ("delete", "Delete"),
+                        ],
+                        max_length=10,
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "owner",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["owner", "seq", "id"],
+                "indexes": [
+                    models.Index(
+                        fields=["owner", "seq"], name="changelog_owner_seq_idx"
+                    ),
+                    models.Index(
+                        fields=["owner", "kind", "object_id", "seq"],
+                        name="changelog_owner_object_idx",
+                    ),
+                    models.Index(
+                        fields=["action", "created_at"],
+                        name="changelog_action_created_idx",
+                    ),
+                ],
+            },
+        ),
+        migrations.RunPython(log_existing_rows, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.1.6 on 2026-10-18 21:10
+
+import datetime
+import hashlib
+from decimal import Decimal
+
+from django.db import migrations
+
+
+# Frozen copy of expenses.imports.fingerprint as it was when this migration
+# was written.
+def fingerprint(date, amount, currency, description):
+    if isinstance(date, datetime.datetime):
+        date = date.date()
+    date = str(date)[:10]
+    amount = Decimal(str(amount)).quantize(Decimal("0.0001"))
+    code = (currency or "").split(" - ")[0].strip().upper() or "USD"
+    description = " ".join(str(description or "").lower().split())
+    return hashlib.sha256(
+        ("%s|%s|%s|%s" % (date, amount, code, description)).encode()
+    ).hexdigest()
+
+
+def refresh_fingerprints(apps, schema_editor):
+    """Rehash every row now that the currency and full precision count."""
+    for model in (
+        apps.get_model("expenses", "Expense"),
+        apps.get_model("userincome", "UserIncome"),
+    ):
+        batch = []
+        rows = model.objects.only("date", "amount", "currency", "description")
+        for row in rows.iterator(chunk_size=2000):
+            row.fingerprint = fingerprint(
+                row.date, row.amount, row.currency, row.description
+            )
+            batch.append(row)
+            if len(batch) == 2000:
+                model.objects.bulk_update(batch, ["fingerprint"])
+                batch = []
+        model.objects.bulk_update(batch, ["fingerprint"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("expenses", "0013_changelog"),
+        ("userincome", "0008_userincome_currency"),
+    ]
+
+    operations = [
+        migrations.RunPython(refresh_fingerprints, migrations.RunPython.noop),
+    ]
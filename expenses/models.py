@@ -2,18 +2,30 @@ from django.db import models
 from django.contrib.auth.models import User
 from django.utils.timezone import now
 
+from .money import MoneyField
+
 class Expense(models.Model):
-    amount = models.FloatField()
+    amount = MoneyField()
     date = models.DateField(default=now)
     description = models.TextField()
     owner = models.ForeignKey(to=User, on_delete=models.CASCADE)
-    category = models.CharField(max_length=266,null=True, blank=True)
+    category = models.ForeignKey(to='Category', on_delete=models.PROTECT, null=True, blank=True)
+    # ISO code of the amount; filled from the owner's preference when blank.
+    currency = models.CharField(max_length=3, blank=True, default='')
+    # Hash of date, amount and description used to skip duplicate imports.
+    fingerprint = models.CharField(max_length=64, blank=True, default='')
 
     def __str__(self):
-        return self.category
+        return str(self.category)
 
     class Meta:
         ordering = ['-date']
+        indexes = [
+            models.Index(fields=['owner', 'amount'], name='expense_owner_amount_idx'),
+            models.Index(fields=['owner', '-date', '-id'], name='expense_owner_date_id_idx'),
+            models.Index(fields=['owner', 'category', 'date'], name='expense_owner_cat_date_idx'),
+            models.Index(fields=['owner', 'fingerprint'], name='expense_owner_fprint_idx'),
+        ]
 
 
 class Category(models.Model):
@@ -23,4 +35,143 @@ class Category(models.Model):
         verbose_name_plural = 'Categories'
 
     def __str__(self):
-        return self.name
\ No newline at end of file
+        return self.name
+
+class ExpenseSummary(models.Model):
+    """Per-user monthly rollup of expenses, one row per (month, category, currency)."""
+    owner = models.ForeignKey(to=User, on_delete=models.CASCADE)
+    month = models.DateField()
+    category = models.ForeignKey(to=Category, on_delete=models.CASCADE, null=True, blank=True)
+    currency = models.CharField(max_length=3, blank=True, default='')
+    total = MoneyField(default=0)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        ordering = ['month']
+        constraints = [
+            models.UniqueConstraint(fields=['owner', 'month', 'category', 'currency'],
+                                    name='unique_expense_summary_bucket'),
+            # NULLs never clash in a unique index, so cover the uncategorized bucket apart.
+            models.UniqueConstraint(fields=['owner', 'month', 'currency'],
+                                    condition=models.Q(category__isnull=True),
+                                    name='unique_expense_summary_uncategorized'),
+        ]
+
+    def __str__(self):
+        return '{} {} {}'.format(self.owner, self.month, self.category)
+
+
+class ExportJob(models.Model):
+    """An export rendered off-request by the ``run_export_worker`` command."""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+    FORMAT_CHOICES = [
+        ('pdf', 'PDF'),
+        ('csv', 'CSV'),
+        ('xlsx', 'Excel'),
+    ]
+    KIND_CHOICES = [
+        ('expenses', 'Expenses'),
+        ('income', 'Income'),
+    ]
+
+    owner = models.ForeignKey(to=User, on_delete=models.CASCADE)
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    format = models.CharField(max_length=10, choices=FORMAT_CHOICES)
+    params = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    file_path = models.CharField(max_length=500, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='exportjob_status_created_idx'),
+        ]
+
+    def __str__(self):
+        return '{} {} export for {} ({})'.format(self.kind, self.format, self.owner, self.status)
+
+
+class DataVersion(models.Model):
+    """Counter bumped on every expense or income write for a user.
+
+    Anything derived from a user's data (cached exports and so on) can be
+    keyed on this number instead of being invalidated by hand. It is also
+    the sequence number of the user's :class:`ChangeLog`.
+    """
+    owner = models.OneToOneField(to=User, on_delete=models.CASCADE, primary_key=True)
+    version = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField()
+    # Delete entries up to this sequence have been compacted away; a client
+    # syncing from an older token has to start again.
+    compacted_seq = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return '{} v{}'.format(self.owner, self.version)
+
+
+class ChangeLog(models.Model):
+    """One create, update or delete of a user's expense or income.
+
+    ``seq`` is the user's data version after the write, so entries are
+    ordered per user; a batch or import shares one ``seq``.
+    """
+    CREATE = 'create'
+    UPDATE = 'update'
+    DELETE = 'delete'
+    ACTION_CHOICES = [
+        (CREATE, 'Create'),
+        (UPDATE, 'Update'),
+        (DELETE, 'Delete'),
+    ]
+    KIND_CHOICES = [
+        ('expense', 'Expense'),
+        ('income', 'Income'),
+    ]
+
+    owner = models.ForeignKey(to=User, on_delete=models.CASCADE)
+    seq = models.BigIntegerField()
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    object_id = models.BigIntegerField()
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['owner', 'seq', 'id']
+        indexes = [
+            models.Index(fields=['owner', 'seq'], name='changelog_owner_seq_idx'),
+            models.Index(fields=['owner', 'kind', 'object_id', 'seq'],
+                         name='changelog_owner_object_idx'),
+            models.Index(fields=['action', 'created_at'], name='changelog_action_created_idx'),
+        ]
+
+    def __str__(self):
+        return '{} #{} {} {} {}'.format(self.owner, self.seq, self.action, self.kind, self.object_id)
+
+
+class ExchangeRate(models.Model):
+    """Units of ``currency`` that one unit of ``EXCHANGE_RATE_BASE`` bought on ``date``."""
+    date = models.DateField()
+    currency = models.CharField(max_length=3)
+    rate = models.DecimalField(max_digits=24, decimal_places=10)
+
+    class Meta:
+        ordering = ['currency', 'date']
+        constraints = [
+            models.UniqueConstraint(fields=['currency', 'date'], name='unique_exchange_rate'),
+        ]
+
+    def __str__(self):
+        return '{} {} {}'.format(self.date, self.currency, self.rate)
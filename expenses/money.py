@@ -0,0 +1,136 @@
+"""Exact money amounts.
+
+Amounts are ``Decimal`` in Python and integers in the database: a
+:class:`MoneyField` stores ten-thousandths of a unit, which holds every
+ISO 4217 currency exactly (the largest exponent is 4). Sums, comparisons
+and range lookups therefore run on plain integer columns with no float
+drift, and each written amount is first rounded to its currency's own
+exponent (whole yen, cents, or thousandths of a dinar).
+"""
+from decimal import ROUND_HALF_EVEN, Decimal, InvalidOperation
+
+from django import forms
+from django.core.exceptions import ValidationError
+from django.db import models
+
+MONEY_DECIMAL_PLACES = 4
+# The largest amount a MoneyField (a signed 64-bit integer) can hold.
+MAX_AMOUNT = Decimal(2 ** 63 - 1).scaleb(-MONEY_DECIMAL_PLACES)
+DEFAULT_CURRENCY = 'USD'
+CENT = Decimal('0.01')
+
+# ISO 4217 minor-unit exponents that differ from the usual 2. Codes without
+# a minor unit (precious metals, XDR) and cryptocurrencies use the most
+# precision a MoneyField can hold.
+CURRENCY_EXPONENTS = {
+    'BIF': 0, 'CLP': 0, 'DJF': 0, 'GNF': 0, 'ISK': 0, 'JPY': 0, 'KMF': 0,
+    'KRW': 0, 'PYG': 0, 'RWF': 0, 'UGX': 0, 'VND': 0, 'VUV': 0, 'XAF': 0,
+    'XOF': 0, 'XPF': 0,
+    'BHD': 3, 'IQD': 3, 'JOD': 3, 'KWD': 3, 'LYD': 3, 'OMR': 3, 'TND': 3,
+    'CLF': 4, 'BTC': 4, 'XAG': 4, 'XAU': 4, 'XDR': 4, 'XPD': 4, 'XPT': 4,
+}
+
+
+def currency_code(value):
+    """Return the ISO code from a stored preference like ``'USD - United States Dollar'``."""
+    code = (value or '').split(' - ')[0].strip().upper()
+    return code or DEFAULT_CURRENCY
+
+
+def currency_exponent(currency):
+    return CURRENCY_EXPONENTS.get(currency_code(currency), 2)
+
+
+def to_decimal(value):
+    """Convert user, JSON or float input to ``Decimal``; raises ``ValueError``."""
+    if isinstance(value, Decimal):
+        result = value
+    elif isinstance(value, float):
+        # repr() is the shortest string that round-trips, so 0.1 stays 0.1.
+        result = Decimal(repr(value))
+    else:
+        try:
+            result = Decimal(str(value).strip())
+        except InvalidOperation:
+            raise ValueError('Invalid amount: %r' % (value,))
+    if not result.is_finite():
+        raise ValueError('Invalid amount: %r' % (value,))
+    return result
+
+
+def quantize(value, currency=None):
+    """Round ``value`` to the minor unit of ``currency`` (banker's rounding)."""
+    exponent = min(currency_exponent(currency), MONEY_DECIMAL_PLACES)
+    return to_decimal(value).quantize(Decimal(1).scaleb(-exponent), rounding=ROUND_HALF_EVEN)
+
+
+def to_units(value):
+    """Integer ten-thousandths for ``value``, rounding any finer precision."""
+    return int(to_decimal(value).scaleb(MONEY_DECIMAL_PLACES).to_integral_value(ROUND_HALF_EVEN))
+
+
+def from_units(units):
+    value = Decimal(units).scaleb(-MONEY_DECIMAL_PLACES)
+    # Show at least cents, and only as many further places as are used.
+    if value == value.quantize(CENT):
+        return value.quantize(CENT)
+    return value.normalize()
+
+
+def user_currency(user_id):
+    """The ISO code of a user's preferred currency."""
+    from userpreferences.preferences import preferences_for
+    return currency_code(preferences_for(user_id).currency)
+
+
+def parse_amount(value, currency=None):
+    """Validate a submitted amount and round it to ``currency``; raises ``ValueError``.
+
+    The rounded amount must be positive and fit a :class:`MoneyField`.
+    """
+    if value is None or str(value).strip() == '' or isinstance(value, bool):
+        raise ValueError('Amount is required')
+    try:
+        amount = quantize(value, currency)
+    except ValueError:
+        raise ValueError('Amount must be a number')
+    except ArithmeticError:
+        # More digits than the decimal context holds.
+        raise ValueError('Amount is too large')
+    if abs(amount) > MAX_AMOUNT:
+        raise ValueError('Amount is too large')
+    if amount <= 0:
+        raise ValueError('Amount must be greater than zero')
+    return amount
+
+
+def as_number(value):
+    """JSON-friendly number for an exact amount (charts want numbers, not strings)."""
+    return float(value) if value is not None else 0
+
+
+class MoneyField(models.BigIntegerField):
+    """Exact amount: ``Decimal`` in Python, an integer of 1/10**4 units in SQL."""
+
+    description = 'Money amount stored as integer ten-thousandths'
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return None
+        return from_units(value)
+
+    def to_python(self, value):
+        if value is None:
+            return None
+        try:
+            return to_decimal(value)
+        except ValueError as e:
+            raise ValidationError(str(e), code='invalid')
+
+    def get_prep_value(self, value):
+        if value is None or hasattr(value, 'resolve_expression'):
+            return value
+        return to_units(value)
+
+    def formfield(self, **kwargs):
+        return forms.DecimalField(decimal_places=MONEY_DECIMAL_PLACES, **kwargs)
@@ -0,0 +1,111 @@
+import base64
+import datetime
+
+from django.db.models import Q
+
+
+class KeysetPage:
+    """One page of a :class:`KeysetPaginator`, newest rows first."""
+
+    def __init__(self, object_list, has_next, has_previous, next_cursor, previous_cursor,
+                 approximate_count=None):
+        self.object_list = object_list
+        self.has_next = has_next
+        self.has_previous = has_previous
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.approximate_count = approximate_count
+        self.is_keyset = True
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+class KeysetPaginator:
+    """Paginate a queryset on (date, id) without COUNT(*) or OFFSET.
+
+    Each page is a range scan on the (owner, -date, -id) index starting
+    from the row named in the cursor, so every page costs the same no
+    matter how deep the user goes. ``approximate_count`` is an optional
+    callable used to show a total without counting the rows.
+    """
+
+    def __init__(self, queryset, per_page, approximate_count=None):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.approximate_count = approximate_count
+
+    @staticmethod
+    def encode_cursor(direction, obj=None, date=None, pk=None):
+        """A cursor from row ``obj``, or from a ``date``/``pk`` position."""
+        if obj is not None:
+            date, pk = obj.date, obj.pk
+        raw = '%s|%s|%s' % (direction, date.isoformat(), pk)
+        return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+    @staticmethod
+    def decode_cursor(cursor):
+        try:
+            raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+            direction, date, pk = raw.split('|')
+            if direction not in ('a', 'b'):
+                return None
+            return direction, datetime.date.fromisoformat(date), int(pk)
+        except (ValueError, UnicodeDecodeError):
+            return None
+
+    def get_page(self, cursor=None):
+        """Return the page after (``a``) or before (``b``) the cursor row.
+
+        A missing or malformed cursor yields the first page. A cursor past
+        either end yields an empty page that links back from its position.
+        """
+        position = self.decode_cursor(cursor) if cursor else None
+        queryset = self.queryset
+
+        if position is None:
+            rows = list(queryset.order_by('-date', '-id')[:self.per_page + 1])
+            has_next, has_previous = len(rows) > self.per_page, False
+            rows = rows[:self.per_page]
+        elif position[0] == 'a':
+            _, date, pk = position
+            rows = list(queryset.filter(
+                Q(date__lt=date) | Q(date=date, id__lt=pk)
+            ).order_by('-date', '-id')[:self.per_page + 1])
+            has_next, has_previous = len(rows) > self.per_page, True
+            rows = rows[:self.per_page]
+        else:
+            _, date, pk = position
+            rows = list(queryset.filter(
+                Q(date__gt=date) | Q(date=date, id__gt=pk)
+            ).order_by('date', 'id')[:self.per_page + 1])
+            has_next, has_previous = True, len(rows) > self.per_page
+            rows = rows[:self.per_page][::-1]
+
+        if rows:
+            next_cursor = self.encode_cursor('a', rows[-1])
+            previous_cursor = self.encode_cursor('b', rows[0])
+        elif position is not None:
+            # Nothing lies beyond the cursor row in its direction, so moving
+            # its id one step that way makes the way back include that row.
+            direction, date, pk = position
+            has_next, has_previous = direction == 'b', direction == 'a'
+            next_cursor = previous_cursor = None
+            if has_next:
+                next_cursor = self.encode_cursor('a', date=date, pk=pk + 1)
+            else:
+                previous_cursor = self.encode_cursor('b', date=date, pk=pk - 1)
+        else:
+            next_cursor = previous_cursor = None
+
+        return KeysetPage(
+            rows,
+            has_next=has_next,
+            has_previous=has_previous,
+            next_cursor=next_cursor,
+            previous_cursor=previous_cursor,
+            approximate_count=self.approximate_count() if self.approximate_count else None,
+        )
@@ -0,0 +1,230 @@
+"""Currency conversion against a locally stored exchange-rate table.
+
+Rates live in :class:`~expenses.models.ExchangeRate`, one row per currency
+and day, each giving how many units of the currency one unit of
+``EXCHANGE_RATE_BASE`` buys. They are imported from a file (see
+:func:`import_rates`); nothing is fetched over the network.
+
+Each process keeps the whole table in memory as sorted per-currency
+columns and reloads it only when the version key in Django's cache moves,
+which an import does once it commits. An amount is converted at the rate
+in effect on its date: the latest rate on or before it, or the earliest
+known rate for older dates.
+
+Conversion works on columns: :func:`convert_many` takes parallel lists of
+amounts, currencies and dates and works out one factor per distinct
+(currency, date) pair, so converting thousands of rows costs a handful of
+lookups rather than one per row.
+"""
+import bisect
+import csv
+import datetime
+import io
+import json
+import threading
+import uuid
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .money import quantize, to_decimal
+
+VERSION_KEY = 'rates:version'
+
+
+class MissingRate(ValueError):
+    """No rate is known for a currency that needs converting."""
+
+
+class RateTable:
+    """Immutable snapshot of every stored rate, indexed for date lookups."""
+
+    def __init__(self, rows, base):
+        self.base = base
+        columns = {}
+        for currency, date, rate in rows:
+            dates, rates = columns.setdefault(currency, ([], []))
+            dates.append(date)
+            rates.append(rate)
+        self.columns = {currency: (tuple(dates), tuple(rates))
+                        for currency, (dates, rates) in columns.items()}
+
+    def rate(self, currency, date):
+        """Units of ``currency`` per unit of the base currency on ``date``."""
+        if currency == self.base:
+            return Decimal(1)
+        try:
+            dates, rates = self.columns[currency]
+        except KeyError:
+            raise MissingRate('No exchange rate for %s' % currency)
+        if date is None:
+            return rates[-1]
+        position = bisect.bisect_right(dates, date)
+        return rates[max(position - 1, 0)]
+
+    def factor(self, source, target, date):
+        """Multiply an amount in ``source`` by this to get ``target``."""
+        if source == target or not source:
+            return Decimal(1)
+        return self.rate(target, date) / self.rate(source, date)
+
+
+_lock = threading.Lock()
+_state = None
+
+
+def version():
+    value = cache.get(VERSION_KEY)
+    if value is None:
+        cache.add(VERSION_KEY, uuid.uuid4().hex, timeout=None)
+        value = cache.get(VERSION_KEY)
+    return value
+
+
+def rate_table():
+    """The current :class:`RateTable`, loaded from the database when stale."""
+    global _state
+    from .models import ExchangeRate
+
+    current = version()
+    state = _state
+    if state is None or state[0] != current:
+        with _lock:
+            state = _state
+            if state is None or state[0] != current:
+                rows = ExchangeRate.objects.order_by('currency', 'date').values_list(
+                    'currency', 'date', 'rate')
+                state = (current, RateTable(rows.iterator(chunk_size=5000),
+                                            settings.EXCHANGE_RATE_BASE))
+                _state = state
+    return state[1]
+
+
+def invalidate():
+    """Make every process reload the rates once the current transaction commits."""
+    def bump():
+        global _state
+        cache.set(VERSION_KEY, uuid.uuid4().hex, timeout=None)
+        _state = None
+    transaction.on_commit(bump)
+
+
+def convert_many(amounts, currencies, dates, target, table=None):
+    """Convert parallel columns of amounts into ``target``.
+
+    ``dates`` may be ``None`` entries (or a shorter list of ``None``) for
+    rows already in the target currency. Raises :class:`MissingRate`.
+    Results are exact ``Decimal`` values, rounded only by :func:`convert_total`
+    or the caller. The rate table is only loaded if some row needs it.
+    """
+    factors = {}
+    converted = []
+    for amount, currency, date in zip(amounts, currencies, dates):
+        if amount is None:
+            converted.append(None)
+            continue
+        if not currency or currency == target:
+            converted.append(to_decimal(amount))
+            continue
+        key = (currency, date)
+        if key not in factors:
+            table = table or rate_table()
+            factors[key] = table.factor(currency, target, date)
+        converted.append(to_decimal(amount) * factors[key])
+    return converted
+
+
+def check_currencies(currencies, target, table=None):
+    """Raise :class:`MissingRate` unless every one of ``currencies`` converts to ``target``.
+
+    Lets a streamed export fail before its first byte rather than halfway.
+    """
+    for currency in currencies:
+        if currency and currency != target:
+            table = table or rate_table()
+            table.factor(currency, target, None)
+
+
+def convert_total(amounts, currencies, dates, target, table=None):
+    """Sum of :func:`convert_many`, rounded to ``target``'s minor unit."""
+    return quantize(sum(convert_many(amounts, currencies, dates, target, table), Decimal(0)),
+                    target)
+
+
+def with_converted(rows, amount_index, currency_index, date_index, target,
+                   chunk_size=2000):
+    """Append the amount converted into ``target`` to each row of ``rows``.
+
+    Rows are taken ``chunk_size`` at a time and each chunk converted in one
+    :func:`convert_many` call, so memory stays flat on a long export.
+    """
+    table = None
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == chunk_size:
+            yield from _converted_chunk(chunk, amount_index, currency_index, date_index,
+                                        target, table)
+            chunk = []
+    yield from _converted_chunk(chunk, amount_index, currency_index, date_index, target, table)
+
+
+def _converted_chunk(chunk, amount_index, currency_index, date_index, target, table):
+    if not chunk:
+        return []
+    amounts = convert_many([row[amount_index] for row in chunk],
+                           [row[currency_index] for row in chunk],
+                           [row[date_index] for row in chunk], target, table)
+    return [tuple(row) + (quantize(amount, target),) for row, amount in zip(chunk, amounts)]
+
+
+def parse_rates(text, format=None):
+    """Yield ``(date, currency, rate)`` from a CSV or JSON rate file.
+
+    CSV has ``date,currency,rate`` columns. JSON maps dates to
+    ``{currency: rate}`` objects. Raises ``ValueError`` naming the bad entry.
+    """
+    format = format or ('json' if text.lstrip().startswith('{') else 'csv')
+    if format == 'json':
+        entries = ((date, currency, rate)
+                   for date, day in json.loads(text).items()
+                   for currency, rate in day.items())
+    else:
+        entries = ((row.get('date', ''), row.get('currency', ''), row.get('rate', ''))
+                   for row in csv.DictReader(io.StringIO(text)))
+    for date, currency, rate in entries:
+        try:
+            date = datetime.date.fromisoformat(str(date).strip())
+            rate = Decimal(str(rate).strip())
+        except (ValueError, InvalidOperation):
+            raise ValueError('Invalid rate entry: %s %s %s' % (date, currency, rate))
+        currency = str(currency).strip().upper()
+        if len(currency) != 3 or not rate.is_finite() or rate <= 0:
+            raise ValueError('Invalid rate entry: %s %s %s' % (date, currency, rate))
+        yield date, currency, rate
+
+
+def import_rates(entries, batch_size=2000):
+    """Insert or replace ``(date, currency, rate)`` entries; returns the count."""
+    from .models import ExchangeRate
+
+    count = 0
+    with transaction.atomic():
+        batch = []
+        for date, currency, rate in entries:
+            batch.append(ExchangeRate(date=date, currency=currency, rate=rate))
+            if len(batch) == batch_size:
+                count += _upsert(ExchangeRate, batch)
+                batch = []
+        count += _upsert(ExchangeRate, batch)
+        invalidate()
+    return count
+
+
+def _upsert(model, batch):
+    if batch:
+        model.objects.bulk_create(batch, update_conflicts=True,
+                                  unique_fields=['currency', 'date'], update_fields=['rate'])
+    return len(batch)
@@ -0,0 +1,111 @@
+"""Send the heavy read-only views to a read replica.
+
+Views marked with :func:`read_from_replica` (analytics, exports, search)
+read the user-data tables from ``DATABASE_REPLICA_ALIAS`` when that
+database is configured; everything else, and every write, uses
+``default``. Lookup tables, exchange rates, users and sessions always come
+from ``default``, so the in-process caches built from them are never
+filled from a lagging copy.
+
+A replica trails the primary, so a user who has just changed their data
+reads it from the primary for ``REPLICA_PIN_SECONDS``: the
+:class:`ReplicaPinMiddleware` sets a cookie after any request that wrote
+to those tables, and a write in the middle of a request sends its
+remaining reads to the primary too.
+
+Never run ``migrate`` against the replica; it follows the primary.
+"""
+import contextvars
+import functools
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+PIN_COOKIE = 'primary_pin'
+
+# The tables the marked views read in bulk, as ``app_label.modelname``.
+REPLICA_MODELS = {
+    'expenses.expense',
+    'expenses.expensesummary',
+    'expenses.dataversion',
+    'expenses.changelog',
+    'userincome.userincome',
+}
+
+_state = contextvars.ContextVar('replica_state', default=None)
+
+
+def replica_alias():
+    """The configured replica alias, or ``None`` when there is none."""
+    alias = settings.DATABASE_REPLICA_ALIAS
+    return alias if alias and alias in connections.settings else None
+
+
+def start_request(pinned):
+    """Reset the routing state for a new request and return it."""
+    state = {'replica': False, 'pinned': pinned, 'wrote': False}
+    _state.set(state)
+    return state
+
+
+def end_request():
+    _state.set(None)
+
+
+def read_from_replica(view):
+    """Let ``view`` read the user-data tables from the replica.
+
+    This holds until the response is closed (``request_finished``) rather
+    than until the view returns, so a streamed body reads from the replica
+    too.
+    """
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        state = _state.get()
+        if state is not None:
+            state['replica'] = True
+        return view(request, *args, **kwargs)
+    return wrapper
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if (state and state['replica'] and not state['pinned'] and not state['wrote']
+                and model._meta.label_lower in REPLICA_MODELS):
+            return replica_alias()
+        return None
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None and model._meta.label_lower in REPLICA_MODELS:
+            state['wrote'] = True
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica holds the same rows as the primary.
+        aliases = {DEFAULT_DB_ALIAS, replica_alias()}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+
+class ReplicaPinMiddleware:
+    """Read a user's data from the primary for a while after they change it."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        try:
+            pinned = float(request.COOKIES.get(PIN_COOKIE, 0)) > time.time()
+        except ValueError:
+            pinned = False
+        state = start_request(pinned)
+        response = self.get_response(request)
+        seconds = settings.REPLICA_PIN_SECONDS
+        if state['wrote'] and seconds > 0 and replica_alias():
+            response.set_cookie(PIN_COOKIE, str(int(time.time()) + seconds), max_age=seconds,
+                                httponly=True, samesite='Lax')
+        return response
@@ -0,0 +1,332 @@
+"""Search over expense-like models (amount, date, description, owner).
+
+Free text is matched with indexes that depend on the database:
+
+* PostgreSQL: a GIN index on a ``simple`` tsvector of the text columns plus
+  pg_trgm GIN indexes, so both word-prefix and substring (ILIKE) matches are
+  indexed. Results are ranked with ts_rank + trigram similarity.
+* SQLite: an external-content FTS5 table kept in sync by triggers, ranked
+  with bm25.
+* Anything else falls back to ``icontains``.
+
+Numbers and dates in the query become ranges on the amount and date columns
+so they can use ordinary B-tree indexes.
+"""
+import datetime
+import json
+import operator
+import re
+from decimal import Decimal
+from functools import reduce
+
+from django.core import signing
+from django.db import connections
+from django.db.models import BooleanField, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Coalesce
+
+NUMBER_RE = re.compile(r'^\d+(?:\.(\d{1,2}))?$')
+COMPARISON_RE = re.compile(r'^(<=|>=|<|>)(\d+(?:\.\d{1,2})?)$')
+RANGE_RE = re.compile(r'^(\d+(?:\.\d{1,2})?)\.\.(\d+(?:\.\d{1,2})?)$')
+DATE_RE = re.compile(r'^(\d{4})(?:-(\d{1,2})(?:-(\d{1,2}))?)?$')
+WORD_RE = re.compile(r'\w+')
+
+_fts_tables = {}
+
+
+def fts_table(table):
+    return table + '_fts'
+
+
+def install_fulltext(schema_editor, table, fields):
+    """Create the full-text indexes for ``table`` over the ``fields`` columns.
+
+    Safe to run again after a migration rebuilt the table (SQLite drops
+    triggers when Django remakes a table).
+    """
+    connection = schema_editor.connection
+    if connection.vendor == 'postgresql':
+        document = " || ' ' || ".join("coalesce(%s, '')" % field for field in fields)
+        schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        schema_editor.execute(
+            'CREATE INDEX IF NOT EXISTS %s_search_idx ON %s '
+            "USING gin (to_tsvector('simple', %s))" % (table, table, document)
+        )
+        for field in fields:
+            schema_editor.execute(
+                'CREATE INDEX IF NOT EXISTS %s_%s_trgm_idx ON %s '
+                'USING gin (%s gin_trgm_ops)' % (table, field, table, field)
+            )
+    elif connection.vendor == 'sqlite':
+        fts = fts_table(table)
+        columns = ', '.join(fields)
+        new_values = ', '.join('new.%s' % field for field in fields)
+        old_values = ', '.join('old.%s' % field for field in fields)
+        delete_old = (
+            "INSERT INTO %s(%s, rowid, %s) VALUES ('delete', old.id, %s);"
+            % (fts, fts, columns, old_values)
+        )
+        insert_new = (
+            'INSERT INTO %s(rowid, %s) VALUES (new.id, %s);' % (fts, columns, new_values)
+        )
+        try:
+            schema_editor.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS %s USING fts5(%s, content='%s', "
+                "content_rowid='id')" % (fts, columns, table)
+            )
+        except Exception:
+            # SQLite built without FTS5; search falls back to icontains.
+            return
+        for suffix in ('ai', 'ad', 'au'):
+            schema_editor.execute('DROP TRIGGER IF EXISTS %s_%s' % (fts, suffix))
+        schema_editor.execute(
+            'CREATE TRIGGER %s_ai AFTER INSERT ON %s BEGIN %s END'
+            % (fts, table, insert_new)
+        )
+        schema_editor.execute(
+            'CREATE TRIGGER %s_ad AFTER DELETE ON %s BEGIN %s END'
+            % (fts, table, delete_old)
+        )
+        schema_editor.execute(
+            'CREATE TRIGGER %s_au AFTER UPDATE ON %s BEGIN %s %s END'
+            % (fts, table, delete_old, insert_new)
+        )
+        schema_editor.execute("INSERT INTO %s(%s) VALUES ('rebuild')" % (fts, fts))
+    _fts_tables.clear()
+
+
+def uninstall_fulltext(schema_editor, table, fields):
+    connection = schema_editor.connection
+    if connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS %s_search_idx' % table)
+        for field in fields:
+            schema_editor.execute('DROP INDEX IF EXISTS %s_%s_trgm_idx' % (table, field))
+    elif connection.vendor == 'sqlite':
+        fts = fts_table(table)
+        for suffix in ('ai', 'ad', 'au'):
+            schema_editor.execute('DROP TRIGGER IF EXISTS %s_%s' % (fts, suffix))
+        schema_editor.execute('DROP TABLE IF EXISTS %s' % fts)
+    _fts_tables.clear()
+
+
+def has_fts_table(alias, table):
+    key = (alias, table)
+    if key not in _fts_tables:
+        with connections[alias].cursor() as cursor:
+            cursor.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s",
+                [fts_table(table)],
+            )
+            _fts_tables[key] = cursor.fetchone() is not None
+    return _fts_tables[key]
+
+
+def _step(decimals):
+    return Decimal(1).scaleb(-len(decimals or ''))
+
+
+def amount_condition(token):
+    """Translate a numeric token into an amount range, or ``None``.
+
+    ``12`` matches 12.00-12.99, ``12.5`` matches 12.50-12.59, ``10..20`` is
+    inclusive and ``>50``/``<=20`` compare directly.
+    """
+    match = NUMBER_RE.match(token)
+    if match:
+        low = Decimal(token)
+        return Q(amount__gte=low, amount__lt=low + _step(match.group(1)))
+    match = RANGE_RE.match(token)
+    if match:
+        return Q(amount__gte=Decimal(match.group(1)), amount__lte=Decimal(match.group(2)))
+    match = COMPARISON_RE.match(token)
+    if match:
+        lookup = {'<': 'lt', '<=': 'lte', '>': 'gt', '>=': 'gte'}[match.group(1)]
+        return Q(**{'amount__' + lookup: Decimal(match.group(2))})
+    return None
+
+
+def date_condition(token):
+    """Translate ``YYYY``, ``YYYY-MM`` or ``YYYY-MM-DD`` into a date range."""
+    match = DATE_RE.match(token)
+    if not match:
+        return None
+    year, month, day = (int(part) if part else None for part in match.groups())
+    try:
+        if day:
+            start = end = datetime.date(year, month, day)
+        elif month:
+            start = datetime.date(year, month, 1)
+            end = (start + datetime.timedelta(days=32)).replace(day=1) - datetime.timedelta(days=1)
+        else:
+            start, end = datetime.date(year, 1, 1), datetime.date(year, 12, 31)
+    except ValueError:
+        return None
+    return Q(date__gte=start, date__lte=end)
+
+
+def related_match(queryset, text, related_fields):
+    """Match ``text`` against columns of small lookup tables, e.g. ``category__name``.
+
+    The lookup table is searched on its own and the result used as an
+    ``IN`` list on the foreign key, so the big table never joins.
+    """
+    conditions = []
+    for path in related_fields:
+        relation, column = path.split('__', 1)
+        related_model = queryset.model._meta.get_field(relation).related_model
+        conditions.append(Q(**{relation + '__in': related_model.objects.filter(
+            **{column + '__icontains': text}).values('pk')}))
+    return reduce(operator.or_, conditions) if conditions else None
+
+
+def text_match(queryset, text, text_fields):
+    """Return ``(condition, rank)`` expressions for a free-text match.
+
+    Plain column names go through the full-text index; ``relation__column``
+    paths are matched with :func:`related_match`.
+    """
+    related = related_match(queryset, text, [f for f in text_fields if '__' in f])
+    condition, rank = column_match(queryset, text, [f for f in text_fields if '__' not in f])
+    if related is not None:
+        condition = condition | related if condition is not None else related
+    return condition, rank
+
+
+def column_match(queryset, text, text_fields):
+    if not text_fields:
+        return None, Value(0.0, output_field=FloatField())
+    words = WORD_RE.findall(text)
+    connection = connections[queryset.db]
+    table = queryset.model._meta.db_table
+
+    if words and connection.vendor == 'postgresql':
+        columns = ['%s.%s' % (table, field) for field in text_fields]
+        document = " || ' ' || ".join("coalesce(%s, '')" % column for column in columns)
+        tsquery = ' & '.join(word + ':*' for word in words)
+        pattern = '%%%s%%' % text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        condition = RawSQL(
+            "(to_tsvector('simple', %s) @@ to_tsquery('simple', %%s) OR %s)" % (
+                document, ' OR '.join('%s ILIKE %%s' % column for column in columns)
+            ),
+            [tsquery] + [pattern] * len(text_fields),
+            output_field=BooleanField(),
+        )
+        rank = RawSQL(
+            "ts_rank(to_tsvector('simple', %s), to_tsquery('simple', %%s)) + %s" % (
+                document, ' + '.join("similarity(coalesce(%s, ''), %%s)" % column
+                                     for column in columns)
+            ),
+            [tsquery] + [text] * len(text_fields),
+            output_field=FloatField(),
+        )
+        return Q(condition), rank
+
+    if words and connection.vendor == 'sqlite' and has_fts_table(queryset.db, table):
+        fts = fts_table(table)
+        match = ' '.join('"%s"*' % word.replace('"', '""') for word in words)
+        condition = Q(pk__in=RawSQL(
+            'SELECT rowid FROM %s WHERE %s MATCH %%s' % (fts, fts), [match]
+        ))
+        rank = RawSQL(
+            '(SELECT -bm25(%s) FROM %s WHERE %s MATCH %%s AND rowid = %s.id)'
+            % (fts, fts, fts, table),
+            [match],
+            output_field=FloatField(),
+        )
+        return condition, rank
+
+    condition = reduce(operator.or_, [Q(**{field + '__icontains': text}) for field in text_fields])
+    return condition, Value(0.0, output_field=FloatField())
+
+
+def search(queryset, text, text_fields):
+    """Filter ``queryset`` by a user search string, best matches first.
+
+    A single token matches if it is a number in the amount range, a date
+    in the date range, or text in any of ``text_fields``. Several tokens
+    narrow each other: every number/date token must match and the
+    remaining words are matched as text. Blank text matches nothing.
+    """
+    text = text.strip()
+    tokens = text.split()
+    rank = Value(0.0, output_field=FloatField())
+
+    if not tokens:
+        return queryset.none()
+    if len(tokens) == 1:
+        text_condition, rank = text_match(queryset, text, text_fields)
+        conditions = [c for c in (amount_condition(text), date_condition(text)) if c]
+        condition = reduce(operator.or_, conditions + [text_condition])
+    else:
+        condition = Q()
+        words = []
+        for token in tokens:
+            parsed = [c for c in (amount_condition(token), date_condition(token)) if c]
+            if parsed:
+                condition &= reduce(operator.or_, parsed)
+            else:
+                words.append(token)
+        if words:
+            text_condition, rank = text_match(queryset, ' '.join(words), text_fields)
+            condition &= text_condition
+
+    return queryset.filter(condition).annotate(
+        rank=Coalesce(rank, Value(0.0, output_field=FloatField()))
+    ).order_by('-rank', '-date', '-id')
+
+
+SEARCH_PAGE_SIZE = 25
+SEARCH_MAX_PAGE_SIZE = 100
+# No search can page further than this many rows.
+SEARCH_RESULT_CAP = 500
+
+
+def search_request(body):
+    """``(text, cursor, limit)`` from a JSON search request body.
+
+    Raises ``ValueError`` unless the body is a JSON object.
+    """
+    try:
+        data = json.loads(body)
+    except ValueError:
+        raise ValueError('Invalid JSON')
+    if not isinstance(data, dict):
+        raise ValueError('Expected a JSON object')
+    text = data.get('searchText')
+    return '' if text is None else str(text), data.get('cursor'), data.get('limit')
+
+
+def search_page(queryset, text, fields, cursor=None, limit=None):
+    """Return one page of search results projected to ``fields``.
+
+    ``cursor`` is the opaque token from a previous page's ``next`` value;
+    it is signed and bound to ``text``, so it cannot be forged or replayed
+    against a different query. Raises ``ValueError`` for a bad cursor.
+    A related column like ``category__name`` is returned under the
+    relation's name (``category``).
+    """
+    salt = 'search:' + text
+    offset = 0
+    if cursor:
+        if not isinstance(cursor, str):
+            raise ValueError('Invalid cursor')
+        try:
+            offset = signing.loads(cursor, salt=salt)
+        except signing.BadSignature:
+            raise ValueError('Invalid cursor')
+
+    try:
+        limit = int(limit or SEARCH_PAGE_SIZE)
+    except (TypeError, ValueError):
+        raise ValueError('Invalid limit')
+    limit = max(1, min(limit, SEARCH_MAX_PAGE_SIZE, SEARCH_RESULT_CAP - offset))
+
+    rows = list(queryset.values(*fields)[offset:offset + limit + 1])
+    has_more = len(rows) > limit and offset + limit < SEARCH_RESULT_CAP
+    rows = [{field.split('__', 1)[0]: value for field, value in row.items()}
+            for row in rows[:limit]]
+    return {
+        'results': rows,
+        'has_more': has_more,
+        'next': signing.dumps(offset + limit, salt=salt) if has_more else None,
+    }
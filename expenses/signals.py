@@ -0,0 +1,92 @@
+from django.core.signals import request_finished
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from userincome.models import Source, UserIncome
+from . import rates, routers
+from .changes import kind_of, record_changes
+from .imports import fingerprint
+from .lookups import invalidate
+from .models import Category, ChangeLog, ExchangeRate, Expense
+from .money import to_decimal, user_currency
+from .summaries import apply_expense
+
+
+@receiver(pre_save, sender=Expense)
+@receiver(pre_save, sender=UserIncome)
+def set_currency(sender, instance, raw=False, **kwargs):
+    if not raw and not instance.currency:
+        instance.currency = user_currency(instance.owner_id)
+
+
+@receiver(pre_save, sender=Expense)
+@receiver(pre_save, sender=UserIncome)
+def set_fingerprint(sender, instance, raw=False, **kwargs):
+    # Runs after set_currency, which fills in the currency it hashes.
+    if not raw:
+        instance.fingerprint = fingerprint(instance.date, instance.amount, instance.currency,
+                                           instance.description)
+
+
+@receiver(pre_save, sender=Expense)
+def remember_previous_expense(sender, instance, raw=False, **kwargs):
+    instance._previous = None
+    if raw or instance.pk is None:
+        return
+    instance._previous = Expense.objects.filter(pk=instance.pk).values(
+        'owner_id', 'date', 'category_id', 'currency', 'amount'
+    ).first()
+
+
+@receiver(post_save, sender=Expense)
+def update_summary_on_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_previous', None)
+    if previous:
+        apply_expense(previous['owner_id'], previous['date'], previous['category_id'],
+                      previous['currency'], -previous['amount'], -1)
+    apply_expense(instance.owner_id, instance.date, instance.category_id, instance.currency,
+                  to_decimal(instance.amount), 1)
+    if previous and previous['owner_id'] != instance.owner_id:
+        # Gone from the previous owner's point of view.
+        record_changes(previous['owner_id'], [('expense', instance.pk, ChangeLog.DELETE)])
+
+
+@receiver(post_delete, sender=Expense)
+def update_summary_on_delete(sender, instance, **kwargs):
+    apply_expense(instance.owner_id, instance.date, instance.category_id, instance.currency,
+                  -to_decimal(instance.amount), -1)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Source)
+@receiver(post_delete, sender=Source)
+def invalidate_lookup_table(sender, **kwargs):
+    invalidate(sender)
+
+
+@receiver(post_save, sender=ExchangeRate)
+@receiver(post_delete, sender=ExchangeRate)
+def invalidate_rate_table(sender, **kwargs):
+    rates.invalidate()
+
+
+@receiver(request_finished)
+def end_replica_reads(sender, **kwargs):
+    routers.end_request()
+
+
+@receiver(post_save, sender=Expense)
+@receiver(post_delete, sender=Expense)
+@receiver(post_save, sender=UserIncome)
+@receiver(post_delete, sender=UserIncome)
+def log_change(sender, instance, signal, raw=False, created=False, **kwargs):
+    if raw:
+        return
+    if signal is post_delete:
+        action = ChangeLog.DELETE
+    else:
+        action = ChangeLog.CREATE if created else ChangeLog.UPDATE
+    record_changes(instance.owner_id, [(kind_of(sender), instance.pk, action)])
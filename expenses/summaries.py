@@ -0,0 +1,79 @@
+import datetime
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum, Value
+from django.db.models.functions import TruncMonth
+
+from .models import Expense, ExpenseSummary
+from .money import MoneyField
+
+
+def month_start(value):
+    """Return the first day of the month containing ``value``."""
+    if isinstance(value, str):
+        value = datetime.date.fromisoformat(value[:10])
+    if isinstance(value, datetime.datetime):
+        value = value.date()
+    return value.replace(day=1)
+
+
+def apply_expense(owner_id, date, category_id, currency, amount, count=1):
+    """Add ``amount``/``count`` to the rollup bucket an expense falls into.
+
+    Removals pass negative values; a bucket that drops to zero expenses is
+    deleted, and a removal never creates a bucket.
+    """
+    bucket = ExpenseSummary.objects.filter(
+        owner_id=owner_id, month=month_start(date), category_id=category_id,
+        currency=currency or ''
+    )
+    delta = Value(amount, output_field=MoneyField())
+    updated = bucket.update(total=F('total') + delta, count=F('count') + count)
+
+    if not updated and count > 0:
+        try:
+            with transaction.atomic():
+                ExpenseSummary.objects.create(
+                    owner_id=owner_id,
+                    month=month_start(date),
+                    category_id=category_id,
+                    currency=currency or '',
+                    total=amount,
+                    count=count,
+                )
+        except IntegrityError:
+            # Another request created the bucket first.
+            bucket.update(total=F('total') + delta, count=F('count') + count)
+    elif count < 0:
+        bucket.filter(count__lte=0).delete()
+
+
+def rebuild_expense_summaries(owner=None):
+    """Recompute the rollup table from raw expenses, optionally for one user."""
+    expenses = Expense.objects.all()
+    summaries = ExpenseSummary.objects.all()
+    if owner is not None:
+        expenses = expenses.filter(owner=owner)
+        summaries = summaries.filter(owner=owner)
+
+    rows = expenses.order_by().annotate(month=TruncMonth('date')).values(
+        'owner_id', 'month', 'category_id', 'currency'
+    ).annotate(amount=Sum('amount'), entries=Count('id'))
+
+    buckets = {}
+    for row in rows:
+        key = (row['owner_id'], row['month'], row['category_id'], row['currency'])
+        total, count = buckets.get(key, (0, 0))
+        buckets[key] = (total + row['amount'], count + row['entries'])
+
+    with transaction.atomic():
+        summaries.delete()
+        ExpenseSummary.objects.bulk_create(
+            [
+                ExpenseSummary(owner_id=owner_id, month=month, category_id=category_id,
+                               currency=currency, total=total, count=count)
+                for (owner_id, month, category_id, currency), (total, count) in buckets.items()
+            ],
+            batch_size=1000,
+        )
+    return len(buckets)
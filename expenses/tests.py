@@ -1,3 +1,1578 @@
-from django.test import TestCase
+import datetime
+import io
+import json
+import os
+import re
+import tempfile
+import time
+import zipfile
+from decimal import Decimal
+from unittest import mock
+from xml.etree import ElementTree
 
-# Create your tests here.
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache, caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.db.models import Q, Sum
+from django.test import TestCase as BaseTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from userincome.models import Source, UserIncome
+from userpreferences.models import UserPreferences
+from . import analytics, search as search_module, xlsx
+from .aggregation import bucketed_totals, cash_flow, grouped_totals
+from .artifacts import evict
+from .changes import compact
+from .checks import check_shared_cache
+from .dbpool import summarize
+from .imports import StatementError, fingerprint, import_statement, named, parse_amount
+from .lookups import LookupTable, categories, table
+from .pagination import KeysetPaginator
+from .jobs import submit_export
+from .models import Category, ChangeLog, DataVersion, Expense, ExpenseSummary, ExportJob
+from .money import quantize
+from .rates import MissingRate, convert_many, import_rates, parse_rates, rate_table
+from .routers import PIN_COOKIE, REPLICA_MODELS, ReplicaRouter
+from .search import amount_condition, date_condition, search, search_page
+from .summaries import month_start, rebuild_expense_summaries
+from .versions import current_version
+
+
+class TestCase(BaseTestCase):
+    def _pre_setup(self):
+        super()._pre_setup()
+        # Lookup tables are cached per process and the rows they hold roll
+        # back with each test; a new version makes the next test reload them.
+        # Data versions roll back too, so cached analytics must go as well.
+        for backend in caches.all():
+            backend.clear()
+
+
+def category(name):
+    return named(Category, name)
+
+
+def source(name):
+    return named(Source, name)
+
+
+def create_expenses(owner, count, start=None):
+    start = start or datetime.date.today()
+    categories = [category(name) for name in ('Food', 'Rent', 'Travel')]
+    for i in range(count):
+        Expense.objects.create(
+            owner=owner,
+            amount=i + 1,
+            date=start - datetime.timedelta(days=i % 90),
+            description='expense %d' % i,
+            category=categories[i % len(categories)],
+        )
+
+
+class ExpenseSummaryTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user('alice', password='secret')
+        self.bob = User.objects.create_user('bob', password='secret')
+        self.food, self.rent = category('Food'), category('Rent')
+
+    def add(self, amount, date, category, owner=None):
+        return Expense.objects.create(owner=owner or self.alice, amount=amount, date=date,
+                                      description='x', category=category)
+
+    def rollups(self):
+        return sorted(ExpenseSummary.objects.values_list(
+            'owner__username', 'month', 'category__name', 'currency', 'total', 'count'))
+
+    def assertMatchesRebuild(self):
+        live = self.rollups()
+        rebuild_expense_summaries()
+        self.assertEqual(live, self.rollups())
+        return live
+
+    def test_rollups_follow_edits_and_deletes(self):
+        moved = self.add(10, '2025-01-05', self.food)
+        kept = self.add(5, '2025-01-20', self.food)
+        deleted = self.add(7, '2025-02-03', self.rent)
+        self.add(1, '2025-02-04', self.rent, owner=self.bob)
+
+        moved.amount = 12
+        moved.save()
+        self.assertMatchesRebuild()
+        moved.category = self.rent
+        moved.save()
+        self.assertMatchesRebuild()
+        moved.date = datetime.date(2025, 3, 1)
+        moved.save()
+        self.assertMatchesRebuild()
+        moved.owner = self.bob
+        moved.save()
+        self.assertMatchesRebuild()
+        deleted.delete()
+        kept.delete()
+
+        january, february, march = (datetime.date(2025, m, 1) for m in (1, 2, 3))
+        self.assertEqual(self.assertMatchesRebuild(), [
+            ('bob', february, 'Rent', 'USD', Decimal('1.00'), 1),
+            ('bob', march, 'Rent', 'USD', Decimal('12.00'), 1),
+        ])
+        self.assertFalse(ExpenseSummary.objects.filter(owner=self.alice, month=january).exists())
+
+    def test_rebuild_command(self):
+        self.add(10, '2025-01-05', self.food)
+        self.add(3, '2025-01-06', self.food, owner=self.bob)
+        expected = self.rollups()
+        ExpenseSummary.objects.update(total=0, count=99)
+
+        out = io.StringIO()
+        call_command('rebuild_expense_summaries', user='alice', stdout=out)
+        self.assertIn('Rebuilt 1 expense summary rows', out.getvalue())
+        self.assertEqual(ExpenseSummary.objects.get(owner=self.bob).count, 99)
+        call_command('rebuild_expense_summaries', stdout=io.StringIO())
+        self.assertEqual(self.rollups(), expected)
+
+        with self.assertRaises(CommandError):
+            call_command('rebuild_expense_summaries', user='nobody', stdout=io.StringIO())
+
+
+class KeysetPaginatorTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('alice', password='secret')
+        food = category('Food')
+        # Several rows share a date, so pages split inside a day.
+        for day in (5, 5, 5, 4, 4, 3, 3, 3):
+            Expense.objects.create(owner=self.user, amount=1, date=datetime.date(2025, 1, day),
+                                   description='x', category=food)
+        self.expected = list(Expense.objects.filter(owner=self.user).order_by(
+            '-date', '-id').values_list('id', flat=True))
+        self.paginator = KeysetPaginator(Expense.objects.filter(owner=self.user), 3)
+
+    def ids(self, page):
+        return [row.id for row in page]
+
+    def test_next_previous_next_round_trip(self):
+        pages = [self.paginator.get_page()]
+        while pages[-1].has_next:
+            pages.append(self.paginator.get_page(pages[-1].next_cursor))
+        forward = [self.ids(page) for page in pages]
+        self.assertEqual(sum(forward, []), self.expected)
+        self.assertEqual([len(ids) for ids in forward], [3, 3, 2])
+        self.assertFalse(pages[0].has_previous)
+
+        page, backward = pages[-1], []
+        while page.has_previous:
+            page = self.paginator.get_page(page.previous_cursor)
+            backward.append(self.ids(page))
+        self.assertEqual(backward, forward[-2::-1])
+
+        page = self.paginator.get_page(pages[1].previous_cursor)
+        self.assertEqual(self.ids(self.paginator.get_page(page.next_cursor)), forward[1])
+
+    def test_malformed_cursor_gives_the_first_page(self):
+        first = self.ids(self.paginator.get_page())
+        for cursor in ('not-a-cursor', '', 'eHx5fHo', KeysetPaginator.encode_cursor(
+                'c', date=datetime.date(2025, 1, 1), pk=1)):
+            self.assertEqual(self.ids(self.paginator.get_page(cursor)), first, cursor)
+
+    def test_cursor_past_either_end_links_back(self):
+        last = self.expected[-1]
+        beyond = self.paginator.get_page(KeysetPaginator.encode_cursor(
+            'a', Expense.objects.get(pk=last)))
+        self.assertEqual((len(beyond), beyond.has_next, beyond.has_previous), (0, False, True))
+        self.assertEqual(self.ids(self.paginator.get_page(beyond.previous_cursor)),
+                         self.expected[-3:])
+
+        before = self.paginator.get_page(KeysetPaginator.encode_cursor(
+            'b', Expense.objects.get(pk=self.expected[0])))
+        self.assertEqual((len(before), before.has_next, before.has_previous), (0, True, False))
+        self.assertEqual(self.ids(self.paginator.get_page(before.next_cursor)), self.expected[:3])
+
+
+class GroupedTotalsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('alice', password='secret')
+
+    def test_groups_and_totals_in_one_query(self):
+        create_expenses(self.user, 6)
+        categories()
+        with self.assertNumQueries(1):
+            summary = grouped_totals(Expense.objects.filter(owner=self.user), 'category',
+                                     labels=Category)
+
+        self.assertEqual(summary['groups'], {'Food': 5, 'Rent': 7, 'Travel': 9})
+        self.assertEqual(summary['counts'], {'Food': 2, 'Rent': 2, 'Travel': 2})
+        self.assertEqual(summary['total'], 21)
+        self.assertEqual(summary['count'], 6)
+
+    def test_date_window(self):
+        today = datetime.date.today()
+        create_expenses(self.user, 3)
+        summary = grouped_totals(
+            Expense.objects.filter(owner=self.user), 'category',
+            start=today - datetime.timedelta(days=1), end=today, labels=Category
+        )
+        self.assertEqual(summary['groups'], {'Food': 1, 'Rent': 2})
+
+    def test_income_sources(self):
+        for amount, name in [(100, 'Salary'), (50, 'Salary'), (20, 'Gift')]:
+            UserIncome.objects.create(owner=self.user, amount=amount, description='x',
+                                      source=source(name))
+        with self.assertNumQueries(2):
+            summary = grouped_totals(UserIncome.objects.filter(owner=self.user), 'source',
+                                     labels=Source)
+        self.assertEqual(summary['groups'], {'Gift': 20, 'Salary': 150})
+
+
+class BucketedTotalsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('alice', password='secret')
+        for amount, date, name in [(10, '2025-01-15', 'Food'), (5, '2025-01-20', 'Rent'),
+                                   (7, '2025-03-02', 'Food'), (1, '2025-07-01', 'Food')]:
+            Expense.objects.create(owner=self.user, amount=amount, date=date,
+                                   description='x', category=category(name))
+
+    def test_fills_empty_buckets(self):
+        with self.assertNumQueries(1):
+            data = bucketed_totals(Expense.objects.filter(owner=self.user), 'month',
+                                   datetime.date(2025, 1, 1), datetime.date(2025, 4, 30))
+        self.assertEqual(data['periods'], ['2025-01-01', '2025-02-01', '2025-03-01', '2025-04-01'])
+        self.assertEqual(data['totals'], [15, 0, 7, 0])
+
+    def test_quarter_breakdown(self):
+        data = bucketed_totals(Expense.objects.filter(owner=self.user), 'quarter',
+                               datetime.date(2025, 1, 1), datetime.date(2025, 12, 31),
+                               breakdown='category', labels=Category)
+        self.assertEqual(data['totals'], [22, 0, 1, 0])
+        self.assertEqual(data['series'], {'Food': [17, 0, 1, 0], 'Rent': [5, 0, 0, 0]})
+
+    def test_week_buckets_start_on_monday(self):
+        data = bucketed_totals(Expense.objects.filter(owner=self.user), 'week',
+                               datetime.date(2025, 1, 15), datetime.date(2025, 1, 26))
+        self.assertEqual(data['periods'], ['2025-01-13', '2025-01-20'])
+        self.assertEqual(data['totals'], [10, 5])
+
+    def test_endpoint_rejects_bad_granularity(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('expense-timeseries'), {'granularity': 'hour'})
+        self.assertEqual(response.status_code, 400)
+
+
+class SummaryQueryCountTests(TestCase):
+    # Session and user lookups for an authenticated request, then the data
+    # version behind the ETag.
+    AUTH_QUERIES = 3
+
+    def setUp(self):
+        self.user = User.objects.create_user('alice', password='secret')
+        self.client.force_login(self.user)
+        create_expenses(self.user, 0)
+        categories()
+
+    def assertConstantQueries(self, url_name, expected):
+        for count in (3, 60):
+            create_expenses(self.user, count)
+            with self.assertNumQueries(self.AUTH_QUERIES + expected):
+                response = self.client.get(reverse(url_name))
+            self.assertEqual(response.status_code, 200)
+
+    def test_expense_category_summary(self):
+        self.assertConstantQueries('expense-category-summary', 1)
+
+    def test_monthly_expense_summary(self):
+        self.assertConstantQueries('monthly-expense-summary', 1)
+
+    def test_expense_timeseries(self):
+        self.assertConstantQueries('expense-timeseries', 1)
+
+    def test_cash_flow(self):
+        self.assertConstantQueries('cash-flow', 1)
+
+    def test_category_summary_matches_raw_rows(self):
+        create_expenses(self.user, 30)
+        response = self.client.get(reverse('expense-category-summary'))
+        expected = grouped_totals(Expense.objects.filter(owner=self.user), 'category',
+                                  labels=Category)
+        self.assertEqual(response.json()['expense_category_data'], expected['groups'])
+
+
+class QueryPlanTests(TestCase):
+    """EXPLAIN every query an endpoint runs and fail on a full table scan."""
+
+    TABLES = ('expenses_expense', 'expenses_expensesummary', 'userincome_userincome')
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('alice', password='secret')
+        other = User.objects.create_user('bob', password='secret')
+        UserPreferences.objects.create(user=cls.user, currency='USD - United States Dollar')
+        today = datetime.date.today()
+        categories = [category(name) for name in ('Food', 'Rent', 'Travel', 'Bills')]
+        salary = source('Salary')
+        for owner in (cls.user, other):
+            Expense.objects.bulk_create([
+                Expense(owner=owner, amount=i % 97, date=today - datetime.timedelta(days=i),
+                        description='expense %d' % i, category=categories[i % 4])
+                for i in range(400)
+            ])
+            UserIncome.objects.bulk_create([
+                UserIncome(owner=owner, amount=i % 97, date=today - datetime.timedelta(days=i),
+                           description='income %d' % i, source=salary)
+                for i in range(400)
+            ])
+        rebuild_expense_summaries()
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        if connection.vendor == 'postgresql':
+            # Small tables make a sequential scan cheapest; check that an
+            # index path exists rather than what the planner prefers.
+            with connection.cursor() as cursor:
+                cursor.execute('SET enable_seqscan = off')
+
+    def full_scans(self, plan):
+        if connection.vendor == 'postgresql':
+            pattern = r'Seq Scan on (%s)\b' % '|'.join(self.TABLES)
+        else:
+            pattern = r'\bSCAN (%s)\b(?! USING (COVERING )?INDEX)' % '|'.join(self.TABLES)
+        return re.findall(pattern, plan)
+
+    def assertIndexedPlans(self, method, url_name, data=None, **kwargs):
+        with CaptureQueriesContext(connection) as captured:
+            if method == 'post':
+                response = self.client.post(reverse(url_name), json.dumps(data),
+                                            content_type='application/json')
+            else:
+                response = self.client.get(reverse(url_name), data or {}, **kwargs)
+        self.assertLess(response.status_code, 400)
+
+        checked = 0
+        for query in captured.captured_queries:
+            sql = query['sql']
+            if not sql.startswith('SELECT') or not any(t in sql for t in self.TABLES):
+                continue
+            prefix = 'EXPLAIN ' if connection.vendor == 'postgresql' else 'EXPLAIN QUERY PLAN '
+            with connection.cursor() as cursor:
+                cursor.execute(prefix + sql)
+                plan = '\n'.join(' '.join(str(col) for col in row) for row in cursor.fetchall())
+            self.assertEqual(self.full_scans(plan), [], '%s\n%s' % (sql, plan))
+            checked += 1
+        self.assertGreater(checked, 0)
+
+    def test_expense_list(self):
+        self.assertIndexedPlans('get', 'expenses', {'page': 3})
+
+    def test_expense_list_keyset(self):
+        self.assertIndexedPlans('get', 'expenses', {'cursor': ''})
+
+    def test_income_list(self):
+        self.assertIndexedPlans('get', 'income', {'page': 3})
+
+    def test_expense_category_summary(self):
+        self.assertIndexedPlans('get', 'expense-category-summary')
+
+    def test_monthly_expense_summary(self):
+        self.assertIndexedPlans('get', 'monthly-expense-summary')
+
+    def test_expense_timeseries(self):
+        self.assertIndexedPlans('get', 'expense-timeseries',
+                                {'granularity': 'week', 'breakdown': 'category'})
+
+    def test_income_timeseries(self):
+        self.assertIndexedPlans('get', 'income-timeseries', {'breakdown': 'source'})
+
+    def test_cash_flow(self):
+        self.assertIndexedPlans('get', 'cash-flow', {'granularity': 'week'})
+
+    def test_income_source_summary(self):
+        self.assertIndexedPlans('get', 'income-source-summary')
+
+    def test_dashboard(self):
+        self.assertIndexedPlans('get', 'dashboard')
+
+    def test_search_amount(self):
+        self.assertIndexedPlans('post', 'search-expenses', {'searchText': '>50'})
+
+    def test_search_date_and_text(self):
+        self.assertIndexedPlans('post', 'search-expenses', {'searchText': '2025 expense'})
+
+    def test_search_income(self):
+        self.assertIndexedPlans('post', 'search-income', {'searchText': 'income'})
+
+
+class ConditionalGetTests(TestCase):
+    URL_NAMES = ('expense-category-summary', 'monthly-expense-summary', 'expense-timeseries',
+                 'cash-flow', 'dashboard', 'expenses', 'income', 'income-timeseries',
+                 'income-source-summary')
+
+    def setUp(self):
+        self.user = User.objects.create_user('alice', password='secret')
+        self.client.force_login(self.user)
+        UserPreferences.objects.create(user=self.user, currency='USD - United States Dollar')
+        create_expenses(self.user, 3)
+        categories()
+        table(Source).all()
+
+    def test_matching_etag_skips_the_view(self):
+        for url_name in self.URL_NAMES:
+            # The first page sets the CSRF cookie that pages put in their ETag.
+            self.client.get(reverse(url_name))
+            response = self.client.get(reverse(url_name))
+            self.assertEqual(response.status_code, 200)
+            self.assertIn('private', response['Cache-Control'])
+            # HTML pages validate on the ETag alone.
+            self.assertEqual('Last-Modified' in response, url_name not in ('expenses', 'income'))
+            # Session, user and the data version; no aggregation.
+            with self.assertNumQueries(3):
+                repeat = self.client.get(reverse(url_name), HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(repeat.status_code, 304, url_name)
+
+    def test_login_invalidates_pages(self):
+        self.client.logout()
+        credentials = {'username': 'alice', 'password': 'secret'}
+        self.client.post(reverse('login'), credentials)
+        self.assertContains(self.client.get(reverse('expenses')), 'Welcome')
+        etag = self.client.get(reverse('expenses'))['ETag']
+        self.assertEqual(
+            self.client.get(reverse('expenses'), HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.client.post(reverse('logout'))
+        self.client.post(reverse('login'), credentials)
+        # The flash message is pending and login rotated the CSRF token.
+        response = self.client.get(reverse('expenses'), HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, 'Welcome')
+        response = self.client.get(reverse('expenses'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_writes_and_preferences_change_the_etag(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            import_rates(parse_rates(RATES_CSV))
+        etag = self.client.get(reverse('dashboard'))['ETag']
+        create_expenses(self.user, 1)
+        response = self.client.get(reverse('dashboard'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+        etag = response['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            preferences = UserPreferences.objects.get(user=self.user)
+            preferences.currency = 'EUR - Euro'
+            preferences.save()
+        response = self.client.get(reverse('dashboard'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+
+class AnalyticsCacheTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('alice', password='secret')
+        self.client.force_login(self.user)
+        UserPreferences.objects.create(user=self.user, currency='USD - United States Dollar')
+        create_expenses(self.user, 3)
+        categories()
+        analytics.reset_stats()
+
+    def test_repeat_render_is_one_cache_read(self):
+        first = self.client.get(reverse('expense-timeseries'), {'granularity': 'week'})
+        self.assertEqual(first['X-Analytics-Cache'], 'miss')
+        # Session, user and the data version; the payload is one cache read.
+        with self.assertNumQueries(3):
+            repeat = self.client.get(reverse('expense-timeseries'), {'granularity': 'week'})
+        self.assertEqual(repeat['X-Analytics-Cache'], 'hit')
+        self.assertEqual(repeat.content, first.content)
+
+        other = self.client.get(reverse('expense-timeseries'), {'granularity': 'day'})
+        self.assertEqual(other['X-Analytics-Cache'], 'miss')
+        self.assertEqual(analytics.stats()['endpoints']['expenses.expense_timeseries'],
+                         {'hits': 1, 'misses': 2})
+
+    def test_write_moves_to_a_new_key(self):
+        self.client.get(reverse('dashboard'))
+        create_expenses(self.user, 1)
+        response = self.client.get(reverse('dashboard'))
+        self.assertEqual(response['X-Analytics-Cache'], 'miss')
+        self.assertEqual(response.json()['expenses']['total'],
+                         float(Expense.objects.aggregate(total=Sum('amount'))['total']))
+
+    def test_errors_are_not_cached(self):
+        for _ in range(2):
+            response = self.client.get(reverse('expense-timeseries'), {'granularity': 'hour'})
+            self.assertEqual(response.status_code, 400)
+        self.assertEqual(analytics.stats()['hits'], 0)
+
+    def test_users_do_not_share_entries(self):
+        self.client.get(reverse('dashboard'))
+        other = User.objects.create_user('bob', password='secret')
+        self.client.force_login(other)
+        response = self.client.get(reverse('dashboard'))
+        self.assertEqual(response['X-Analytics-Cache'], 'miss')
+        self.assertEqual(response.json()['expenses']['total'], 0)
+
+    def test_file_backend(self):
+        with tempfile.TemporaryDirectory() as location:
+            backends = dict(settings.CACHES, analytics=dict(
+                settings.CACHES['analytics'],
+                BACKEND='django.core.cache.backends.filebased.FileBasedCache', LOCATION=location))
+            with override_settings(CACHES=backends):
+                first = self.client.get(reverse('dashboard'))
+                self.assertTrue(os.listdir(location))
+                repeat = self.client.get(reverse('dashboard'))
+        self.assertEqual((first['X-Analytics-Cache'], repeat['X-Analytics-Cache']), ('miss', 'hit'))
+        self.assertEqual(repeat.content, first.content)
+
+    def test_status_is_staff_only(self):
+        self.client.get(reverse('dashboard'))
+        self.client.get(reverse('dashboard'))
+        self.assertEqual(self.client.get(reverse('analytics-cache')).status_code, 403)
+        self.user.is_staff = True
+        self.user.save()
+        stats = self.client.get(reverse('analytics-cache')).json()['stats']
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+        self.assertEqual(stats['endpoints']['expenses.dashboard'], {'hits': 1, 'misses': 1})
+
+
+class CashFlowTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('alice', password='secret')
+        self.client.force_login(self.user)
+        UserPreferences.objects.create(user=self.user, currency='USD - United States Dollar')
+        salary, gift = source('Salary'), source('Gift')
+        for amount, date, name in [(100, '2025-01-10', 'Salary'), (100, '2025-03-10', 'Salary'),
+                                   (20, '2025-03-20', 'Gift')]:
+            UserIncome.objects.create(owner=self.user, amount=amount, date=date,
+                                      description='x', source=salary if name == 'Salary' else gift)
+        for amount, date in [(30, '2025-01-15'), (50, '2025-01-20'), (150, '2025-03-01')]:
+            Expense.objects.create(owner=self.user, amount=amount, date=date,
+                                   description='x', category=category('Food'))
+
+    def flow(self, **kwargs):
+        return cash_flow(UserIncome.objects.filter(owner=self.user),
+                         Expense.objects.filter(owner=self.user), 'month',
+                         datetime.date(2025, 1, 1), datetime.date(2025, 4, 30), **kwargs)
+
+    def test_income_expenses_and_running_balance(self):
+        with self.assertNumQueries(1):
+            data = self.flow()
+        self.assertEqual(data['periods'], ['2025-01-01', '2025-02-01', '2025-03-01', '2025-04-01'])
+        self.assertEqual(data['income'], [100, 0, 120, 0])
+        self.assertEqual(data['expenses'], [80, 0, 150, 0])
+        self.assertEqual(data['net'], [20, 0, -30, 0])
+        self.assertEqual(data['balance'], [20, 20, -10, -10])
+
+    def test_foreign_rows_convert_at_their_own_rate(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            import_rates(parse_rates(RATES_CSV))
+        UserIncome.objects.create(owner=self.user, amount=10, currency='EUR', date='2025-02-03',
+                                  description='x', source=source('Gift'))
+        Expense.objects.create(owner=self.user, amount=8, currency='EUR', date='2025-03-03',
+                               description='x', category=category('Food'))
+        data = self.flow(convert_to='USD')
+        # 10 EUR at 0.5 in February, 8 EUR at 0.8 in March.
+        self.assertEqual(data['income'], [100, 20, 120, 0])
+        self.assertEqual(data['expenses'], [80, 0, 160, 0])
+        self.assertEqual(data['balance'], [20, 40, 0, 0])
+
+    def test_endpoints(self):
+        response = self.client.get(reverse('cash-flow'), {
+            'start': '2025-01-01', 'end': '2025-03-31', 'granularity': 'quarter'})
+        self.assertEqual(response.json()['net'], [-10])
+        self.assertEqual(response.json()['currency'], 'USD')
+        self.assertEqual(self.client.get(reverse('cash-flow'), {'granularity': 'hour'}).status_code,
+                         400)
+
+        UserIncome.objects.create(owner=self.user, amount=15, date=datetime.date.today(),
+                                  description='x', source=source('Gift'))
+        response = self.client.get(reverse('income-source-summary'))
+        self.assertEqual(response.json()['income_sources_data'], {'Gift': 15})
+
+
+class DashboardTests(TestCase):
+    # Session and user lookups, then the user's data version.
+    CACHE_HIT_QUERIES = 3
+
+    def setUp(self):
+        self.user = User.objects.create_user('alice', password='secret')
+        self.client.force_login(self.user)
+        UserPreferences.objects.create(user=self.user, currency='USD - United States Dollar')
+        today = datetime.date.today()
+        for amount, name in [(30, 'Food'), (50, 'Rent'), (5, 'Food'), (1, 'Bills')]:
+            Expense.objects.create(owner=self.user, amount=amount, date=today,
+                                   description='x', category=category(name))
+        UserIncome.objects.create(owner=self.user, amount=200, date=today, description='x',
+                                  source=source('Salary'))
+        categories()
+        table(Source).all()
+
+    def test_one_query_then_cached(self):
+        with self.assertNumQueries(self.CACHE_HIT_QUERIES + 1):
+            data = self.client.get(reverse('dashboard')).json()
+        self.assertEqual(data['expenses']['categories'], {'Bills': 1, 'Food': 35, 'Rent': 50})
+        self.assertEqual(data['expenses']['top_categories'][0], {'name': 'Rent', 'total': 50})
+        self.assertEqual(data['expenses']['monthly'][-1], 86)
+        self.assertEqual(data['income']['sources'], {'Salary': 200})
+        self.assertEqual(data['net'], 114)
+        self.assertEqual(len(data['months']), len(data['income']['monthly']))
+
+        with self.assertNumQueries(self.CACHE_HIT_QUERIES):
+            self.assertEqual(self.client.get(reverse('dashboard')).json(), data)
+
+    def test_write_refreshes_payload(self):
+        self.client.get(reverse('dashboard'))
+        Expense.objects.create(owner=self.user, amount=14, date=datetime.date.today(),
+                               description='x', category=category('Food'))
+        data = self.client.get(reverse('dashboard')).json()
+        self.assertEqual(data['expenses']['total'], 100)
+        self.assertEqual(data['net'], 100)
+
+
+@override_settings(EXPORT_ROOT=tempfile.mkdtemp(), EXPORT_CACHE_ROOT=tempfile.mkdtemp(),
+                   EXPORT_BACKGROUND_ROWS=10)
+class ExportJobTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('alice', password='secret')
+        self.client.force_login(self.user)
+
+    def test_pdf_export_is_queued(self):
+        response = self.client.get(reverse('export-pdf'))
+        job = ExportJob.objects.get(owner=self.user)
+        self.assertRedirects(response, reverse('export-job', args=[job.id]))
+        self.assertEqual((job.kind, job.format, job.status), ('expenses', 'pdf', ExportJob.QUEUED))
+
+    def test_small_csv_export_streams(self):
+        create_expenses(self.user, 5)
+        response = self.client.get(reverse('export-csv'))
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(ExportJob.objects.exists())
+
+    def test_large_csv_export_runs_in_worker(self):
+        create_expenses(self.user, 20)
+        response = self.client.get(reverse('export-csv'))
+        job = ExportJob.objects.get(owner=self.user)
+        self.assertRedirects(response, reverse('export-job', args=[job.id]))
+
+        status = self.client.get(reverse('export-job-status', args=[job.id])).json()
+        self.assertEqual((status['status'], status['download_url']), (ExportJob.QUEUED, None))
+
+        call_command('run_export_worker', once=True, stdout=io.StringIO())
+        status = self.client.get(reverse('export-job-status', args=[job.id])).json()
+        self.assertEqual(status['status'], ExportJob.DONE)
+
+        response = self.client.get(status['download_url'])
+        content = b''.join(response.streaming_content).decode()
+        self.assertIn('Rows exported,20', content)
+
+    def test_jobs_are_private(self):
+        job = submit_export(self.user, 'expenses', 'csv', {})
+        other = User.objects.create_user('bob', password='secret')
+        self.client.force_login(other)
+        response = self.client.get(reverse('export-job-status', args=[job.id]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_submit_api(self):
+        response = self.client.post(reverse('export-submit'), json.dumps(
+            {'kind': 'income', 'format': 'xlsx', 'start': '2025-01-01'}
+        ), content_type='application/json')
+        self.assertEqual(response.status_code, 202)
+        job = ExportJob.objects.get(pk=response.json()['id'])
+        self.assertEqual(job.params, {'start': '2025-01-01'})
+
+        response = self.client.post(reverse('export-submit'), json.dumps(
+            {'kind': 'income', 'format': 'xlsx', 'start': 'yesterday'}
+        ), content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        for body in ('{"kind":', '["income", "xlsx"]'):
+            response = self.client.post(reverse('export-submit'), body,
+                                        content_type='application/json')
+            self.assertEqual(response.status_code, 400)
+
+    def test_submit_api_rejects_non_string_fields(self):
+        for params in ({'kind': 'expenses', 'format': 'csv', 'start': 20250101},
+                       {'kind': 'expenses', 'format': 'csv', 'end': ['2025-01-01']},
+                       {'kind': 'expenses', 'format': 'csv', 'category': {'name': 'Food'}},
+                       {'kind': ['expenses'], 'format': 'csv'},
+                       {'kind': 'expenses', 'format': {'csv': True}}):
+            response = self.client.post(reverse('export-submit'), json.dumps(params),
+                                        content_type='application/json')
+            self.assertEqual(response.status_code, 400, params)
+        self.assertFalse(ExportJob.objects.exists())
+
+    def test_stale_running_jobs_fail(self):
+        stale = submit_export(self.user, 'expenses', 'csv', {})
+        fresh = submit_export(self.user, 'income', 'csv', {})
+        ExportJob.objects.filter(pk=stale.pk).update(
+            status=ExportJob.RUNNING, started_at=timezone.now() - datetime.timedelta(hours=2))
+        ExportJob.objects.filter(pk=fresh.pk).update(
+            status=ExportJob.RUNNING, started_at=timezone.now())
+
+        call_command('run_export_worker', once=True, stdout=io.StringIO())
+        stale.refresh_from_db()
+        fresh.refresh_from_db()
+        self.assertEqual((stale.status, fresh.status), (ExportJob.FAILED, ExportJob.RUNNING))
+        self.assertIsNotNone(stale.finished_at)
+
+
+def read_workbook(data):
+    """The sheet titles and each sheet's rows of (type, style, text) cells."""
+    namespace = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+    with zipfile.ZipFile(io.BytesIO(data)) as workbook:
+        index = ElementTree.fromstring(workbook.read('xl/workbook.xml'))
+        titles = [sheet.get('name') for sheet in index.iter(namespace + 'sheet')]
+        sheets = {}
+        for number, title in enumerate(titles, 1):
+            root = ElementTree.fromstring(workbook.read('xl/worksheets/sheet%d.xml' % number))
+            sheets[title] = [
+                [(c.get('t', 'n'), c.get('s', '0'), ''.join(c.itertext())) for c in row]
+                for row in root.iter(namespace + 'row')
+            ]
+        styles = ElementTree.fromstring(workbook.read('xl/styles.xml'))
+    return titles, sheets, styles
+
+
+class XlsxTests(TestCase):
+    def test_cell_types_and_header_style(self):
+        data = b''.join(xlsx.stream_workbook([('Expenses', ['Amount', 'Date', 'Description'], [
+            (Decimal('1.50'), datetime.date(2025, 1, 2), 'tea & <cake>\x01'),
+            (3, None, 'coffee'),
+        ])]))
+        titles, sheets, styles = read_workbook(data)
+        self.assertEqual(titles, ['Expenses'])
+        header, first, second = sheets['Expenses']
+        self.assertEqual(header, [('inlineStr', '2', 'Amount'), ('inlineStr', '2', 'Date'),
+                                  ('inlineStr', '2', 'Description')])
+        self.assertEqual(first, [('n', '0', '1.50'), ('n', '1', '45659'),
+                                 ('inlineStr', '0', 'tea & <cake>')])
+        # Empty cells are left out.
+        self.assertEqual(second, [('n', '0', '3'), ('inlineStr', '0', 'coffee')])
+
+        namespace = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+        formats = list(styles.find(namespace + 'cellXfs'))
+        fonts = list(styles.find(namespace + 'fonts'))
+        self.assertEqual(formats[1].get('numFmtId'), '14')
+        self.assertIsNotNone(fonts[int(formats[2].get('fontId'))].find(namespace + 'b'))
+
+    def test_long_sheets_continue_on_new_sheets(self):
+        header = ['Amount']
+        # Three rows a sheet: the header and two data rows.
+        with mock.patch.object(xlsx, 'MAX_ROWS', 3):
+            data = b''.join(xlsx.stream_workbook([
+                ('Expenses', header, [(i,) for i in range(5)]),
+                ('Income', header, [(i,) for i in range(2)]),
+                ('Empty', header, []),
+            ]))
+        titles, sheets, _ = read_workbook(data)
+        self.assertEqual(titles, ['Expenses', 'Expenses (2)', 'Expenses (3)', 'Income', 'Empty'])
+        self.assertEqual([[row[0][2] for row in sheets[title][1:]] for title in titles],
+                         [['0', '1'], ['2', '3'], ['4'], ['0', '1'], []])
+
+
+class ExportCacheTests(TestCase):
+    # Session and user lookups, then the user's data version.
+    CACHE_HIT_QUERIES = 3
+
+    def setUp(self):
+        cache_root = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_root.cleanup)
+        override = self.settings(EXPORT_CACHE_ROOT=cache_root.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.user = User.objects.create_user('alice', password='secret')
+        self.client.force_login(self.user)
+        create_expenses(self.user, 5)
+
+    def download(self, url_name, data=None):
+        response = self.client.get(reverse(url_name), data or {})
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content)
+
+    def test_repeat_export_is_served_from_disk(self):
+        for url_name in ('export-csv', 'export-excel', 'income-export-csv', 'export-workbook'):
+            first = self.download(url_name)
+            with self.assertNumQueries(self.CACHE_HIT_QUERIES):
+                self.assertEqual(self.download(url_name), first)
+
+    def test_filters_are_part_of_the_key(self):
+        self.download('export-csv')
+        # A miss counts the rows, checks their currencies and then reads them.
+        with self.assertNumQueries(self.CACHE_HIT_QUERIES + 3):
+            self.download('export-csv', {'category': 'Food'})
+
+    def test_write_invalidates_export(self):
+        first = self.download('export-csv')
+        Expense.objects.create(owner=self.user, amount=99, date=datetime.date.today(),
+                               description='new', category=category('Food'))
+        second = self.download('export-csv')
+        self.assertNotEqual(first, second)
+        self.assertIn(b'Rows exported,6', second)
+
+    def test_least_recently_used_artifacts_are_evicted(self):
+        csv_export = self.download('export-csv')
+        self.download('export-excel')
+        for name in os.listdir(settings.EXPORT_CACHE_ROOT):
+            os.utime(os.path.join(settings.EXPORT_CACHE_ROOT, name), (0, 0))
+        # Using the CSV marks it as recent, so only the workbook goes.
+        self.download('export-csv')
+        self.assertEqual(evict(len(csv_export)), 1)
+        with self.assertNumQueries(self.CACHE_HIT_QUERIES):
+            self.download('export-csv')
+
+
+CSV_STATEMENT = """Date,Description,Amount
+2025-03-01,Coffee,-3.50
+2025-03-01,Coffee,-3.50
+2025-03-02,Salary,2500.00
+2025-03-03,Rent,-900
+not a date,Broken,-1
+"""
+
+OFX_STATEMENT = """OFXHEADER:100
+<OFX><BANKMSGSRSV1><STMTTRNRS><STMTRS><BANKTRANLIST>
+<STMTTRN>
+<TRNTYPE>DEBIT
+<DTPOSTED>20250301120000[0:GMT]
+<TRNAMT>-3.50
+<NAME>Coffee
+</STMTTRN>
+<STMTTRN><TRNTYPE>CREDIT<DTPOSTED>20250302<TRNAMT>2500.00<NAME>Salary</STMTTRN>
+</BANKTRANLIST></STMTRS></STMTTRNRS></BANKMSGSRSV1></OFX>
+"""
+
+QIF_STATEMENT = """!Type:Bank
+D03/01'25
+T-3.50
+PCoffee
+^
+D3/2/2025
+T2,500.00
+PSalary
+^
+"""
+
+
+class ImportStatementTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('alice', password='secret')
+
+    def run_import(self, text, format):
+        return import_statement(self.user, io.StringIO(text), format, category='Food',
+                                source='Salary', batch_size=2)
+
+    def test_csv_import(self):
+        report = self.run_import(CSV_STATEMENT, 'csv')
+        self.assertEqual((report['expenses'], report['income'], report['error_count']), (3, 1, 1))
+        self.assertEqual(report['errors'][0]['line'], 6)
+        self.assertEqual(ExpenseSummary.objects.get(owner=self.user).total, 907)
+        self.assertEqual(current_version(self.user.id), 1)
+
+    def test_reimport_adds_nothing(self):
+        self.run_import(CSV_STATEMENT, 'csv')
+        report = self.run_import(CSV_STATEMENT, 'csv')
+        self.assertEqual((report['expenses'], report['income'], report['duplicates']), (0, 0, 4))
+        self.assertEqual(Expense.objects.filter(owner=self.user).count(), 3)
+        self.assertEqual(current_version(self.user.id), 1)
+
+    def test_existing_entries_are_not_duplicated(self):
+        Expense.objects.create(owner=self.user, amount='3.5', date='2025-03-01',
+                               description='coffee ', category=category('Food'))
+        report = self.run_import(CSV_STATEMENT, 'csv')
+        self.assertEqual((report['expenses'], report['duplicates']), (2, 1))
+
+    def test_fingerprint_includes_currency_and_full_precision(self):
+        same = fingerprint('2025-03-01', Decimal('3.5'), 'USD', ' Coffee')
+        self.assertEqual(fingerprint(datetime.date(2025, 3, 1), '3.50', 'USD - United States Dollar',
+                                     'coffee'), same)
+        self.assertNotEqual(fingerprint('2025-03-01', '3.5', 'EUR', 'coffee'), same)
+        self.assertNotEqual(fingerprint('2025-03-01', '1.234', 'KWD', 'tea'),
+                            fingerprint('2025-03-01', '1.235', 'KWD', 'tea'))
+
+        Expense.objects.create(owner=self.user, amount='3.5', currency='EUR', date='2025-03-01',
+                               description='coffee', category=category('Food'))
+        report = self.run_import(CSV_STATEMENT, 'csv')
+        self.assertEqual((report['expenses'], report['duplicates']), (3, 0))
+
+    def test_three_decimal_currencies_are_not_merged(self):
+        UserPreferences.objects.create(user=self.user, currency='KWD - Kuwaiti Dinar')
+        Expense.objects.create(owner=self.user, amount='1.234', date='2025-03-01',
+                               description='tea', category=category('Food'))
+        report = self.run_import('Date,Description,Amount\n2025-03-01,tea,-1.235\n', 'csv')
+        self.assertEqual((report['expenses'], report['duplicates']), (1, 0))
+
+    def test_amount_parsing(self):
+        cases = {'-1,234.50': Decimal('-1234.50'), '(12.00)': Decimal('-12.00'),
+                 '$5': Decimal('5'), '-€3.5': Decimal('-3.5'), '.5': Decimal('0.5')}
+        for text, amount in cases.items():
+            self.assertEqual(parse_amount(text), amount, text)
+        for text in ('1e5', '12 CR', 'USD 5', '', '1.2.3', '1' * 30):
+            with self.assertRaises(StatementError, msg=text):
+                parse_amount(text)
+
+    def test_ofx_and_qif_match_each_other(self):
+        for text, format in ((OFX_STATEMENT, 'ofx'), (QIF_STATEMENT, 'qif')):
+            report = self.run_import(text, format)
+            self.assertEqual(report['error_count'], 0, report['errors'])
+        self.assertEqual(Expense.objects.filter(owner=self.user).count(), 1)
+        self.assertEqual(UserIncome.objects.get(owner=self.user).amount, 2500)
+
+    def test_upload(self):
+        self.client.force_login(self.user)
+        statement = SimpleUploadedFile('march.csv', CSV_STATEMENT.encode())
+        response = self.client.post(reverse('import-statement'),
+                                    {'statement': statement, 'category': 'Food'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['report']['expenses'], 3)
+
+
+class BatchWriteTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('alice', password='secret')
+        self.client.force_login(self.user)
+        create_expenses(self.user, 4)
+        self.food = category('Food')
+        source('Gift')
+        self.income = UserIncome.objects.create(owner=self.user, amount=100, date='2025-01-05',
+                                                description='pay', source=source('Salary'))
+
+    def post(self, operations):
+        return self.client.post(reverse('batch-write'), json.dumps({'operations': operations}),
+                                content_type='application/json')
+
+    def operations(self, size):
+        expenses = list(Expense.objects.filter(owner=self.user)[:2])
+        return [
+            {'op': 'create', 'type': 'expense' if i % 2 else 'income',
+             'data': {'amount': i + 1, 'date': '2025-02-%02d' % (i % 28 + 1),
+                      # An id, and a name as older clients send.
+                      'description': 'item %d' % i, 'category': self.food.pk, 'source': 'Gift'}}
+            for i in range(size)
+        ] + [
+            {'op': 'update', 'type': 'expense', 'id': expenses[0].id,
+             'data': {'amount': 1000, 'date': '2024-12-01'}},
+            {'op': 'update', 'type': 'income', 'id': self.income.id, 'data': {'amount': 5}},
+            {'op': 'delete', 'type': 'expense', 'id': expenses[1].id},
+        ]
+
+    def test_applies_operations(self):
+        operations = self.operations(4)
+        # 'source' only belongs to income and 'category' only to expenses.
+        for operation in operations[:4]:
+            operation['data'].pop('source' if operation['type'] == 'expense' else 'category')
+        response = self.post(operations)
+        self.assertEqual(response.status_code, 200, response.content)
+        statuses = [result['status'] for result in response.json()['results']]
+        self.assertEqual(statuses, ['created'] * 4 + ['updated', 'updated', 'deleted'])
+
+        self.assertEqual(Expense.objects.filter(owner=self.user).count(), 5)
+        self.income.refresh_from_db()
+        self.assertEqual(self.income.amount, 5)
+        buckets = list(ExpenseSummary.objects.values_list('month', 'category', 'total', 'count'))
+        rebuild_expense_summaries()
+        self.assertCountEqual(
+            buckets, ExpenseSummary.objects.values_list('month', 'category', 'total', 'count'))
+
+    def test_query_count_does_not_grow(self):
+        counts = []
+        # The first batch creates the rollup buckets the later ones update.
+        for size in (4, 4, 40):
+            operations = self.operations(size)
+            for operation in operations[:size]:
+                operation['data'].pop('source' if operation['type'] == 'expense' else 'category')
+            with CaptureQueriesContext(connection) as captured:
+                self.assertEqual(self.post(operations).status_code, 200)
+            counts.append(len(captured))
+            create_expenses(self.user, 2)
+        self.assertEqual(counts[1], counts[2])
+
+    def test_invalid_batch_writes_nothing(self):
+        other = User.objects.create_user('bob', password='secret')
+        foreign = Expense.objects.create(owner=other, amount=1, date='2025-01-01',
+                                         description='x', category=category('Food'))
+        before = Expense.objects.count()
+        response = self.post([
+            {'op': 'create', 'type': 'expense',
+             'data': {'amount': 1, 'date': '2025-01-01', 'description': 'ok', 'category': 'Food'}},
+            {'op': 'delete', 'type': 'expense', 'id': foreign.id},
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['errors'][0]['index'], 1)
+
+        response = self.post([{'op': 'create', 'type': 'expense', 'data': {'amount': 'x'}}])
+        self.assertEqual(response.json()['errors'], [{'index': 0, 'error': 'Amount must be a number'}])
+        self.assertEqual(Expense.objects.count(), before)
+
+    def test_operation_type_must_be_a_string(self):
+        operations = [{'op': 'delete', 'type': kind, 'id': 1}
+                      for kind in ({'expense': 1}, ['expense'], 1)]
+        response = self.post(operations)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([error['index'] for error in response.json()['errors']], [0, 1, 2])
+        self.assertEqual(response.json()['errors'][0]['error'], 'type must be one of expense, income')
+
+
+class SharedCacheCheckTests(TestCase):
+    def test_warns_about_a_process_local_default_cache(self):
+        local = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+        shared = {'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                              'LOCATION': tempfile.gettempdir()}}
+        with override_settings(CACHES=local, DEBUG=False):
+            self.assertEqual([w.id for w in check_shared_cache()], ['expenses.W001'])
+        with override_settings(CACHES=shared, DEBUG=False):
+            self.assertEqual(check_shared_cache(), [])
+
+
+class DeltaSyncTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('alice', password='secret')
+        self.client.force_login(self.user)
+        self.food = category('Food')
+
+    def sync(self, since=0, **params):
+        response = self.client.get(reverse('changes'), {'since': since, **params})
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def add(self, amount=1, owner=None):
+        return Expense.objects.create(owner=owner or self.user, amount=amount, date='2025-01-01',
+                                      description='coffee', category=self.food)
+
+    def test_changes_since_token(self):
+        first = self.add(1)
+        second = self.add(2)
+        page = self.sync()
+        self.assertEqual([(c['id'], c['action']) for c in page['changes']],
+                         [(first.pk, 'create'), (second.pk, 'create')])
+        self.assertEqual(page['changes'][0]['data']['category'], {'id': self.food.pk, 'name': 'Food'})
+        self.assertFalse(page['has_more'])
+
+        second.amount = 5
+        second.save()
+        first_id = first.pk
+        first.delete()
+        income = UserIncome.objects.create(owner=self.user, amount=9, date='2025-01-02',
+                                           description='pay', source=source('Salary'))
+        self.add(owner=User.objects.create_user('bob'))
+        page = self.sync(page['token'])
+        self.assertEqual([(c['type'], c['id'], c['action']) for c in page['changes']], [
+            ('expense', second.pk, 'update'),
+            ('expense', first_id, 'delete'),
+            ('income', income.pk, 'create'),
+        ])
+        self.assertEqual(page['changes'][0]['data']['amount'], '5.00')
+        self.assertIsNone(page['changes'][1]['data'])
+        self.assertEqual(self.sync(page['token'])['changes'], [])
+
+    def test_pages_never_split_a_write(self):
+        for i in range(3):
+            self.add(i + 1)
+        self.client.post(reverse('batch-write'), json.dumps({'operations': [
+            {'op': 'create', 'type': 'expense', 'data': {
+                'amount': 1, 'date': '2025-01-01', 'description': 'x', 'category': 'Food'}}
+        ] * 3}), content_type='application/json')
+
+        page = self.sync(limit=4)
+        self.assertEqual(len(page['changes']), 3)
+        self.assertTrue(page['has_more'])
+        # The batch logged three entries at one seq; a page of two holds all of them.
+        page = self.sync(page['token'], limit=2)
+        self.assertEqual(len(page['changes']), 3)
+        self.assertEqual(len({c['seq'] for c in page['changes']}), 1)
+        self.assertFalse(page['has_more'])
+
+    def test_compaction(self):
+        kept = self.add(1)
+        gone = self.add(2)
+        token = self.sync()['token']
+        for amount in (3, 4):
+            kept.amount = amount
+            kept.save()
+        gone.delete()
+        ChangeLog.objects.filter(action=ChangeLog.DELETE).update(
+            created_at=datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc))
+
+        self.assertEqual(compact(retention_days=30), 4)
+        self.assertEqual(list(ChangeLog.objects.values_list('object_id', 'action')),
+                         [(kept.pk, 'update')])
+        response = self.client.get(reverse('changes'), {'since': token})
+        self.assertEqual(response.status_code, 410)
+        self.assertTrue(response.json()['reset'])
+        self.assertEqual([c['id'] for c in self.sync()['changes']], [kept.pk])
+
+        self.assertEqual(self.client.get(reverse('changes'), {'since': -1}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('changes'), {'limit': 'x'}).status_code, 400)
+
+    def test_moved_expense_is_deleted_for_previous_owner(self):
+        expense = self.add()
+        token = self.sync()['token']
+        expense.owner = User.objects.create_user('bob')
+        expense.save()
+        self.assertEqual([(c['id'], c['action']) for c in self.sync(token)['changes']],
+                         [(expense.pk, 'delete')])
+        self.assertEqual(DataVersion.objects.get(owner=self.user).version, int(token) + 1)
+
+
+class DatabasePoolTests(TestCase):
+    def test_summarize(self):
+        stats = summarize({'pool_min': 2, 'pool_max': 4, 'pool_size': 3, 'pool_available': 1,
+                           'requests_waiting': 2, 'requests_num': 8, 'requests_wait_ms': 20})
+        self.assertEqual((stats['in_use'], stats['waiting'], stats['avg_wait_ms']), (2, 2, 2.5))
+        self.assertEqual(summarize({})['avg_wait_ms'], 0)
+
+    def test_status_is_staff_only(self):
+        user = User.objects.create_user('alice', password='secret')
+        self.client.force_login(user)
+        self.assertEqual(self.client.get(reverse('db-pool')).status_code, 403)
+        user.is_staff = True
+        user.save()
+        response = self.client.get(reverse('db-pool'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['pooled'], bool(connection.settings_dict['OPTIONS'].get('pool')))
+
+
+REPLICA = 'replica_standin'
+
+
+@override_settings(DATABASE_REPLICA_ALIAS=REPLICA, REPLICA_PIN_SECONDS=30)
+class ReplicaRoutingTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # A second in-memory database stands in for the replica. Nothing
+        # replicates into it, so a read that reaches it is easy to tell.
+        # It is added here, after the runner has checked the configured ones.
+        cls.databases = {DEFAULT_DB_ALIAS, REPLICA}
+        connections.settings[REPLICA] = connections.configure_settings({
+            DEFAULT_DB_ALIAS: dict(connections.settings[DEFAULT_DB_ALIAS]),
+            REPLICA: {'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:'},
+        })[REPLICA]
+        with connections[REPLICA].schema_editor() as editor:
+            # The tables the routed ones refer to, then the routed ones.
+            routed = [apps.get_model(label) for label in sorted(REPLICA_MODELS)]
+            for model in [User, Category, Source] + routed:
+                editor.create_model(model)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections[REPLICA].close()
+        del connections[REPLICA]
+        del connections.settings[REPLICA]
+
+    def setUp(self):
+        self.user = User.objects.create_user('alice', password='secret')
+        self.client.force_login(self.user)
+        self.food = category('Food')
+        # What replication would have copied, plus a rollup only the replica has.
+        User.objects.using(REPLICA).bulk_create([User(pk=self.user.pk, username='alice')])
+        Category.objects.using(REPLICA).bulk_create([Category(pk=self.food.pk, name='Food')])
+        ExpenseSummary.objects.using(REPLICA).bulk_create([ExpenseSummary(
+            owner=self.user, month=month_start(datetime.date.today()), category=self.food,
+            currency='USD', total=7, count=1)])
+
+    def summary(self):
+        response = self.client.get(reverse('expense-category-summary'))
+        self.assertEqual(response.status_code, 200)
+        return response.json()['expense_category_data']
+
+    def test_reads_replica_until_the_user_writes(self):
+        self.assertEqual(self.summary(), {'Food': 7})
+
+        response = self.client.post(reverse('add-expense'), {
+            'amount': '3', 'description': 'lunch', 'category': str(self.food.pk),
+            'expense_date': datetime.date.today().isoformat(),
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response.cookies[PIN_COOKIE]['max-age'], 30)
+        self.assertEqual(self.summary(), {'Food': 3})
+
+        self.client.cookies[PIN_COOKIE] = str(int(time.time()) - 1)
+        self.assertEqual(self.summary(), {'Food': 7})
+
+    def test_other_reads_and_writes_use_the_primary(self):
+        router = ReplicaRouter()
+        self.assertIsNone(router.db_for_read(Expense))
+        self.client.get(reverse('expenses'))
+        self.assertIsNone(router.db_for_read(Expense))
+        self.assertNotIn(PIN_COOKIE, self.client.get(reverse('expenses')).cookies)
+
+        with override_settings(DATABASE_REPLICA_ALIAS='missing'):
+            self.assertEqual(self.summary(), {})
+
+
+class MoneyTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('alice', password='secret')
+        self.client.force_login(self.user)
+
+    def test_sums_are_exact(self):
+        for _ in range(10):
+            Expense.objects.create(owner=self.user, amount='0.1', date='2025-03-01',
+                                   description='x', category=category('Food'))
+        total = Expense.objects.aggregate(total=Sum('amount'))['total']
+        self.assertEqual(total, Decimal('1.00'))
+        self.assertEqual(ExpenseSummary.objects.get(owner=self.user).total, Decimal('1.00'))
+
+    def test_amounts_round_to_currency_exponent(self):
+        self.assertEqual(quantize('1234.5', 'JPY - Japanese Yen'), Decimal('1234'))
+        self.assertEqual(quantize('1.2345', 'KWD - Kuwaiti Dinar'), Decimal('1.234'))
+        self.assertEqual(quantize(0.285, 'USD - United States Dollar'), Decimal('0.28'))
+
+        UserPreferences.objects.create(user=self.user, currency='JPY - Japanese Yen')
+        self.client.post(reverse('add-expense'), {'amount': '999.6', 'description': 'ramen',
+                                                  'expense_date': '2025-03-01',
+                                                  'category': category('Food').pk})
+        self.assertEqual(Expense.objects.get(owner=self.user).amount, Decimal('1000'))
+
+    def test_invalid_amount_is_rejected(self):
+        response = self.client.post(reverse('add-expense'), {
+            'amount': 'lots', 'description': 'x', 'expense_date': '2025-03-01',
+            'category': category('Food').pk})
+        self.assertContains(response, 'Amount must be a number')
+        self.assertFalse(Expense.objects.exists())
+
+    def test_amounts_outside_the_money_range_are_rejected(self):
+        cases = {'1e15': 'Amount is too large', '1e30': 'Amount is too large',
+                 '0': 'Amount must be greater than zero', '-5': 'Amount must be greater than zero',
+                 '1e-9': 'Amount must be greater than zero'}
+        for amount, error in cases.items():
+            response = self.client.post(reverse('add-expense'), {
+                'amount': amount, 'description': 'x', 'expense_date': '2025-03-01',
+                'category': category('Food').pk})
+            self.assertContains(response, error, msg_prefix=amount)
+            response = self.client.post(reverse('add-income'), {
+                'amount': amount, 'description': 'x', 'income_date': '2025-03-01',
+                'source': source('Salary').pk})
+            self.assertContains(response, error, msg_prefix=amount)
+            response = self.client.post(reverse('batch-write'), json.dumps({'operations': [
+                {'op': 'create', 'type': 'expense', 'data': {
+                    'amount': amount, 'date': '2025-03-01', 'description': 'x',
+                    'category': category('Food').pk}}]}), content_type='application/json')
+            self.assertEqual(response.json()['errors'], [{'index': 0, 'error': error}], amount)
+        self.assertFalse(Expense.objects.exists())
+        self.assertFalse(UserIncome.objects.exists())
+
+    def test_exponent_notation_is_accepted_in_range(self):
+        response = self.client.post(reverse('add-expense'), {
+            'amount': '1.5e2', 'description': 'x', 'expense_date': '2025-03-01',
+            'category': category('Food').pk})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Expense.objects.get(owner=self.user).amount, Decimal('150'))
+
+    def test_amount_search_is_an_exact_range(self):
+        for amount in ('12', '12.99', '13', '12.5'):
+            Expense.objects.create(owner=self.user, amount=amount, date='2025-03-01',
+                                   description='x', category=category('Food'))
+        found = search(Expense.objects.filter(owner=self.user), '12', ('description',))
+        self.assertCountEqual(found.values_list('amount', flat=True),
+                              [Decimal('12'), Decimal('12.99'), Decimal('12.5')])
+
+
+class CategoryForeignKeyTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('alice', password='secret')
+        self.client.force_login(self.user)
+        Expense.objects.create(owner=self.user, amount=12, date='2025-03-01',
+                               description='lunch', category=category('Travel'))
+
+    def test_search_matches_and_returns_category_names(self):
+        response = self.client.post(reverse('search-expenses'), json.dumps({'searchText': 'trav'}),
+                                    content_type='application/json')
+        results = response.json()['results']
+        self.assertEqual([(row['description'], row['category']) for row in results],
+                         [('lunch', 'Travel')])
+
+    def test_add_expense_validates_category_id(self):
+        response = self.client.post(reverse('add-expense'), {
+            'amount': '5', 'description': 'x', 'expense_date': '2025-03-01', 'category': 'Travel'})
+        self.assertContains(response, 'Choose a valid category')
+        self.assertEqual(Expense.objects.count(), 1)
+
+    def test_rename_keeps_history(self):
+        travel = Category.objects.get(name='Travel')
+        travel.name = 'Trips'
+        with self.captureOnCommitCallbacks(execute=True):
+            travel.save()
+        response = self.client.get(reverse('expense-timeseries'), {
+            'start': '2025-03-01', 'end': '2025-03-31', 'breakdown': 'category'})
+        self.assertEqual(response.json()['series'], {'Trips': [12]})
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('alice', password='secret')
+        self.expenses = Expense.objects.filter(owner=self.user)
+
+    def add(self, amount, date, description, name='Food'):
+        return Expense.objects.create(owner=self.user, amount=amount, date=date,
+                                      description=description, category=category(name))
+
+    def found(self, text):
+        return list(search(self.expenses, text, ('description', 'category__name'))
+                    .values_list('description', flat=True))
+
+    def test_amount_tokens(self):
+        cases = {
+            '12': Q(amount__gte=Decimal('12'), amount__lt=Decimal('13')),
+            '12.5': Q(amount__gte=Decimal('12.5'), amount__lt=Decimal('12.6')),
+            '12.50': Q(amount__gte=Decimal('12.50'), amount__lt=Decimal('12.51')),
+            '10..20': Q(amount__gte=Decimal('10'), amount__lte=Decimal('20')),
+            '>50': Q(amount__gt=Decimal('50')),
+            '<=20': Q(amount__lte=Decimal('20')),
+        }
+        for token, expected in cases.items():
+            self.assertEqual(amount_condition(token), expected, token)
+        for token in ('12.505', 'abc', '>', '10..', '1,000'):
+            self.assertIsNone(amount_condition(token), token)
+
+    def test_date_tokens(self):
+        cases = {
+            '2024': (datetime.date(2024, 1, 1), datetime.date(2024, 12, 31)),
+            '2024-02': (datetime.date(2024, 2, 1), datetime.date(2024, 2, 29)),
+            '2025-3': (datetime.date(2025, 3, 1), datetime.date(2025, 3, 31)),
+            '2025-03-07': (datetime.date(2025, 3, 7), datetime.date(2025, 3, 7)),
+        }
+        for token, (start, end) in cases.items():
+            self.assertEqual(date_condition(token), Q(date__gte=start, date__lte=end), token)
+        for token in ('2025-13', '2025-02-30', '25-03', 'march'):
+            self.assertIsNone(date_condition(token), token)
+
+    def test_single_token_matches_amount_date_or_text(self):
+        self.add(2024, '2025-03-01', 'rent')
+        self.add(5, '2024-06-01', 'bus')
+        self.add(7, '2025-01-01', 'report 2024')
+        self.assertCountEqual(self.found('2024'), ['rent', 'bus', 'report 2024'])
+        self.assertEqual(self.found('2024-06'), ['bus'])
+
+    def test_tokens_narrow_each_other(self):
+        self.add(12, '2025-03-01', 'coffee beans')
+        self.add(12, '2025-04-01', 'coffee beans')
+        self.add(30, '2025-03-02', 'coffee machine')
+        self.add(12, '2025-03-03', 'tea')
+        self.assertCountEqual(self.found('coffee'), ['coffee beans', 'coffee beans', 'coffee machine'])
+        self.assertCountEqual(self.found('coffee 2025-03'), ['coffee beans', 'coffee machine'])
+        self.assertEqual(self.found('coffee 2025-03 12'), ['coffee beans'])
+        self.assertEqual(self.found('coffee beans 2025-03'), ['coffee beans'])
+        self.assertEqual(self.found('coffee 2025-03 >50'), [])
+
+    def test_better_text_matches_come_first(self):
+        self.add(1, '2025-03-01', 'train ticket to the airport and back home')
+        self.add(2, '2025-01-01', 'train ticket')
+        self.add(3, '2025-03-02', 'ticket')
+        self.assertEqual(self.found('train ticket'),
+                         ['train ticket', 'train ticket to the airport and back home'])
+
+    def test_blank_text_matches_nothing(self):
+        self.add(1, '2025-03-01', 'lunch')
+        self.assertEqual(self.found(''), [])
+        self.assertEqual(self.found('   '), [])
+
+
+class SearchPageTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('alice', password='secret')
+        self.client.force_login(self.user)
+        create_expenses(self.user, 12, start=datetime.date(2025, 3, 31))
+        self.expenses = Expense.objects.filter(owner=self.user).order_by('-date', '-id')
+
+    def post(self, body):
+        return self.client.post(reverse('search-expenses'), body, content_type='application/json')
+
+    def test_pages_follow_next_to_the_end(self):
+        seen = []
+        page = search_page(self.expenses, 'expense', ('id',), limit=5)
+        while True:
+            seen.extend(row['id'] for row in page['results'])
+            if not page['has_more']:
+                break
+            page = search_page(self.expenses, 'expense', ('id',), cursor=page['next'], limit=5)
+        self.assertIsNone(page['next'])
+        self.assertEqual(seen, list(self.expenses.values_list('id', flat=True)))
+
+    def test_results_stop_at_the_cap(self):
+        with mock.patch.object(search_module, 'SEARCH_RESULT_CAP', 7):
+            first = search_page(self.expenses, 'expense', ('id',), limit=5)
+            second = search_page(self.expenses, 'expense', ('id',), cursor=first['next'], limit=5)
+        self.assertTrue(first['has_more'])
+        self.assertEqual(len(second['results']), 2)
+        self.assertFalse(second['has_more'])
+        self.assertIsNone(second['next'])
+
+    def test_cursor_is_bound_to_its_query(self):
+        cursor = search_page(self.expenses, 'expense', ('id',), limit=5)['next']
+        for text, bad in (('expense', cursor[:-1] + ('A' if cursor[-1] != 'A' else 'B')),
+                          ('rent', cursor), ('expense', 5)):
+            with self.assertRaisesMessage(ValueError, 'Invalid cursor'):
+                search_page(self.expenses, text, ('id',), cursor=bad)
+
+    def test_related_fields_are_returned_under_the_relation_name(self):
+        page = search_page(self.expenses, '', ('id', 'category__name'), limit=1)
+        self.assertEqual(page['results'], [{'id': self.expenses[0].id, 'category': 'Food'}])
+
+    def test_view_pages_results(self):
+        first = self.post(json.dumps({'searchText': 'expense', 'limit': 10})).json()
+        second = self.post(json.dumps({'searchText': 'expense', 'cursor': first['next']})).json()
+        self.assertEqual(len(first['results']) + len(second['results']), 12)
+        self.assertFalse(second['has_more'])
+        response = self.post(json.dumps({'searchText': 'rent', 'cursor': first['next']}))
+        self.assertEqual(response.status_code, 400)
+
+    def test_view_rejects_malformed_requests(self):
+        for body in ('{', '[]', '"expense"', 'null'):
+            response = self.post(body)
+            self.assertEqual(response.status_code, 400, body)
+        response = self.client.get(reverse('search-expenses'))
+        self.assertEqual(response.status_code, 405)
+        response = self.client.post(reverse('search-income'), '[]',
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_view_coerces_search_text(self):
+        for text in (None, 12):
+            response = self.post(json.dumps({'searchText': text}))
+            self.assertEqual(response.status_code, 200, text)
+        response = self.post(json.dumps({'searchText': 12}))
+        self.assertEqual([row['amount'] for row in response.json()['results']], ['12.00'])
+
+
+class LookupCacheTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('alice', password='secret')
+        self.client.force_login(self.user)
+        UserPreferences.objects.create(user=self.user, currency='USD - United States Dollar')
+        self.food = category('Food')
+        source('Salary')
+
+    def test_forms_read_lookups_from_memory(self):
+        self.client.get(reverse('add-expense'))
+        self.client.get(reverse('add-income'))
+        for url_name, name in (('add-expense', 'Food'), ('add-income', 'Salary')):
+            with CaptureQueriesContext(connection) as captured:
+                response = self.client.get(reverse(url_name))
+            self.assertContains(response, name)
+            tables = ' '.join(query['sql'] for query in captured.captured_queries)
+            self.assertNotIn('expenses_category', tables)
+            self.assertNotIn('userincome_source', tables)
+
+    def test_changes_reach_other_workers(self):
+        self.assertEqual([row.name for row in categories()], ['Food'])
+        with self.captureOnCommitCallbacks(execute=True):
+            category('Rent')
+        self.assertEqual([row.name for row in categories()], ['Food', 'Rent'])
+
+        # Another worker only shares the cache backend with this one.
+        other = LookupTable(Category)
+        self.assertEqual(other.get(self.food.pk).name, 'Food')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.food.delete()
+        self.assertIsNone(other.get(self.food.pk))
+        self.assertIsNone(table(Category).get('nope'))
+
+
+RATES_CSV = """date,currency,rate
+2025-01-01,EUR,0.5
+2025-03-01,EUR,0.8
+2025-01-01,JPY,150
+"""
+
+
+class CurrencyConversionTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('alice', password='secret')
+        self.client.force_login(self.user)
+        UserPreferences.objects.create(user=self.user, currency='USD - United States Dollar')
+        self.food = category('Food')
+        with self.captureOnCommitCallbacks(execute=True):
+            import_rates(parse_rates(RATES_CSV))
+        for amount, currency, date in [('10', 'USD', '2025-03-05'), ('8', 'EUR', '2025-03-05'),
+                                       ('300', 'JPY', '2025-03-06'), ('5', 'EUR', '2025-02-10')]:
+            Expense.objects.create(owner=self.user, amount=amount, currency=currency, date=date,
+                                   description='x', category=self.food)
+
+    def test_rate_in_effect_on_each_date(self):
+        table = rate_table()
+        self.assertEqual(table.rate('EUR', datetime.date(2025, 2, 28)), Decimal('0.5'))
+        self.assertEqual(table.rate('EUR', datetime.date(2025, 3, 1)), Decimal('0.8'))
+        self.assertEqual(table.rate('EUR', datetime.date(2024, 6, 1)), Decimal('0.5'))
+        self.assertEqual(
+            convert_many(['10', '10', '3'], ['EUR', 'EUR', ''],
+                         [datetime.date(2025, 2, 1), datetime.date(2025, 3, 2), None], 'USD'),
+            [Decimal('20'), Decimal('12.5'), Decimal('3')],
+        )
+        with self.assertRaises(MissingRate):
+            convert_many(['1'], ['GBP'], [None], 'USD')
+
+    def test_import_command_replaces_rates(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as rate_file:
+            json.dump({'2025-03-01': {'eur': '0.9', 'GBP': '0.75'}}, rate_file)
+        self.addCleanup(os.remove, rate_file.name)
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('import_exchange_rates', rate_file.name, stdout=io.StringIO())
+        table = rate_table()
+        self.assertEqual(table.rate('EUR', datetime.date(2025, 3, 1)), Decimal('0.9'))
+        self.assertEqual(table.rate('GBP', datetime.date(2025, 3, 1)), Decimal('0.75'))
+        with self.assertRaises(ValueError):
+            list(parse_rates('date,currency,rate\n2025-03-01,EUR,-1\n'))
+
+    def test_timeseries_converts_each_row_at_its_date(self):
+        response = self.client.get(reverse('expense-timeseries'), {
+            'start': '2025-02-01', 'end': '2025-03-31', 'breakdown': 'category'})
+        data = response.json()
+        # 5 EUR at 0.5, then 10 USD + 8 EUR at 0.8 + 300 JPY at 150.
+        self.assertEqual(data['totals'], [10, 22])
+        self.assertEqual(data['series'], {'Food': [10, 22]})
+        self.assertEqual(data['currency'], 'USD')
+
+    def test_rollups_convert_at_the_month_rate(self):
+        summary = grouped_totals(
+            ExpenseSummary.objects.filter(owner=self.user), 'month', date_field='month',
+            amount_field='total', count_field='count', convert_to='JPY')
+        self.assertEqual(summary['groups'], {
+            datetime.date(2025, 2, 1): 1500,
+            datetime.date(2025, 3, 1): 1500 + 1500 + 300,
+        })
+        self.assertEqual(summary['counts'][datetime.date(2025, 3, 1)], 3)
+
+    def test_exports_add_a_converted_column(self):
+        response = self.client.get(reverse('export-csv'))
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'Amount,Currency,Description,Category,Date,Amount (USD)')
+        self.assertIn('8.00,EUR,x,Food,2025-03-05,10.00', lines)
+        self.assertIn('300.00,JPY,x,Food,2025-03-06,2.00', lines)
+
+    def test_missing_rate_is_rejected(self):
+        Expense.objects.create(owner=self.user, amount='1', currency='GBP', date='2025-03-05',
+                               description='x', category=self.food)
+        for url_name in ('expense-timeseries', 'export-csv'):
+            response = self.client.get(reverse(url_name), {'start': '2025-01-01'})
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('GBP', response.json()['error'])
+
+    def test_records_keep_their_own_currency(self):
+        self.client.post(reverse('add-expense'), {
+            'amount': '99.6', 'currency': 'JPY', 'description': 'ramen',
+            'expense_date': '2025-03-01', 'category': self.food.pk})
+        expense = Expense.objects.get(description='ramen')
+        self.assertEqual((expense.currency, expense.amount), ('JPY', Decimal('100')))
+
+        response = self.client.post(reverse('batch-write'), json.dumps({'operations': [
+            {'op': 'create', 'type': 'expense', 'data': {
+                'amount': '1.0004', 'currency': 'kwd', 'date': '2025-03-01',
+                'description': 'tea', 'category': self.food.pk}},
+            {'op': 'create', 'type': 'expense', 'data': {
+                'amount': '1', 'currency': 'XYZ', 'date': '2025-03-01',
+                'description': 'tea', 'category': self.food.pk}},
+        ]}), content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['errors'], [{'index': 1, 'error': 'Unknown currency: XYZ'}])
+        self.assertFalse(Expense.objects.filter(description='tea').exists())
+
+        self.client.post(reverse('batch-write'), json.dumps({'operations': [
+            {'op': 'create', 'type': 'expense', 'data': {
+                'amount': '1.0004', 'currency': 'kwd', 'date': '2025-03-01',
+                'description': 'tea', 'category': self.food.pk}},
+        ]}), content_type='application/json')
+        expense = Expense.objects.get(description='tea')
+        self.assertEqual((expense.currency, expense.amount), ('KWD', Decimal('1.000')))
+        self.assertTrue(ExpenseSummary.objects.filter(owner=self.user, currency='KWD').exists())
@@ -5,6 +5,11 @@ from django.views.decorators.csrf import csrf_exempt
 urlpatterns = [
     path('', views.index, name='expenses'),
     path('add-expense/', views.add_expense, name='add-expense'),
+    path('import-statement/', views.import_statement, name='import-statement'),
+    path('batch/', views.batch_write, name='batch-write'),
+    path('changes/', views.changes, name='changes'),
+    path('db_pool/', views.db_pool_status, name='db-pool'),
+    path('analytics_cache/', views.analytics_cache_status, name='analytics-cache'),
     path('edit-expense/<int:id>', views.expense_edit, name='expense-edit'),
     path('expense-delete/<int:id>', views.expense_delete, name='expense-delete'),
     path('search-expenses', csrf_exempt(views.search_expenses), name='search-expenses'), 
@@ -12,7 +17,15 @@ urlpatterns = [
     path('stats/', views.stats_view, name='stats'),
     path('export_csv/', views.export_csv, name='export-csv'),
     path('export_excel/', views.export_excel, name='export-excel'),
+    path('export_workbook/', views.export_workbook, name='export-workbook'),
     path('export_pdf/', views.export_pdf, name='export-pdf'),
+    path('exports/', views.submit_export_job, name='export-submit'),
+    path('exports/<int:id>/', views.export_job, name='export-job'),
+    path('exports/<int:id>/status/', views.export_job_status, name='export-job-status'),
+    path('exports/<int:id>/download/', views.export_job_download, name='export-job-download'),
     path('financial-analysis/', views.financial_analysis, name='financial-analysis'),
+    path('dashboard/', views.dashboard, name='dashboard'),
     path('monthly_expense_summary/', views.monthly_expense_summary, name='monthly-expense-summary'),
+    path('expense_timeseries/', views.expense_timeseries, name='expense-timeseries'),
+    path('cash_flow/', views.cash_flow_timeseries, name='cash-flow'),
 ]
\ No newline at end of file
@@ -0,0 +1,30 @@
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import DataVersion
+
+
+def current_version(owner_id):
+    """Return the user's data version; 0 if they have never written anything."""
+    return DataVersion.objects.filter(owner_id=owner_id).values_list(
+        'version', flat=True).first() or 0
+
+
+def bump_version(owner_id):
+    """Move the user's data version on after a write; returns the new version.
+
+    Inside a transaction the returned number is this writer's own: the
+    UPDATE keeps the row locked until commit.
+    """
+    now = timezone.now()
+    row = DataVersion.objects.filter(owner_id=owner_id)
+    if not row.update(version=F('version') + 1, updated_at=now):
+        try:
+            with transaction.atomic():
+                DataVersion.objects.create(owner_id=owner_id, version=1, updated_at=now)
+            return 1
+        except IntegrityError:
+            # Another request created the row first.
+            row.update(version=F('version') + 1, updated_at=now)
+    return row.values_list('version', flat=True).get()
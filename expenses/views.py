@@ -1,62 +1,91 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.views.decorators.csrf import csrf_exempt
 from django.contrib.auth.decorators import login_required
+from django.conf import settings
 from django.contrib import messages
 from django.core.paginator import Paginator
-from django.http import JsonResponse, HttpResponse
+from django.http import FileResponse, Http404, JsonResponse
 from django.db.models import Sum
-from .models import Category, Expense
-from userpreferences.models import UserPreferences
+from .models import Category, Expense, ExpenseSummary, ExportJob
+from .aggregation import bucketed_totals, cash_flow, grouped_totals, timeseries_params
+from .exports import (
+    check_convertible, export_filters, streaming_csv_response, streaming_xlsx_response,
+    xlsx_sheet,
+)
+from . import imports, xlsx
+from .artifacts import artifact_key, cached_response
+from .batch import BatchError, apply_batch
+from .changes import MAX_PAGE_SIZE, ExpiredToken, changes_since
+from .analytics import CACHE_ALIAS, cached_analytics, stats as analytics_stats
+from .conditional import conditional_on_data, conditional_page
+from .dashboard import dashboard_data
+from .dbpool import pool_stats
+from .money import currency_code, parse_amount
+from .jobs import CONTENT_TYPES, EXPORTS, download_name, submit_export
+from .lookups import categories, sources, table
+from .pagination import KeysetPaginator
+from .routers import read_from_replica
+from .search import search, search_page, search_request
+from .summaries import month_start
+from userincome.models import UserIncome
+from userpreferences.currencies import catalog, parse_currency
 import json
 import datetime
-import csv
-import xlwt
-import tempfile
-from django.template.loader import render_to_string
-from weasyprint import HTML
+import os
+from django.urls import reverse
 
 
+SEARCH_FIELDS = ('description', 'category__name')
+RESULT_FIELDS = ('id', 'amount', 'currency', 'date', 'description', 'category__name')
+
+
+@read_from_replica
 def search_expenses(request):
-    if request.method == 'POST':
-        search_str = json.loads(request.body).get('searchText', '')
-
-        expenses = Expense.objects.filter(
-            amount__istartswith=search_str, owner=request.user
-        ) | Expense.objects.filter(
-            date__istartswith=search_str, owner=request.user
-        ) | Expense.objects.filter(
-            description__icontains=search_str, owner=request.user
-        ) | Expense.objects.filter(
-            category__icontains=search_str, owner=request.user
+    if request.method != 'POST':
+        return JsonResponse({'error': 'POST required'}, status=405)
+    try:
+        search_str, cursor, limit = search_request(request.body)
+        expenses = search(
+            Expense.objects.filter(owner=request.user), search_str, SEARCH_FIELDS
         )
-        
-        data = expenses.values()
-        return JsonResponse(list(data), safe=False)
+        page = search_page(expenses, search_str, RESULT_FIELDS, cursor=cursor, limit=limit)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse(page)
 
 
 @login_required(login_url='/authentication/login')
+@conditional_page
 def index(request):
-    categories = Category.objects.all()
-    expenses = Expense.objects.filter(owner=request.user)
-    paginator = Paginator(expenses, 5)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    currency = UserPreferences.objects.get(user=request.user).currency
+    expenses = Expense.objects.filter(owner=request.user).select_related('category')
+    if settings.LIST_PAGINATION == 'keyset' or 'cursor' in request.GET:
+        paginator = KeysetPaginator(
+            expenses, 5,
+            approximate_count=lambda: ExpenseSummary.objects.filter(
+                owner=request.user).aggregate(count=Sum('count'))['count'] or 0
+        )
+        page_obj = paginator.get_page(request.GET.get('cursor'))
+    else:
+        paginator = Paginator(expenses, 5)
+        page_number = request.GET.get('page')
+        page_obj = paginator.get_page(page_number)
+    currency = request.preferences.currency
 
     context = {
-        'expenses': expenses,
         'page_obj': page_obj,
-        'categories': categories,
+        'categories': categories(),
         'currency': currency,
+        'currency_code': currency_code(currency),
     }
     return render(request, 'expenses/index.html', context)
 
 
 @login_required(login_url='/authentication/login')
 def add_expense(request):
-    categories = Category.objects.all()
     context = {
-        'categories': categories,
+        'categories': categories(),
+        'currencies': catalog().currencies,
+        'default_currency': currency_code(request.preferences.currency),
         'values': request.POST or {},
     }
 
@@ -68,18 +97,25 @@ def add_expense(request):
         description = request.POST.get('description', '').strip()
         date = request.POST.get('expense_date', '').strip()
         category = request.POST.get('category', '').strip()
+        category = table(Category).get(category)
+
+        try:
+            currency = parse_currency(request.POST.get('currency'), context['default_currency'])
+            amount = parse_amount(amount, currency)
+        except ValueError as e:
+            messages.error(request, str(e))
+            return render(request, 'expenses/add_expense.html', context)
 
-        if not amount:
-            messages.error(request, 'Amount is required')
-        elif not description:
+        if not description:
             messages.error(request, 'Description is required')
         elif not date:
             messages.error(request, 'Expense date is required')
         elif not category:
-            messages.error(request, 'Category is required')
+            messages.error(request, 'Choose a valid category')
         else:
             Expense.objects.create(
                 amount=amount,
+                currency=currency,
                 date=date,
                 category=category,
                 description=description,
@@ -91,14 +127,105 @@ def add_expense(request):
         return render(request, 'expenses/add_expense.html', context)
 
 
+@login_required(login_url='/authentication/login')
+def import_statement(request):
+    context = {
+        'categories': categories(),
+        'sources': sources(),
+        'formats': imports.FORMATS,
+    }
+    if request.method == 'GET':
+        return render(request, 'expenses/import_statement.html', context)
+
+    statement = request.FILES.get('statement')
+    if not statement:
+        messages.error(request, 'Choose a statement file to import')
+        return render(request, 'expenses/import_statement.html', context)
+
+    format = request.POST.get('format') or imports.detect_format(statement.name)
+    if format not in imports.FORMATS:
+        messages.error(request, 'Unsupported statement format')
+        return render(request, 'expenses/import_statement.html', context)
+
+    try:
+        report = imports.import_statement(
+            request.user, imports.text_lines(statement.file), format,
+            category=request.POST.get('category') or 'Imported',
+            source=request.POST.get('source') or 'Imported',
+        )
+    except imports.StatementError as e:
+        messages.error(request, str(e))
+        return render(request, 'expenses/import_statement.html', context)
+
+    messages.success(request, 'Imported %d expenses and %d income entries' % (
+        report['expenses'], report['income']))
+    context.update(report=report, filename=statement.name)
+    return render(request, 'expenses/import_statement.html', context)
+
+
+@login_required(login_url='/authentication/login')
+def batch_write(request):
+    """API endpoint applying a list of create/update/delete operations atomically"""
+    if request.method != 'POST':
+        return JsonResponse({'error': 'POST required'}, status=405)
+    try:
+        body = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid JSON'}, status=400)
+
+    try:
+        results = apply_batch(request.user, body.get('operations') if isinstance(body, dict) else None)
+    except BatchError as e:
+        return JsonResponse({'errors': e.errors}, status=400)
+    return JsonResponse({'results': results})
+
+
+@login_required(login_url='/authentication/login')
+def changes(request):
+    """API endpoint returning the expense/income changes after a sync token"""
+    try:
+        since = int(request.GET.get('since', 0))
+        limit = int(request.GET.get('limit', 500))
+    except ValueError:
+        return JsonResponse({'error': 'since and limit must be integers'}, status=400)
+    if since < 0 or not 1 <= limit <= MAX_PAGE_SIZE:
+        return JsonResponse({'error': 'since must be >= 0 and limit between 1 and %d'
+                             % MAX_PAGE_SIZE}, status=400)
+
+    try:
+        page = changes_since(request.user.pk, since, limit)
+    except ExpiredToken as e:
+        return JsonResponse({'error': str(e), 'reset': True}, status=410)
+    page['token'] = str(page['token'])
+    return JsonResponse(page)
+
+
+@login_required(login_url='/authentication/login')
+def db_pool_status(request):
+    """Staff-only statistics of this process's database connection pool"""
+    if not request.user.is_staff:
+        return JsonResponse({'error': 'Staff only'}, status=403)
+    stats = pool_stats()
+    return JsonResponse({'pooled': stats is not None, 'stats': stats})
+
+
+@login_required(login_url='/authentication/login')
+def analytics_cache_status(request):
+    """Staff-only hit and miss counts of this process's analytics cache"""
+    if not request.user.is_staff:
+        return JsonResponse({'error': 'Staff only'}, status=403)
+    return JsonResponse({'backend': settings.CACHES[CACHE_ALIAS]['BACKEND'], 'stats': analytics_stats()})
+
+
 @login_required(login_url='/authentication/login')
 def expense_edit(request, id):
     expense = get_object_or_404(Expense, pk=id)
-    categories = Category.objects.all()
     context = {
         'expense': expense,
         'values': expense,
-        'categories': categories,
+        'categories': categories(),
+        'currencies': catalog().currencies,
+        'default_currency': expense.currency or currency_code(request.preferences.currency),
     }
 
     if request.method == 'GET':
@@ -109,17 +236,24 @@ def expense_edit(request, id):
         description = request.POST.get('description', '').strip()
         date = request.POST.get('expense_date', '').strip()
         category = request.POST.get('category', '').strip()
+        category = table(Category).get(category)
+
+        try:
+            currency = parse_currency(request.POST.get('currency'), context['default_currency'])
+            amount = parse_amount(amount, currency)
+        except ValueError as e:
+            messages.error(request, str(e))
+            return render(request, 'expenses/edit_expense.html', context)
 
-        if not amount:
-            messages.error(request, 'Amount is required')
-        elif not description:
+        if not description:
             messages.error(request, 'Description is required')
         elif not date:
             messages.error(request, 'Expense date is required')
         elif not category:
-            messages.error(request, 'Category is required')
+            messages.error(request, 'Choose a valid category')
         else:
             expense.amount = amount
+            expense.currency = currency
             expense.date = date
             expense.category = category
             expense.description = description
@@ -139,35 +273,27 @@ def expense_delete(request, id):
 
 
 @login_required(login_url='/authentication/login')
+@read_from_replica
+@conditional_on_data
+@cached_analytics
 def expense_category_summary(request):
     todays_date = datetime.date.today()
     six_months_ago = todays_date - datetime.timedelta(days=180)
-    
-    expenses = Expense.objects.filter(
-        owner=request.user, 
-        date__gte=six_months_ago, 
-        date__lte=todays_date
-    )
-    
-    finalrep = {}
-
-    if expenses.exists():
-        def get_category(expense):
-            return expense.category
-        
-        category_list = list(set(map(get_category, expenses)))
 
-        def get_expense_category_amount(category):
-            amount = 0
-            filtered_by_category = expenses.filter(category=category)
-            for item in filtered_by_category:
-                amount += float(item.amount)
-            return amount
-
-        for category in category_list:
-            finalrep[category] = get_expense_category_amount(category)
+    currency = currency_code(request.preferences.currency)
+    try:
+        # Rollups are monthly, so each month converts at its first day's rate.
+        summary = grouped_totals(
+            ExpenseSummary.objects.filter(owner=request.user), 'category',
+            start=month_start(six_months_ago), end=todays_date,
+            date_field='month', amount_field='total', count_field='count',
+            labels=Category, convert_to=currency
+        )
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    finalrep = summary['groups']
 
-    return JsonResponse({'expense_category_data': finalrep}, safe=False)
+    return JsonResponse({'expense_category_data': finalrep, 'currency': currency}, safe=False)
 
 @login_required(login_url='/authentication/login')
 def stats_view(request):
@@ -181,91 +307,254 @@ def financial_analysis(request):
 
 
 @login_required(login_url='/authentication/login')
+@read_from_replica
+@conditional_on_data
+@cached_analytics
+def dashboard(request):
+    """API endpoint with everything the analysis and stats pages chart"""
+    try:
+        data = dashboard_data(request.user.id, currency_code(request.preferences.currency))
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse(data)
+
+
+@login_required(login_url='/authentication/login')
+@read_from_replica
+@conditional_on_data
+@cached_analytics
 def monthly_expense_summary(request):
     """API endpoint for monthly expense data"""
-    from datetime import datetime, timedelta
-    
-    today = datetime.now()
-    six_months_ago = today - timedelta(days=180)
-    
-    monthly_data = Expense.objects.filter(
-        owner=request.user,
-        date__gte=six_months_ago
-    ).extra(
-        select={'month': "strftime('%%Y-%%m', date)"}
-    ).values('month').annotate(
-        total=Sum('amount')
-    ).order_by('month')
-    
+    todays_date = datetime.date.today()
+    six_months_ago = todays_date - datetime.timedelta(days=180)
+
+    currency = currency_code(request.preferences.currency)
+    try:
+        summary = grouped_totals(
+            ExpenseSummary.objects.filter(owner=request.user), 'month',
+            start=month_start(six_months_ago), date_field='month',
+            amount_field='total', count_field='count', convert_to=currency
+        )
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
     result = {}
-    for item in monthly_data:
-        result[item['month']] = float(item['total'])
-    
-    return JsonResponse({'monthly_data': result})
+    for month, total in summary['groups'].items():
+        result[month.strftime('%Y-%m')] = total
 
+    return JsonResponse({'monthly_data': result, 'currency': currency})
 
-def export_csv(request):
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = 'attachment; filename=Expenses'+ str(datetime.datetime.now())+'.csv'
 
-    writer = csv.writer(response)
-    writer.writerow(['Amount', 'Description', 'Category', 'Date'])
+@login_required(login_url='/authentication/login')
+@read_from_replica
+@conditional_on_data
+@cached_analytics
+def expense_timeseries(request):
+    """API endpoint for expense totals per day/week/month/quarter/year"""
+    try:
+        start, end, granularity = timeseries_params(request.GET)
+        breakdown = 'category' if request.GET.get('breakdown') == 'category' else None
+        currency = currency_code(request.preferences.currency)
+        data = bucketed_totals(
+            Expense.objects.filter(owner=request.user), granularity, start, end,
+            breakdown=breakdown, labels=Category, convert_to=currency
+        )
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
 
-    expenses = Expense.objects.filter(owner=request.user)
+    data.update({'start': start.isoformat(), 'end': end.isoformat(), 'granularity': granularity,
+                 'currency': currency})
+    return JsonResponse(data)
 
-    for expense in expenses:
-        writer.writerow([expense.amount, expense.description, expense.category, expense.date])
 
-    return response
+@login_required(login_url='/authentication/login')
+@read_from_replica
+@conditional_on_data
+@cached_analytics
+def cash_flow_timeseries(request):
+    """API endpoint for income, expenses, net and running balance per period"""
+    try:
+        start, end, granularity = timeseries_params(request.GET)
+        currency = currency_code(request.preferences.currency)
+        data = cash_flow(
+            UserIncome.objects.filter(owner=request.user),
+            Expense.objects.filter(owner=request.user),
+            granularity, start, end, convert_to=currency
+        )
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
 
+    data.update({'start': start.isoformat(), 'end': end.isoformat(), 'granularity': granularity,
+                 'currency': currency})
+    return JsonResponse(data)
 
-def export_excel(request):
-    response = HttpResponse(content_type='application/ms-excel')
-    response['Content-Disposition'] = 'attachment; filename=Expenses'+ str(datetime.datetime.now())+'.xls'
-    wb = xlwt.Workbook(encoding='utf-8')
-    ws = wb.add_sheet('Expenses')
-    row_num = 0
-    font_style = xlwt.XFStyle()
-    font_style.font.bold = True
 
-    columns = ['Amount', 'Description', 'Category', 'Date']
+@login_required(login_url='/authentication/login')
+@read_from_replica
+def export_csv(request):
+    try:
+        filters = export_filters(request.GET, 'category')
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    filename = 'Expenses' + str(datetime.datetime.now()) + '.csv'
+    key = artifact_key(request.user.id, 'expenses', 'csv', filters)
+    cached = cached_response(key, filename, 'text/csv')
+    if cached:
+        return cached
+
+    expenses = Expense.objects.filter(owner=request.user, **filters)
+    if expenses.count() > settings.EXPORT_BACKGROUND_ROWS:
+        job = submit_export(request.user, 'expenses', 'csv', request.GET)
+        return redirect('export-job', id=job.id)
+    currency = currency_code(request.preferences.currency)
+    try:
+        check_convertible(expenses, currency)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return streaming_csv_response(
+        expenses, EXPORTS['expenses']['fields'], EXPORTS['expenses']['header'],
+        filename, cache_key=key, convert_to=currency
+    )
 
-    for col_num in range(len(columns)):
-        ws.write(row_num, col_num, columns[col_num], font_style)
 
-    font_style = xlwt.XFStyle()
-    rows = Expense.objects.filter(owner=request.user).values_list('amount', 'description', 'category', 'date')
+@login_required(login_url='/authentication/login')
+@read_from_replica
+def export_excel(request):
+    try:
+        filters = export_filters(request.GET, 'category')
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    filename = 'Expenses' + str(datetime.datetime.now()) + '.xlsx'
+    key = artifact_key(request.user.id, 'expenses', 'xlsx', filters)
+    cached = cached_response(key, filename, xlsx.CONTENT_TYPE)
+    if cached:
+        return cached
+
+    expenses = Expense.objects.filter(owner=request.user, **filters)
+    if expenses.count() > settings.EXPORT_BACKGROUND_ROWS:
+        job = submit_export(request.user, 'expenses', 'xlsx', request.GET)
+        return redirect('export-job', id=job.id)
+    currency = currency_code(request.preferences.currency)
+    try:
+        check_convertible(expenses, currency)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return streaming_xlsx_response(
+        [xlsx_sheet('Expenses', expenses, EXPORTS['expenses']['fields'],
+                    EXPORTS['expenses']['header'], convert_to=currency)],
+        filename, cache_key=key
+    )
 
-    for row in rows:
-        row_num += 1
-        for col_num in range(len(row)):
-            ws.write(row_num, col_num, str(row[col_num]), font_style)
 
-    wb.save(response)
-    return response
+@login_required(login_url='/authentication/login')
+@read_from_replica
+def export_workbook(request):
+    """Export expenses and income as two sheets of one workbook"""
+    try:
+        filters = export_filters(request.GET, None)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    filename = 'Finances' + str(datetime.datetime.now()) + '.xlsx'
+    key = artifact_key(request.user.id, 'workbook', 'xlsx', filters)
+    cached = cached_response(key, filename, xlsx.CONTENT_TYPE)
+    if cached:
+        return cached
+
+    expenses = Expense.objects.filter(owner=request.user, **filters)
+    income = UserIncome.objects.filter(owner=request.user, **filters)
+    currency = currency_code(request.preferences.currency)
+    try:
+        check_convertible(expenses, currency)
+        check_convertible(income, currency)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return streaming_xlsx_response(
+        [
+            xlsx_sheet('Expenses', expenses, EXPORTS['expenses']['fields'],
+                       EXPORTS['expenses']['header'], convert_to=currency),
+            xlsx_sheet('Income', income, EXPORTS['income']['fields'],
+                       EXPORTS['income']['header'], convert_to=currency),
+        ],
+        filename, cache_key=key
+    )
 
 
+@login_required(login_url='/authentication/login')
+@read_from_replica
 def export_pdf(request):
-    response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = 'inline; attachment; filename=Expenses'+ str(datetime.datetime.now())+'.pdf'
-    response['Content-Transfer-Encoding'] = 'binary'
-
-    expenses = Expense.objects.filter(owner=request.user)
-    sum = expenses.aggregate(Sum('amount'))
-
-    html_string = render_to_string('expenses/pdf-output.html', {
-        'expenses': expenses, 
-        'total': sum['amount__sum'], 
-        'currency': UserPreferences.objects.get(user=request.user).currency
-    })
-    
-    html = HTML(string=html_string)
-    result = html.write_pdf()
-
-    with tempfile.NamedTemporaryFile(delete=True) as output:
-        output.write(result)
-        output.flush()
-        output.seek(0)
-        response.write(output.read())
-
-    return response
\ No newline at end of file
+    try:
+        filters = export_filters(request.GET, 'category')
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    filename = 'Expenses' + str(datetime.datetime.now()) + '.pdf'
+    cached = cached_response(artifact_key(request.user.id, 'expenses', 'pdf', filters),
+                             filename, 'application/pdf')
+    if cached:
+        return cached
+
+    job = submit_export(request.user, 'expenses', 'pdf', request.GET)
+    return redirect('export-job', id=job.id)
+
+
+@login_required(login_url='/authentication/login')
+def submit_export_job(request):
+    """API endpoint queueing an export; expects kind, format and optional filters"""
+    if request.method != 'POST':
+        return JsonResponse({'error': 'POST required'}, status=405)
+
+    if request.content_type == 'application/json':
+        try:
+            params = json.loads(request.body)
+        except ValueError:
+            return JsonResponse({'error': 'Invalid JSON'}, status=400)
+        if not isinstance(params, dict):
+            return JsonResponse({'error': 'Expected a JSON object'}, status=400)
+    else:
+        params = request.POST
+    kind = params.get('kind')
+    format = params.get('format')
+    if (not isinstance(kind, str) or not isinstance(format, str)
+            or kind not in EXPORTS or format not in CONTENT_TYPES):
+        return JsonResponse({'error': 'Unknown export kind or format'}, status=400)
+    try:
+        job = submit_export(request.user, kind, format, params)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse(export_job_data(job), status=202)
+
+
+def export_job_data(job):
+    return {
+        'id': job.id,
+        'kind': job.kind,
+        'format': job.format,
+        'status': job.status,
+        'error': job.error,
+        'status_url': reverse('export-job-status', args=[job.id]),
+        'download_url': reverse('export-job-download', args=[job.id]) if job.status == ExportJob.DONE else None,
+    }
+
+
+@login_required(login_url='/authentication/login')
+def export_job(request, id):
+    job = get_object_or_404(ExportJob, pk=id, owner=request.user)
+    return render(request, 'exports/job.html', {'job': job})
+
+
+@login_required(login_url='/authentication/login')
+def export_job_status(request, id):
+    job = get_object_or_404(ExportJob, pk=id, owner=request.user)
+    return JsonResponse(export_job_data(job))
+
+
+@login_required(login_url='/authentication/login')
+def export_job_download(request, id):
+    job = get_object_or_404(ExportJob, pk=id, owner=request.user, status=ExportJob.DONE)
+    if not os.path.exists(job.file_path):
+        raise Http404('Export file has expired')
+    return FileResponse(open(job.file_path, 'rb'), as_attachment=True,
+                        filename=download_name(job), content_type=CONTENT_TYPES[job.format])
@@ -0,0 +1,183 @@
+"""Write-only, streaming .xlsx writer.
+
+Worksheets are written row by row into a zip stream that is drained after
+every batch of rows, so a workbook of any size is produced in constant
+memory and the first bytes reach the client straight away. Numbers stay
+numeric cells and dates become real Excel dates.
+"""
+import datetime
+import itertools
+import re
+import zipfile
+from decimal import Decimal
+from xml.sax.saxutils import escape
+
+CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+MAX_ROWS = 1048576
+FLUSH_ROWS = 500
+
+EXCEL_EPOCH = datetime.date(1899, 12, 30)
+ILLEGAL_XML = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+STYLE_DATE = 1
+STYLE_HEADER = 2
+
+STYLES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font>'
+    '<font><b/><sz val="11"/><name val="Calibri"/></font></fonts>'
+    '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+    '<fill><patternFill patternType="gray125"/></fill></fills>'
+    '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    '<cellXfs count="3"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+    '<xf numFmtId="14" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+    '<xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1"/></cellXfs>'
+    '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+    '</styleSheet>'
+)
+
+ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/'
+    'relationships/officeDocument" Target="xl/workbook.xml"/></Relationships>'
+)
+
+SHEET_HEAD = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+)
+SHEET_TAIL = '</sheetData></worksheet>'
+
+
+class _Sink:
+    """Unseekable file object that buffers zip output until drained."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def column_letter(index):
+    letters = ''
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+
+def cell(ref, value, style=0):
+    style_attr = ' s="%d"' % style if style else ''
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return '<c r="%s" t="b"%s><v>%d</v></c>' % (ref, style_attr, value)
+    if isinstance(value, (int, float, Decimal)):
+        return '<c r="%s"%s><v>%s</v></c>' % (ref, style_attr, value)
+    if isinstance(value, datetime.datetime):
+        value = value.date()
+    if isinstance(value, datetime.date):
+        return '<c r="%s" s="%d"><v>%d</v></c>' % (
+            ref, STYLE_DATE, (value - EXCEL_EPOCH).days
+        )
+    text = escape(ILLEGAL_XML.sub('', str(value)))
+    return '<c r="%s" t="inlineStr"%s><is><t xml:space="preserve">%s</t></is></c>' % (
+        ref, style_attr, text
+    )
+
+
+def row_xml(number, values, columns, style=0):
+    return '<row r="%d">%s</row>' % (number, ''.join(
+        cell(columns[i] + str(number), value, style) for i, value in enumerate(values)
+    ))
+
+
+def stream_workbook(sheets):
+    """Yield the bytes of an .xlsx workbook.
+
+    ``sheets`` is an iterable of ``(title, header, rows)`` where ``rows``
+    is any iterable of tuples. A sheet longer than Excel's row limit
+    continues on ``"<title> (2)"`` and so on.
+    """
+    sink = _Sink()
+    titles = []
+    with zipfile.ZipFile(sink, 'w', zipfile.ZIP_DEFLATED) as workbook:
+        for title, header, rows in sheets:
+            columns = [column_letter(i) for i in range(len(header))]
+            rows = iter(rows)
+            pending = []
+            part = 1
+            while True:
+                titles.append(title if part == 1 else '%s (%d)' % (title, part))
+                name = 'xl/worksheets/sheet%d.xml' % len(titles)
+                with workbook.open(name, 'w', force_zip64=True) as sheet:
+                    batch = [SHEET_HEAD, row_xml(1, header, columns, STYLE_HEADER)]
+                    number = 1
+                    for values in itertools.chain(pending, rows):
+                        number += 1
+                        batch.append(row_xml(number, values, columns))
+                        if len(batch) >= FLUSH_ROWS:
+                            sheet.write(''.join(batch).encode())
+                            batch = []
+                            yield sink.drain()
+                        if number == MAX_ROWS:
+                            break
+                    batch.append(SHEET_TAIL)
+                    sheet.write(''.join(batch).encode())
+                yield sink.drain()
+                # Only start another part when there is a row to put on it.
+                pending = list(itertools.islice(rows, 1))
+                if not pending:
+                    break
+                part += 1
+
+        workbook.writestr('xl/workbook.xml', (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+            'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+            '<sheets>%s</sheets></workbook>' % ''.join(
+                '<sheet name="%s" sheetId="%d" r:id="rId%d"/>' % (escape(t[:31]), i, i)
+                for i, t in enumerate(titles, 1)
+            )
+        ))
+        workbook.writestr('xl/_rels/workbook.xml.rels', (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            '%s<Relationship Id="rId%d" Type="http://schemas.openxmlformats.org/officeDocument/'
+            '2006/relationships/styles" Target="styles.xml"/></Relationships>' % (''.join(
+                '<Relationship Id="rId%d" Type="http://schemas.openxmlformats.org/officeDocument/'
+                '2006/relationships/worksheet" Target="worksheets/sheet%d.xml"/>' % (i, i)
+                for i in range(1, len(titles) + 1)
+            ), len(titles) + 1)
+        ))
+        workbook.writestr('xl/styles.xml', STYLES)
+        workbook.writestr('_rels/.rels', ROOT_RELS)
+        workbook.writestr('[Content_Types].xml', (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.'
+            'relationships+xml"/><Default Extension="xml" ContentType="application/xml"/>'
+            '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-'
+            'officedocument.spreadsheetml.sheet.main+xml"/>'
+            '<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-'
+            'officedocument.spreadsheetml.styles+xml"/>%s</Types>' % ''.join(
+                '<Override PartName="/xl/worksheets/sheet%d.xml" ContentType="application/'
+                'vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>' % i
+                for i in range(1, len(titles) + 1)
+            )
+        ))
+    yield sink.drain()
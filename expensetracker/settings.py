@@ -53,6 +53,8 @@ MIDDLEWARE = [
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "userpreferences.middleware.PreferencesMiddleware",
+    "expenses.routers.ReplicaPinMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -97,6 +99,40 @@ DATABASES = {
     }
 }
 
+# DB_POOL=1 keeps a pool of open connections in each process (psycopg 3
+# with psycopg_pool) instead of connecting on every request. Connections
+# idle longer than DB_POOL_MAX_IDLE seconds are closed down to the minimum
+# size; a request waits at most DB_POOL_TIMEOUT seconds for a free one.
+DB_POOL = os.environ.get('DB_POOL', '').lower() in ('1', 'true', 'yes')
+if DB_POOL:
+    DATABASES['default']['OPTIONS'] = {
+        'pool': {
+            'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', 2)),
+            'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', 10)),
+            'max_idle': float(os.environ.get('DB_POOL_MAX_IDLE', 600)),
+            'timeout': float(os.environ.get('DB_POOL_TIMEOUT', 30)),
+        },
+    }
+# Ping a connection before using it: pooled ones on every checkout,
+# persistent ones (CONN_MAX_AGE) once per request.
+DATABASES['default']['CONN_HEALTH_CHECKS'] = os.environ.get(
+    'DB_HEALTH_CHECKS', '1' if DB_POOL else '').lower() in ('1', 'true', 'yes')
+
+# Analytics, export and search views read the expense and income tables
+# from this alias when it is configured (DB_REPLICA_HOST), except for
+# REPLICA_PIN_SECONDS after the user changed their data; see
+# expenses/routers.py.
+DATABASE_REPLICA_ALIAS = os.environ.get('DB_REPLICA_ALIAS', 'replica')
+if os.environ.get('DB_REPLICA_HOST'):
+    DATABASES[DATABASE_REPLICA_ALIAS] = dict(
+        DATABASES['default'],
+        HOST=os.environ.get('DB_REPLICA_HOST'),
+        PORT=os.environ.get('DB_REPLICA_PORT', DATABASES['default']['PORT']),
+        TEST={'MIRROR': 'default'},
+    )
+DATABASE_ROUTERS = ['expenses.routers.ReplicaRouter']
+REPLICA_PIN_SECONDS = int(os.environ.get('REPLICA_PIN_SECONDS', 10))
+
 
 
 # Password validation
@@ -145,6 +181,67 @@ STATIC_ROOT = os.path.join(BASE_DIR, "static")
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
+# Version keys of the in-process Category/Source and exchange-rate tables
+# (expenses.lookups, expenses.rates) live here. Point every worker at one
+# shared backend, e.g. memcached or Redis, so a change made in one worker
+# reaches the others; the expenses.W001 check warns while it is local.
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', ''),
+    }
+}
+
+# Computed analytics responses (expenses.analytics). Any Django cache
+# backend works: the default local memory, django.core.cache.backends.filebased.FileBasedCache
+# with a directory as ANALYTICS_CACHE_LOCATION (default analytics-cache/
+# under the project), or
+# django.core.cache.backends.redis.RedisCache (needs the redis package)
+# with a redis:// URL for anything that speaks the Redis protocol. Keys
+# carry the user's data version, so entries are never invalidated, only
+# left to expire after ANALYTICS_CACHE_TTL seconds or to be evicted.
+ANALYTICS_CACHE_BACKEND = os.environ.get('ANALYTICS_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache')
+ANALYTICS_CACHE_LOCATION = os.environ.get('ANALYTICS_CACHE_LOCATION', os.path.join(
+    BASE_DIR, 'analytics-cache') if 'filebased' in ANALYTICS_CACHE_BACKEND else 'analytics')
+ANALYTICS_CACHE_TTL = int(os.environ.get('ANALYTICS_CACHE_TTL', 3600))
+CACHES['analytics'] = {
+    'BACKEND': ANALYTICS_CACHE_BACKEND,
+    'LOCATION': ANALYTICS_CACHE_LOCATION,
+    'TIMEOUT': ANALYTICS_CACHE_TTL,
+    'KEY_PREFIX': 'analytics',
+}
+if 'redis' not in ANALYTICS_CACHE_BACKEND:
+    # Redis bounds itself (maxmemory with an LRU policy); the local
+    # backends cull once they hold this many entries.
+    CACHES['analytics']['OPTIONS'] = {
+        'MAX_ENTRIES': int(os.environ.get('ANALYTICS_CACHE_MAX_ENTRIES', 5000)),
+    }
+
+# Seconds a user's preferences are cached (request.preferences).
+PREFERENCES_CACHE_TTL = int(os.environ.get('PREFERENCES_CACHE_TTL', 60))
+
+# Stored exchange rates are units of each currency per unit of this one.
+EXCHANGE_RATE_BASE = os.environ.get('EXCHANGE_RATE_BASE', 'USD')
+
+# List pages paginate with COUNT/OFFSET ("offset") or on (date, id) ("keyset").
+LIST_PAGINATION = os.environ.get('LIST_PAGINATION', 'offset')
+
+# Delete entries of the sync change log are kept this many days (see the
+# compact_changes command); clients with older tokens resync from scratch.
+CHANGELOG_RETENTION_DAYS = int(os.environ.get('CHANGELOG_RETENTION_DAYS', 30))
+
+# Exports rendered by the run_export_worker command are written here.
+EXPORT_ROOT = os.environ.get('EXPORT_ROOT', os.path.join(BASE_DIR, 'exports'))
+# CSV/Excel exports with more rows than this are queued instead of streamed.
+EXPORT_BACKGROUND_ROWS = int(os.environ.get('EXPORT_BACKGROUND_ROWS', 50000))
+# A job still running this many seconds after it started is taken to have
+# lost its worker and is marked failed.
+EXPORT_JOB_TIMEOUT = int(os.environ.get('EXPORT_JOB_TIMEOUT', 3600))
+# Finished exports are reused until the user's data changes; the least
+# recently used files are dropped once the directory outgrows this size.
+EXPORT_CACHE_ROOT = os.environ.get('EXPORT_CACHE_ROOT', os.path.join(EXPORT_ROOT, 'cache'))
+EXPORT_CACHE_MAX_BYTES = int(os.environ.get('EXPORT_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+
 MESSAGE_TAGS = {   # Add this line
     messages.ERROR: 'danger',
 }
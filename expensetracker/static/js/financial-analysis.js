@@ -0,0 +1,127 @@
+// Financial Analysis Charts
+const colors = [
+  'rgba(255, 99, 132, 0.8)',
+  'rgba(54, 162, 235, 0.8)',
+  'rgba(255, 206, 86, 0.8)',
+  'rgba(75, 192, 192, 0.8)',
+  'rgba(153, 102, 255, 0.8)',
+  'rgba(255, 159, 64, 0.8)',
+];
+
+// Render Categories Distribution Chart
+const renderCategoriesChart = (data, labels) => {
+  const ctx = document.getElementById('categoriesChart').getContext('2d');
+  new Chart(ctx, {
+    type: 'doughnut',
+    data: {
+      labels: labels,
+      datasets: [{
+        data: data,
+        backgroundColor: colors,
+        borderWidth: 2,
+        borderColor: '#ffffff'
+      }]
+    },
+    options: {
+      responsive: true,
+      maintainAspectRatio: false,
+      plugins: {
+        legend: {
+          position: 'bottom',
+        }
+      }
+    }
+  });
+};
+
+// Render Monthly Breakdown Chart
+const renderMonthlyChart = (data, labels) => {
+  const ctx = document.getElementById('monthlyChart').getContext('2d');
+  new Chart(ctx, {
+    type: 'bar',
+    data: {
+      labels: labels,
+      datasets: [{
+        label: 'Monthly Expenses',
+        data: data,
+        backgroundColor: 'rgba(54, 162, 235, 0.8)',
+        borderColor: 'rgba(54, 162, 235, 1)',
+        borderWidth: 1
+      }]
+    },
+    options: {
+      responsive: true,
+      maintainAspectRatio: false,
+      scales: {
+        y: {
+          beginAtZero: true
+        }
+      }
+    }
+  });
+};
+
+// Render Top Categories Chart
+const renderTopCategoriesChart = (data, labels) => {
+  const ctx = document.getElementById('topCategoriesChart').getContext('2d');
+  new Chart(ctx, {
+    type: 'horizontalBar',
+    data: {
+      labels: labels,
+      datasets: [{
+        label: 'Amount Spent',
+        data: data,
+        backgroundColor: colors.slice(0, data.length),
+        borderWidth: 1
+      }]
+    },
+    options: {
+      responsive: true,
+      maintainAspectRatio: false,
+      scales: {
+        x: {
+          beginAtZero: true
+        }
+      }
+    }
+  });
+};
+
+const renderTotals = (results) => {
+  const totals = {
+    'income-total': results.income.total,
+    'expense-total': results.expenses.total,
+    'net-total': results.net,
+  };
+  Object.entries(totals).forEach(([id, value]) => {
+    const element = document.getElementById(id);
+    if (element) {
+      element.textContent = `${results.currency} ${value.toFixed(2)}`;
+    }
+  });
+};
+
+// Fetch every chart's data in one request
+const loadFinancialAnalysis = () => {
+  fetch('/dashboard/', { credentials: 'same-origin' })
+    .then(res => {
+      if (!res.ok) {
+        throw new Error(`HTTP error! status: ${res.status}`);
+      }
+      return res.json();
+    })
+    .then(results => {
+      const categoryData = results.expenses.categories;
+      renderCategoriesChart(Object.values(categoryData), Object.keys(categoryData));
+
+      const top = results.expenses.top_categories;
+      renderTopCategoriesChart(top.map(item => item.total), top.map(item => item.name));
+
+      renderMonthlyChart(results.expenses.monthly, results.months);
+      renderTotals(results);
+    })
+    .catch(error => console.error('Error loading financial analysis:', error));
+};
+
+// Load charts when DOM is ready
+document.addEventListener('DOMContentLoaded', loadFinancialAnalysis);
\ No newline at end of file
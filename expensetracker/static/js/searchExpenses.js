@@ -6,43 +6,76 @@ tableOutput.style.display = "none";
 const noResults = document.querySelector(".no-results");
 const tbody = document.querySelector(".table-body");
 
+const loadMoreButton = document.createElement("button");
+loadMoreButton.className = "btn btn-outline-secondary btn-sm";
+loadMoreButton.textContent = "Load more";
+loadMoreButton.style.display = "none";
+tableOutput.appendChild(loadMoreButton);
+
+let nextCursor = null;
+let searchTimer = null;
+let currentSearch = "";
+
+const appendRows = (results) => {
+  results.forEach((item) => {
+    const row = document.createElement("tr");
+    [item.amount, item.category, item.description, item.date].forEach((value) => {
+      const cell = document.createElement("td");
+      cell.textContent = value;
+      row.appendChild(cell);
+    });
+    tbody.appendChild(row);
+  });
+};
+
+const fetchResults = (searchValue, cursor) => {
+  return fetch("/search-expenses", {
+    body: JSON.stringify({ searchText: searchValue, cursor: cursor }),
+    method: "POST",
+  })
+    .then((res) => res.json())
+    .then((data) => {
+      if (searchValue !== currentSearch) {
+        return;
+      }
+      appTable.style.display = "none";
+
+      if (!cursor && data.results.length === 0) {
+        noResults.style.display = "block";
+        tableOutput.style.display = "none";
+      } else {
+        noResults.style.display = "none";
+        tableOutput.style.display = "block";
+        appendRows(data.results);
+      }
+      nextCursor = data.next;
+      loadMoreButton.style.display = data.has_more ? "block" : "none";
+    });
+};
+
+loadMoreButton.addEventListener("click", () => {
+  if (nextCursor) {
+    fetchResults(currentSearch, nextCursor);
+  }
+});
+
 searchField.addEventListener("keyup", (e) => {
   const searchValue = e.target.value;
+  clearTimeout(searchTimer);
 
   if (searchValue.trim().length > 0) {
-    paginationContainer.style.display = "none";
-    tbody.innerHTML = "";
-    fetch("/search-expenses", {
-      body: JSON.stringify({ searchText: searchValue }),
-      method: "POST",
-    })
-      .then((res) => res.json())
-      .then((data) => {
-        console.log("data", data);
-        appTable.style.display = "none";
-        tableOutput.style.display = "block";
-
-        console.log("data.length", data.length);
-
-        if (data.length === 0) {
-          noResults.style.display = "block";
-          tableOutput.style.display = "none";
-        } else {
-          noResults.style.display = "none";
-          data.forEach((item) => {
-            tbody.innerHTML += `
-                <tr>
-                <td>${item.amount}</td>
-                <td>${item.category}</td>
-                <td>${item.description}</td>
-                <td>${item.date}</td>
-                </tr>`;
-          });
-        }
-      });
+    searchTimer = setTimeout(() => {
+      currentSearch = searchValue;
+      paginationContainer.style.display = "none";
+      tbody.innerHTML = "";
+      nextCursor = null;
+      fetchResults(searchValue, null);
+    }, 250);
   } else {
+    currentSearch = "";
     tableOutput.style.display = "none";
+    noResults.style.display = "none";
     appTable.style.display = "block";
     paginationContainer.style.display = "block";
   }
-});
\ No newline at end of file
+});
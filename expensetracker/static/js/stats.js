@@ -26,8 +26,7 @@ async function loadExpenseAnalysis() {
     try {
         console.log("Fetching expense category data...");
         
-        // Use your existing endpoint
-        const response = await fetch('/expense_category_summary');
+        const response = await fetch('/dashboard/', { credentials: 'same-origin' });
         
         if (!response.ok) {
             throw new Error(`HTTP error! status: ${response.status}`);
@@ -36,13 +35,13 @@ async function loadExpenseAnalysis() {
         const data = await response.json();
         console.log("Chart data results:", data);
         
-        if (!data || !data.expense_category_data) {
+        if (!data || !data.expenses) {
             console.error("No expense category data found in response:", data);
             showErrorMessage("No expense data available to display.");
             return;
         }
 
-        const category_data = data.expense_category_data;
+        const category_data = data.expenses.categories;
         
         // Check if we have any data
         if (Object.keys(category_data).length === 0) {
@@ -87,34 +87,40 @@ const renderTopCategoriesChart = (data, labels) => {
   });
 };
 
-// Fetch and load all chart data
+const renderTotals = (results) => {
+  const totals = {
+    'income-total': results.income.total,
+    'expense-total': results.expenses.total,
+    'net-total': results.net,
+  };
+  Object.entries(totals).forEach(([id, value]) => {
+    const element = document.getElementById(id);
+    if (element) {
+      element.textContent = `${results.currency} ${value.toFixed(2)}`;
+    }
+  });
+};
+
+// Fetch every chart's data in one request
 const loadFinancialAnalysis = () => {
-  // Fetch categories data
-  fetch('/expense_category_summary')
-    .then(res => res.json())
-    .then(results => {
-      if (results && results.expense_category_data) {
-        const categoryData = results.expense_category_data;
-        const labels = Object.keys(categoryData);
-        const data = Object.values(categoryData);
-        renderCategoriesChart(data, labels);
-        renderTopCategoriesChart(data, labels);
+  fetch('/dashboard/', { credentials: 'same-origin' })
+    .then(res => {
+      if (!res.ok) {
+        throw new Error(`HTTP error! status: ${res.status}`);
       }
+      return res.json();
     })
-    .catch(error => console.error('Error loading categories:', error));
-
-  // Fetch monthly data (you'll need to create this endpoint)
-  fetch('/monthly_expense_summary')
-    .then(res => res.json())
     .then(results => {
-      if (results && results.monthly_data) {
-        const monthlyData = results.monthly_data;
-        const labels = Object.keys(monthlyData);
-        const data = Object.values(monthlyData);
-        renderMonthlyChart(data, labels);
-      }
+      const categoryData = results.expenses.categories;
+      renderCategoriesChart(Object.values(categoryData), Object.keys(categoryData));
+
+      const top = results.expenses.top_categories;
+      renderTopCategoriesChart(top.map(item => item.total), top.map(item => item.name));
+
+      renderMonthlyChart(results.expenses.monthly, results.months);
+      renderTotals(results);
     })
-    .catch(error => console.error('Error loading monthly data:', error));
+    .catch(error => console.error('Error loading financial analysis:', error));
 };
 
 // Load charts when DOM is ready
@@ -48,12 +48,12 @@ const getIncomeChartData = () => {
     })
     .then((results) => {
       console.log("income results", results);
-      if (!results || !results.income_source_data) {
+      if (!results || !results.income_sources_data) {
         console.error("No income source data found.");
         return;
       }
 
-      const source_data = results.income_source_data;
+      const source_data = results.income_sources_data;
       const [labels, data] = [
         Object.keys(source_data),
         Object.values(source_data),
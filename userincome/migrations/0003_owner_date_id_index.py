@@ -0,0 +1,21 @@
+# Generated by Django 5.1.6 on 2026-10-18 17:06
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("userincome", "0002_search_indexes"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="userincome",
+            index=models.Index(
+                fields=["owner", "-date", "-id"], name="income_owner_date_id_idx"
+            ),
+        ),
+    ]
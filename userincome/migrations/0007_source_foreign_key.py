@@ -0,0 +1,169 @@
+# Generated by Django 5.1.6 on 2026-10-18 18:05
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+OLD_TEXT_FIELDS = ["description", "source"]
+TEXT_FIELDS = ["description"]
+
+
+# Frozen copies of expenses.search.install_fulltext and uninstall_fulltext
+# as they were when this migration was written.
+def install_fulltext(schema_editor, table, fields):
+    connection = schema_editor.connection
+    if connection.vendor == "postgresql":
+        document = " || ' ' || ".join("coalesce(%s, '')" % field for field in fields)
+        schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        schema_editor.execute(
+            "CREATE INDEX IF NOT EXISTS %s_search_idx ON %s "
+            "USING gin (to_tsvector('simple', %s))" % (table, table, document)
+        )
+        for field in fields:
+            schema_editor.execute(
+                "CREATE INDEX IF NOT EXISTS %s_%s_trgm_idx ON %s "
+                "USING gin (%s gin_trgm_ops)" % (table, field, table, field)
+            )
+    elif connection.vendor == "sqlite":
+        install_sqlite_fulltext(schema_editor, table, fields)
+
+
+def uninstall_fulltext(schema_editor, table, fields):
+    connection = schema_editor.connection
+    if connection.vendor == "postgresql":
+        schema_editor.execute("DROP INDEX IF EXISTS %s_search_idx" % table)
+        for field in fields:
+            schema_editor.execute("DROP INDEX IF EXISTS %s_%s_trgm_idx" % (table, field))
+    elif connection.vendor == "sqlite":
+        fts = table + "_fts"
+        for suffix in ("ai", "ad", "au"):
+            schema_editor.execute("DROP TRIGGER IF EXISTS %s_%s" % (fts, suffix))
+        schema_editor.execute("DROP TABLE IF EXISTS %s" % fts)
+
+
+def install_sqlite_fulltext(schema_editor, table, fields):
+    fts = table + "_fts"
+    columns = ", ".join(fields)
+    delete_old = "INSERT INTO %s(%s, rowid, %s) VALUES ('delete', old.id, %s);" % (
+        fts,
+        fts,
+        columns,
+        ", ".join("old.%s" % field for field in fields),
+    )
+    insert_new = "INSERT INTO %s(rowid, %s) VALUES (new.id, %s);" % (
+        fts,
+        columns,
+        ", ".join("new.%s" % field for field in fields),
+    )
+    try:
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS %s USING fts5(%s, content='%s', "
+            "content_rowid='id')" % (fts, columns, table)
+        )
+    except Exception:
+        # SQLite built without FTS5; search falls back to icontains.
+        return
+    for suffix in ("ai", "ad", "au"):
+        schema_editor.execute("DROP TRIGGER IF EXISTS %s_%s" % (fts, suffix))
+    schema_editor.execute(
+        "CREATE TRIGGER %s_ai AFTER INSERT ON %s BEGIN %s END" % (fts, table, insert_new)
+    )
+    schema_editor.execute(
+        "CREATE TRIGGER %s_ad AFTER DELETE ON %s BEGIN %s END" % (fts, table, delete_old)
+    )
+    schema_editor.execute(
+        "CREATE TRIGGER %s_au AFTER UPDATE ON %s BEGIN %s %s END"
+        % (fts, table, delete_old, insert_new)
+    )
+    schema_editor.execute("INSERT INTO %s(%s) VALUES ('rebuild')" % (fts, fts))
+
+
+def drop_old_fulltext(apps, schema_editor):
+    uninstall_fulltext(schema_editor, "userincome_userincome", OLD_TEXT_FIELDS)
+
+
+def restore_old_fulltext(apps, schema_editor):
+    install_fulltext(schema_editor, "userincome_userincome", OLD_TEXT_FIELDS)
+
+
+def install_new_fulltext(apps, schema_editor):
+    install_fulltext(schema_editor, "userincome_userincome", TEXT_FIELDS)
+
+
+def drop_new_fulltext(apps, schema_editor):
+    uninstall_fulltext(schema_editor, "userincome_userincome", TEXT_FIELDS)
+
+
+def names_to_sources(apps, schema_editor):
+    UserIncome = apps.get_model("userincome", "UserIncome")
+    Source = apps.get_model("userincome", "Source")
+    names = set(
+        UserIncome.objects.exclude(source__isnull=True)
+        .exclude(source="")
+        .values_list("source", flat=True)
+        .distinct()
+    )
+    known = set(Source.objects.values_list("name", flat=True))
+    Source.objects.bulk_create([Source(name=name) for name in sorted(names - known)])
+    # Duplicate names resolve to the oldest source.
+    UserIncome.objects.update(
+        source_ref=Subquery(
+            Source.objects.filter(name=OuterRef("source"))
+            .order_by("pk")
+            .values("pk")[:1]
+        )
+    )
+
+
+def sources_to_names(apps, schema_editor):
+    UserIncome = apps.get_model("userincome", "UserIncome")
+    Source = apps.get_model("userincome", "Source")
+    UserIncome.objects.update(
+        source=Subquery(
+            Source.objects.filter(pk=OuterRef("source_ref")).values("name")[:1]
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("userincome", "0006_money_amounts"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_old_fulltext, restore_old_fulltext),
+        migrations.AddField(
+            model_name="userincome",
+            name="source_ref",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.PROTECT,
+                to="userincome.source",
+            ),
+        ),
+        migrations.RunPython(names_to_sources, sources_to_names),
+        migrations.RemoveIndex(
+            model_name="userincome",
+            name="income_owner_src_date_idx",
+        ),
+        migrations.RemoveField(
+            model_name="userincome",
+            name="source",
+        ),
+        migrations.RenameField(
+            model_name="userincome",
+            old_name="source_ref",
+            new_name="source",
+        ),
+        migrations.AddIndex(
+            model_name="userincome",
+            index=models.Index(
+                fields=["owner", "source", "date"], name="income_owner_src_date_idx"
+            ),
+        ),
+        migrations.RunPython(install_new_fulltext, drop_new_fulltext),
+    ]
@@ -0,0 +1,94 @@
+# Generated by Django 5.1.6 on 2026-10-18 17:36
+
+from django.db import migrations, models
+
+TEXT_FIELDS = ["description"]
+
+
+# Frozen copy of expenses.money.currency_code as it was when this migration
+# was written.
+DEFAULT_CURRENCY = "USD"
+
+
+def currency_code(value):
+    code = (value or "").split(" - ")[0].strip().upper()
+    return code or DEFAULT_CURRENCY
+
+
+# Frozen copy of the SQLite part of expenses.search.install_fulltext as it
+# was when this migration was written.
+def install_sqlite_fulltext(schema_editor, table, fields):
+    fts = table + "_fts"
+    columns = ", ".join(fields)
+    delete_old = "INSERT INTO %s(%s, rowid, %s) VALUES ('delete', old.id, %s);" % (
+        fts,
+        fts,
+        columns,
+        ", ".join("old.%s" % field for field in fields),
+    )
+    insert_new = "INSERT INTO %s(rowid, %s) VALUES (new.id, %s);" % (
+        fts,
+        columns,
+        ", ".join("new.%s" % field for field in fields),
+    )
+    try:
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS %s USING fts5(%s, content='%s', "
+            "content_rowid='id')" % (fts, columns, table)
+        )
+    except Exception:
+        # SQLite built without FTS5; search falls back to icontains.
+        return
+    for suffix in ("ai", "ad", "au"):
+        schema_editor.execute("DROP TRIGGER IF EXISTS %s_%s" % (fts, suffix))
+    schema_editor.execute(
+        "CREATE TRIGGER %s_ai AFTER INSERT ON %s BEGIN %s END" % (fts, table, insert_new)
+    )
+    schema_editor.execute(
+        "CREATE TRIGGER %s_ad AFTER DELETE ON %s BEGIN %s END" % (fts, table, delete_old)
+    )
+    schema_editor.execute(
+        "CREATE TRIGGER %s_au AFTER UPDATE ON %s BEGIN %s %s END"
+        % (fts, table, delete_old, insert_new)
+    )
+    schema_editor.execute("INSERT INTO %s(%s) VALUES ('rebuild')" % (fts, fts))
+
+
+def fill_currencies(apps, schema_editor):
+    """Give every row its owner's preferred currency, one UPDATE per currency."""
+    UserIncome = apps.get_model("userincome", "UserIncome")
+    UserPreferences = apps.get_model("userpreferences", "UserPreferences")
+    owners = {}
+    for user_id, currency in UserPreferences.objects.values_list("user_id", "currency"):
+        owners.setdefault(currency_code(currency), []).append(user_id)
+    for code, user_ids in owners.items():
+        for start in range(0, len(user_ids), 500):
+            UserIncome.objects.filter(
+                owner_id__in=user_ids[start : start + 500], currency=""
+            ).update(currency=code)
+    UserIncome.objects.filter(currency="").update(currency=DEFAULT_CURRENCY)
+
+
+def reinstall_fulltext(apps, schema_editor):
+    # SQLite rebuilds the table to add or drop the column, dropping the triggers.
+    if schema_editor.connection.vendor == "sqlite":
+        install_sqlite_fulltext(schema_editor, "userincome_userincome", TEXT_FIELDS)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("userincome", "0007_source_foreign_key"),
+        ("userpreferences", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.RunPython(migrations.RunPython.noop, reinstall_fulltext),
+        migrations.AddField(
+            model_name="userincome",
+            name="currency",
+            field=models.CharField(blank=True, default="", max_length=3),
+        ),
+        migrations.RunPython(fill_currencies, migrations.RunPython.noop),
+        migrations.RunPython(reinstall_fulltext, migrations.RunPython.noop),
+    ]
@@ -2,18 +2,30 @@ from django.db import models
 from django.contrib.auth.models import User
 from django.utils.timezone import now
 
+from expenses.money import MoneyField
+
 class UserIncome(models.Model):
-    amount = models.FloatField()
+    amount = MoneyField()
     date = models.DateField(default=now)
     description = models.TextField()
     owner = models.ForeignKey(to=User, on_delete=models.CASCADE)
-    source = models.CharField(max_length=266,null=True, blank=True)
+    source = models.ForeignKey(to='Source', on_delete=models.PROTECT, null=True, blank=True)
+    # ISO code of the amount; filled from the owner's preference when blank.
+    currency = models.CharField(max_length=3, blank=True, default='')
+    # Hash of date, amount and description used to skip duplicate imports.
+    fingerprint = models.CharField(max_length=64, blank=True, default='')
 
     def __str__(self):
-        return self.source
+        return str(self.source)
 
     class Meta:
         ordering = ['-date']
+        indexes = [
+            models.Index(fields=['owner', 'amount'], name='income_owner_amount_idx'),
+            models.Index(fields=['owner', '-date', '-id'], name='income_owner_date_id_idx'),
+            models.Index(fields=['owner', 'source', 'date'], name='income_owner_src_date_idx'),
+            models.Index(fields=['owner', 'fingerprint'], name='income_owner_fprint_idx'),
+        ]
 
 
 class Source(models.Model):
@@ -9,6 +9,8 @@ urlpatterns = [
     path('edit-income/<int:id>', views.income_edit, name='income-edit'),
     path('income-delete/<int:id>', views.income_delete, name='income-delete'),
     path('search-income', csrf_exempt(views.search_income), name='search-income'),
+    path('income_timeseries/', views.income_timeseries, name='income-timeseries'),
+    path('income_sources_data/', views.income_source_summary, name='income-source-summary'),
     path('export_csv/', views.export_csv, name='income-export-csv'),
     path('export_excel/', views.export_excel, name='income-export-excel'), 
     path('export_pdf/', views.export_pdf, name='income-export-pdf'),
@@ -1,74 +1,100 @@
 from django.shortcuts import render, redirect
 from .models import Source, UserIncome
 from django.core.paginator import Paginator
-from userpreferences.models import UserPreferences
+from django.conf import settings
+from expenses.aggregation import bucketed_totals, grouped_totals, timeseries_params
+from expenses import xlsx
+from expenses.artifacts import artifact_key, cached_response
+from expenses.analytics import cached_analytics
+from expenses.conditional import conditional_on_data, conditional_page
+from expenses.exports import (
+    check_convertible, export_filters, streaming_csv_response, streaming_xlsx_response,
+    xlsx_sheet,
+)
+from expenses.jobs import EXPORTS, submit_export
+from expenses.lookups import sources, table
+from expenses.money import currency_code, parse_amount
+from expenses.pagination import KeysetPaginator
+from expenses.routers import read_from_replica
+from expenses.search import search, search_page, search_request
+from userpreferences.currencies import catalog, parse_currency
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse, HttpResponse
-from django.db.models import Sum
-from django.template.loader import render_to_string
+from django.http import JsonResponse
 import json
 import datetime
-import csv
-import xlwt
-import tempfile
-from weasyprint import HTML
 
 
+SEARCH_FIELDS = ('description', 'source__name')
+RESULT_FIELDS = ('id', 'amount', 'currency', 'date', 'description', 'source__name')
+
+
+@read_from_replica
 def search_income(request):
-    if request.method == 'POST':
-        search_str = json.loads(request.body).get('searchText')
-        income = UserIncome.objects.filter(
-            amount__istartswith=search_str, owner=request.user) | UserIncome.objects.filter(
-            date__istartswith=search_str, owner=request.user) | UserIncome.objects.filter(
-            description__icontains=search_str, owner=request.user) | UserIncome.objects.filter(
-            source__icontains=search_str, owner=request.user)
-        data = income.values()
-        return JsonResponse(list(data), safe=False)
+    if request.method != 'POST':
+        return JsonResponse({'error': 'POST required'}, status=405)
+    try:
+        search_str, cursor, limit = search_request(request.body)
+        income = search(
+            UserIncome.objects.filter(owner=request.user), search_str, SEARCH_FIELDS
+        )
+        page = search_page(income, search_str, RESULT_FIELDS, cursor=cursor, limit=limit)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse(page)
 
 
 @login_required(login_url='/authentication/login')
+@conditional_page
 def index(request):
-    categories = Source.objects.all()
-    income = UserIncome.objects.filter(owner=request.user)
-    paginator = Paginator(income, 5)
-    page_number = request.GET.get('page')
-    page_obj = Paginator.get_page(paginator, page_number)
-    currency = UserPreferences.objects.get(user=request.user).currency
+    income = UserIncome.objects.filter(owner=request.user).select_related('source')
+    if settings.LIST_PAGINATION == 'keyset' or 'cursor' in request.GET:
+        page_obj = KeysetPaginator(income, 5).get_page(request.GET.get('cursor'))
+    else:
+        paginator = Paginator(income, 5)
+        page_number = request.GET.get('page')
+        page_obj = Paginator.get_page(paginator, page_number)
+    currency = request.preferences.currency
     context = {
-        'income': income,
         'page_obj': page_obj,
-        'currency': currency
+        'currency': currency,
+        'currency_code': currency_code(currency),
     }
     return render(request, 'income/index.html', context)
 
 
 @login_required(login_url='/authentication/login')
 def add_income(request):
-    sources = Source.objects.all()
     context = {
-        'sources': sources,
+        'sources': sources(),
+        'currencies': catalog().currencies,
+        'default_currency': currency_code(request.preferences.currency),
         'values': request.POST
     }
     if request.method == 'GET':
         return render(request, 'income/add_income.html', context)
 
     if request.method == 'POST':
-        amount = request.POST['amount']
-
-        if not amount:
-            messages.error(request, 'Amount is required')
+        try:
+            currency = parse_currency(request.POST.get('currency'), context['default_currency'])
+            amount = parse_amount(request.POST.get('amount'), currency)
+        except ValueError as e:
+            messages.error(request, str(e))
             return render(request, 'income/add_income.html', context)
         description = request.POST['description']
         date = request.POST['income_date']
-        source = request.POST['source']
+        source = request.POST.get('source', '').strip()
+        source = table(Source).get(source)
 
         if not description:
             messages.error(request, 'description is required')
             return render(request, 'income/add_income.html', context)
+        if not source:
+            messages.error(request, 'Choose a valid source')
+            return render(request, 'income/add_income.html', context)
 
-        UserIncome.objects.create(owner=request.user, amount=amount, date=date,
-                                  source=source, description=description)
+        UserIncome.objects.create(owner=request.user, amount=amount, currency=currency,
+                                  date=date, source=source, description=description)
         messages.success(request, 'Record saved successfully')
 
         return redirect('income')
@@ -77,28 +103,35 @@ def add_income(request):
 @login_required(login_url='/authentication/login')
 def income_edit(request, id):
     income = UserIncome.objects.get(pk=id)
-    sources = Source.objects.all()
     context = {
         'income': income,
         'values': income,
-        'sources': sources
+        'sources': sources(),
+        'currencies': catalog().currencies,
+        'default_currency': income.currency or currency_code(request.preferences.currency),
     }
     if request.method == 'GET':
         return render(request, 'income/edit_income.html', context)
     if request.method == 'POST':
-        amount = request.POST['amount']
-
-        if not amount:
-            messages.error(request, 'Amount is required')
+        try:
+            currency = parse_currency(request.POST.get('currency'), context['default_currency'])
+            amount = parse_amount(request.POST.get('amount'), currency)
+        except ValueError as e:
+            messages.error(request, str(e))
             return render(request, 'income/edit_income.html', context)
         description = request.POST['description']
         date = request.POST['income_date']
-        source = request.POST['source']
+        source = request.POST.get('source', '').strip()
+        source = table(Source).get(source)
 
         if not description:
             messages.error(request, 'description is required')
             return render(request, 'income/edit_income.html', context)
+        if not source:
+            messages.error(request, 'Choose a valid source')
+            return render(request, 'income/edit_income.html', context)
         income.amount = amount
+        income.currency = currency
         income.date = date
         income.source = source
         income.description = description
@@ -117,73 +150,121 @@ def income_delete(request, id):
     return redirect('income')
 
 
-# Export functions
 @login_required(login_url='/authentication/login')
-def export_csv(request):
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = 'attachment; filename=Income' + str(datetime.datetime.now()) + '.csv'
+@read_from_replica
+@conditional_on_data
+@cached_analytics
+def income_timeseries(request):
+    """API endpoint for income totals per day/week/month/quarter/year"""
+    try:
+        start, end, granularity = timeseries_params(request.GET)
+        breakdown = 'source' if request.GET.get('breakdown') == 'source' else None
+        currency = currency_code(request.preferences.currency)
+        data = bucketed_totals(
+            UserIncome.objects.filter(owner=request.user), granularity, start, end,
+            breakdown=breakdown, labels=Source, convert_to=currency
+        )
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    data.update({'start': start.isoformat(), 'end': end.isoformat(), 'granularity': granularity,
+                 'currency': currency})
+    return JsonResponse(data)
 
-    writer = csv.writer(response)
-    writer.writerow(['Amount', 'Description', 'Source', 'Date'])
 
-    income = UserIncome.objects.filter(owner=request.user)
+@login_required(login_url='/authentication/login')
+@read_from_replica
+@conditional_on_data
+@cached_analytics
+def income_source_summary(request):
+    """API endpoint for income per source over the last six months"""
+    todays_date = datetime.date.today()
+    six_months_ago = todays_date - datetime.timedelta(days=180)
+    currency = currency_code(request.preferences.currency)
+    try:
+        summary = grouped_totals(
+            UserIncome.objects.filter(owner=request.user), 'source',
+            start=six_months_ago, end=todays_date, labels=Source, convert_to=currency
+        )
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    return JsonResponse({'income_sources_data': summary['groups'], 'currency': currency})
 
-    for item in income:
-        writer.writerow([item.amount, item.description, item.source, item.date])
 
-    return response
+# Export functions
+@login_required(login_url='/authentication/login')
+@read_from_replica
+def export_csv(request):
+    try:
+        filters = export_filters(request.GET, 'source')
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    filename = 'Income' + str(datetime.datetime.now()) + '.csv'
+    key = artifact_key(request.user.id, 'income', 'csv', filters)
+    cached = cached_response(key, filename, 'text/csv')
+    if cached:
+        return cached
+
+    income = UserIncome.objects.filter(owner=request.user, **filters)
+    if income.count() > settings.EXPORT_BACKGROUND_ROWS:
+        job = submit_export(request.user, 'income', 'csv', request.GET)
+        return redirect('export-job', id=job.id)
+    currency = currency_code(request.preferences.currency)
+    try:
+        check_convertible(income, currency)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return streaming_csv_response(
+        income, EXPORTS['income']['fields'], EXPORTS['income']['header'],
+        filename, cache_key=key, convert_to=currency
+    )
 
 
 @login_required(login_url='/authentication/login')
+@read_from_replica
 def export_excel(request):
-    response = HttpResponse(content_type='application/ms-excel')
-    response['Content-Disposition'] = 'attachment; filename=Income' + str(datetime.datetime.now()) + '.xls'
-    
-    wb = xlwt.Workbook(encoding='utf-8')
-    ws = wb.add_sheet('Income')
-    row_num = 0
-    font_style = xlwt.XFStyle()
-    font_style.font.bold = True
-
-    columns = ['Amount', 'Description', 'Source', 'Date']
-
-    for col_num in range(len(columns)):
-        ws.write(row_num, col_num, columns[col_num], font_style)
-
-    font_style = xlwt.XFStyle()
-    rows = UserIncome.objects.filter(owner=request.user).values_list('amount', 'description', 'source', 'date')
-
-    for row in rows:
-        row_num += 1
-        for col_num in range(len(row)):
-            ws.write(row_num, col_num, str(row[col_num]), font_style)
-
-    wb.save(response)
-    return response
+    try:
+        filters = export_filters(request.GET, 'source')
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    filename = 'Income' + str(datetime.datetime.now()) + '.xlsx'
+    key = artifact_key(request.user.id, 'income', 'xlsx', filters)
+    cached = cached_response(key, filename, xlsx.CONTENT_TYPE)
+    if cached:
+        return cached
+
+    income = UserIncome.objects.filter(owner=request.user, **filters)
+    if income.count() > settings.EXPORT_BACKGROUND_ROWS:
+        job = submit_export(request.user, 'income', 'xlsx', request.GET)
+        return redirect('export-job', id=job.id)
+    currency = currency_code(request.preferences.currency)
+    try:
+        check_convertible(income, currency)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return streaming_xlsx_response(
+        [xlsx_sheet('Income', income, EXPORTS['income']['fields'], EXPORTS['income']['header'],
+                    convert_to=currency)],
+        filename, cache_key=key
+    )
 
 
 @login_required(login_url='/authentication/login')
+@read_from_replica
 def export_pdf(request):
-    response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = 'inline; attachment; filename=Income' + str(datetime.datetime.now()) + '.pdf'
-    response['Content-Transfer-Encoding'] = 'binary'
-
-    income = UserIncome.objects.filter(owner=request.user)
-    sum_income = income.aggregate(Sum('amount'))
-
-    html_string = render_to_string('income/pdf-output.html', {
-        'income': income, 
-        'total': sum_income['amount__sum'], 
-        'currency': UserPreferences.objects.get(user=request.user).currency
-    })
-    
-    html = HTML(string=html_string)
-    result = html.write_pdf()
-
-    with tempfile.NamedTemporaryFile(delete=True) as output:
-        output.write(result)
-        output.flush()
-        output.seek(0)
-        response.write(output.read())
-
-    return response
\ No newline at end of file
+    try:
+        filters = export_filters(request.GET, 'source')
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    filename = 'Income' + str(datetime.datetime.now()) + '.pdf'
+    cached = cached_response(artifact_key(request.user.id, 'income', 'pdf', filters),
+                             filename, 'application/pdf')
+    if cached:
+        return cached
+
+    job = submit_export(request.user, 'income', 'pdf', request.GET)
+    return redirect('export-job', id=job.id)
@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class UserpreferencesConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "userpreferences"
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from .currencies import load_catalog
+        load_catalog()
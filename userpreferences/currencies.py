@@ -0,0 +1,63 @@
+"""The currency catalog, read from ``currencies.json`` once per process.
+
+:func:`load_catalog` runs from ``AppConfig.ready``; the result is immutable
+and shared by every request, so the preferences page never touches the
+file again.
+"""
+import hashlib
+import json
+import os
+from typing import NamedTuple
+
+from django.conf import settings
+
+
+class Currency(NamedTuple):
+    code: str
+    name: str
+
+    @property
+    def label(self):
+        """The form stored in ``UserPreferences.currency``."""
+        return '%s - %s' % (self.code, self.name)
+
+
+class Catalog(NamedTuple):
+    currencies: tuple
+    codes: frozenset
+    labels: frozenset
+    # Changes with the file, so cached renderings of an old catalog go unused.
+    version: str
+
+
+_catalog = None
+
+
+def load_catalog(path=None):
+    global _catalog
+    path = path or os.path.join(settings.BASE_DIR, 'currencies.json')
+    with open(path, 'rb') as catalog_file:
+        raw = catalog_file.read()
+    currencies = tuple(Currency(code, name) for code, name in json.loads(raw).items())
+    _catalog = Catalog(
+        currencies=currencies,
+        codes=frozenset(currency.code for currency in currencies),
+        labels=frozenset(currency.label for currency in currencies),
+        version=hashlib.sha256(raw).hexdigest()[:12],
+    )
+    return _catalog
+
+
+def catalog():
+    return _catalog or load_catalog()
+
+
+def parse_currency(value, default):
+    """The ISO code submitted as ``value``, or ``default`` when it is blank.
+
+    Raises ``ValueError`` for a code that is not in the catalog.
+    """
+    code = str(value or '').strip().upper() or default
+    if code not in catalog().codes:
+        raise ValueError('Choose a valid currency')
+    return code
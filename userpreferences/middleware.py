@@ -0,0 +1,14 @@
+from django.utils.functional import SimpleLazyObject
+
+from .preferences import preferences_for
+
+
+class PreferencesMiddleware:
+    """Attach the user's preferences to ``request.preferences``, loaded on first use."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.preferences = SimpleLazyObject(lambda: preferences_for(request.user.id))
+        return self.get_response(request)
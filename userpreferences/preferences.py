@@ -0,0 +1,31 @@
+"""Per-user preferences read through a short-lived cache.
+
+Views get them as ``request.preferences`` (see :mod:`.middleware`), which
+loads at most once per request; code without a request calls
+:func:`preferences_for`. Saving or deleting a row drops its cache entry,
+and ``PREFERENCES_CACHE_TTL`` bounds how long another worker can see an
+old value when the cache is not shared.
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import UserPreferences
+
+CACHE_KEY = 'preferences:%s'
+
+
+def cache_key(user_id):
+    return CACHE_KEY % user_id
+
+
+def preferences_for(user_id):
+    """The user's ``UserPreferences``, or an unsaved blank one if there is none."""
+    if user_id is None:
+        return UserPreferences()
+    cached = cache.get(cache_key(user_id))
+    if cached is None:
+        row = UserPreferences.objects.filter(user_id=user_id).values_list('pk', 'currency').first()
+        cached = row or (None, None)
+        cache.set(cache_key(user_id), cached, settings.PREFERENCES_CACHE_TTL)
+    pk, currency = cached
+    return UserPreferences(pk=pk, user_id=user_id, currency=currency)
@@ -0,0 +1,14 @@
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import UserPreferences
+from .preferences import cache_key
+
+
+@receiver(post_save, sender=UserPreferences)
+@receiver(post_delete, sender=UserPreferences)
+def forget_cached_preferences(sender, instance, **kwargs):
+    key = cache_key(instance.user_id)
+    transaction.on_commit(lambda: cache.delete(key))
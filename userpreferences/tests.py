@@ -1,3 +1,49 @@
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .currencies import catalog
+from .models import UserPreferences
+
+
+class PreferencesTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('alice', password='secret')
+        self.client.force_login(self.user)
+
+    def preference_queries(self, url_name):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(reverse(url_name))
+        self.assertEqual(response.status_code, 200)
+        return [q for q in captured.captured_queries if 'userpreferences' in q['sql']]
+
+    def test_list_views_work_without_preferences(self):
+        self.assertEqual(len(self.preference_queries('expenses')), 1)
+        self.assertEqual(len(self.preference_queries('income')), 0)
+
+    def test_preferences_are_cached_until_saved(self):
+        UserPreferences.objects.create(user=self.user, currency='EUR - Euro')
+        self.preference_queries('expenses')
+        self.assertEqual(self.preference_queries('income'), [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('preferences'), {'currency': 'JPY - Japanese Yen'})
+        self.assertContains(response, 'Changes saved')
+        response = self.client.get(reverse('income'))
+        self.assertEqual(response.context['currency'], 'JPY - Japanese Yen')
 
-# Create your tests here.
+    def test_currency_catalog_is_loaded_once(self):
+        with mock.patch('userpreferences.currencies.load_catalog',
+                        side_effect=AssertionError('catalog reloaded')):
+            response = self.client.get(reverse('preferences'))
+            self.assertContains(response, 'value="USD - United States Dollar"')
+            response = self.client.post(reverse('preferences'), {'currency': 'Monopoly money'})
+        self.assertContains(response, 'Choose a currency from the list')
+        self.assertFalse(UserPreferences.objects.exists())
+        self.assertIn('EUR - Euro', catalog().labels)
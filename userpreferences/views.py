@@ -1,36 +1,32 @@
 from django.shortcuts import render
-import os
-import json
-from django.conf import settings
+from .currencies import catalog
 from .models import UserPreferences
 from django.contrib import messages
 # Create your views here.
 
 
 def index(request):
-    currency_data = []
-    file_path = os.path.join(settings.BASE_DIR, 'currencies.json')
-
-    with open(file_path, 'r') as json_file:
-        data = json.load(json_file)
-        for k, v in data.items():
-            currency_data.append({'name': k, 'value': v})
-
-    exists = UserPreferences.objects.filter(user=request.user).exists()
-    user_preferences = None
-    if exists:
-        user_preferences = UserPreferences.objects.get(user=request.user)
+    currencies = catalog()
+    user_preferences = request.preferences if request.preferences.pk else None
+    context = {
+        'currencies': currencies.currencies,
+        'catalog_version': currencies.version,
+        'user_preferences': user_preferences,
+    }
     if request.method == 'GET':
 
-        return render(request, 'preferences/index.html', {'currencies': currency_data,
-                                                          'user_preferences': user_preferences})
+        return render(request, 'preferences/index.html', context)
     else:
 
-        currency = request.POST['currency']
-        if exists:
+        currency = request.POST.get('currency', '')
+        if currency not in currencies.labels:
+            messages.error(request, 'Choose a currency from the list')
+            return render(request, 'preferences/index.html', context)
+        if user_preferences:
             user_preferences.currency = currency
-            user_preferences.save()
+            user_preferences.save(update_fields=['currency'])
         else:
-            UserPreferences.objects.create(user=request.user, currency=currency)
+            user_preferences = UserPreferences.objects.create(user=request.user, currency=currency)
+        context['user_preferences'] = user_preferences
         messages.success(request, 'Changes saved')
-        return render(request, 'preferences/index.html', {'currencies': currency_data, 'user_preferences': user_preferences})
\ No newline at end of file
+        return render(request, 'preferences/index.html', context)